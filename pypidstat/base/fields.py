@@ -90,3 +90,53 @@ cpustat_fields = OrderedDict([
     ('guest_nice', '运行一个带nice值的guest占用时间'),
 ])
 
+
+# shm_record_fields 共享内存中每个进程一条记录的字段，value为(struct格式, 说明)。数值字段缺失时写入NaN
+shm_record_fields = OrderedDict([
+    ('timestamp', ('d', '采集时间')),
+    ('age', ('d', '统计的实际时间跨度，即本次与上次采样的间隔（秒）')),
+    ('pid', ('i', '进程PID')),
+    ('user', ('32s', '进程的用户名')),
+    ('comm', ('32s', '进程的命令名')),
+    ('cmdline', ('256s', '进程的命令行，超出部分截断')),
+    ('%usr', ('d', '用户态CPU使用率')),
+    ('%system', ('d', '内核态CPU使用率')),
+    ('%guest', ('d', '虚拟机CPU使用率')),
+    ('%wait', ('d', '等待运行的时间占比')),
+    ('%CPU', ('d', 'CPU使用率')),
+    ('CPU_ID', ('i', '最近运行的CPU编号')),
+    ('%core', ('d', '进程最近运行的CPU核的使用率')),
+    ('%CPU_norm', ('d', 'CPU时间占主机全部CPU时间的比例')),
+    ('minflt/s', ('d', '每秒次缺页数')),
+    ('majflt/s', ('d', '每秒主缺页数')),
+    ('vsize', ('d', '虚拟内存大小（KB）')),
+    ('rss', ('d', '常驻内存大小（KB）')),
+    ('VmPeak(KB)', ('d', '虚拟内存峰值（KB）')),
+    ('%MEM', ('d', '内存使用率')),
+    ('PSS', ('d', '按共享比例分摊的常驻内存（KB）')),
+    ('USS', ('d', '进程独占的常驻内存（KB）')),
+    ('SwapPss', ('d', '按共享比例分摊的换出内存（KB）')),
+    ('Pss_Anon', ('d', 'PSS中的匿名页（KB）')),
+    ('Pss_File', ('d', 'PSS中的文件页（KB）')),
+    ('Pss_Shmem', ('d', 'PSS中的共享内存（KB）')),
+    ('%PSS', ('d', 'PSS占主机内存的比例')),
+    ('kB_rd/s', ('d', '每秒读取的KB数')),
+    ('kB_wr/s', ('d', '每秒写入的KB数')),
+    ('kB_cwr/s', ('d', '每秒取消写入的KB数')),
+    ('iodelay', ('d', '块IO等待的时钟周期数')),
+    ('cswch/s', ('d', '每秒自愿上下文切换次数')),
+    ('nvcswch/s', ('d', '每秒非自愿上下文切换次数')),
+    ('%cpu_delay', ('d', '等待CPU的时间占比')),
+    ('%blkio_delay', ('d', '等待块设备IO的时间占比')),
+    ('%swapin_delay', ('d', '等待换入的时间占比')),
+    ('%freepages_delay', ('d', '等待内存回收的时间占比')),
+    ('send_packet_cnt/s', ('d', '每秒发送的包数')),
+    ('send_packet_bytes/s', ('d', '每秒发送的字节数')),
+    ('recv_packet_cnt/s', ('d', '每秒接收的包数')),
+    ('recv_packet_bytes/s', ('d', '每秒接收的字节数')),
+    ('error%', ('d', '采样估计流量的相对误差')),
+    ('%task_clock', ('d', 'perf task-clock的时间占比')),
+    ('ctx_switches/s', ('d', 'perf统计的每秒上下文切换次数')),
+    ('cpu_migrations/s', ('d', 'perf统计的每秒CPU迁移次数')),
+    ('page_faults/s', ('d', 'perf统计的每秒缺页次数')),
+])
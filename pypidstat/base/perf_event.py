@@ -0,0 +1,243 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: perf_event.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 23:30
+"""
+import ctypes
+import errno
+import os
+import platform
+import resource
+import struct
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# linux/perf_event.h
+PERF_TYPE_SOFTWARE = 1
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+PERF_FORMAT_GROUP = 1 << 3
+PERF_FLAG_FD_CLOEXEC = 1 << 3
+# perf_event_attr中的标记位
+ATTR_FLAG_EXCLUDE_KERNEL = 1 << 5
+ATTR_FLAG_EXCLUDE_HV = 1 << 6
+PERF_ATTR_SIZE = 128
+
+# 为本进程其他用途（抓包、netlink、读取/proc等）保留的fd数
+RESERVED_FDS = 64
+
+# 软件事件，无需硬件PMU，虚拟机中同样可用；第一个事件为组长
+PERF_SW_EVENTS = OrderedDict([
+    ('task_clock', 1),
+    ('context_switches', 3),
+    ('cpu_migrations', 4),
+    ('minor_faults', 5),
+    ('major_faults', 6),
+])
+
+_SYSCALL_NR = {'x86_64': 298, 'aarch64': 241, 'riscv64': 241, 'i386': 336, 'i686': 336, 'armv7l': 364,
+               'ppc64le': 319, 'ppc64': 319, 's390x': 331}
+
+_ATTR = struct.Struct('=IIQQQQQ')
+# read_format为GROUP|TOTAL_TIME_ENABLED|TOTAL_TIME_RUNNING时：nr, time_enabled, time_running, values[nr]
+_READ_HDR = struct.Struct('=QQQ')
+_READ_FORMAT = PERF_FORMAT_GROUP | PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING
+_READ_SIZE = _READ_HDR.size + 8 * len(PERF_SW_EVENTS)
+
+_libc = None
+
+
+def _perf_event_open(config: int, tid: int, group_fd: int, flags: int) -> int:
+    global _libc
+    nr = _SYSCALL_NR.get(platform.machine())
+    if nr is None:
+        raise OSError(errno.ENOSYS, f"perf_event_open is not supported on {platform.machine()}")
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    attr = _ATTR.pack(PERF_TYPE_SOFTWARE, PERF_ATTR_SIZE, config, 0, 0, _READ_FORMAT, flags)
+    buf = ctypes.create_string_buffer(attr + b'\0' * (PERF_ATTR_SIZE - len(attr)), PERF_ATTR_SIZE)
+    fd = _libc.syscall(nr, buf, tid, -1, group_fd, PERF_FLAG_FD_CLOEXEC)
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f"perf_event_open for {tid} failed: {os.strerror(err)}")
+    return fd
+
+
+class PerfEventGroup(object):
+    """
+    一个线程的软件事件组，一次read读取组内所有计数器
+    """
+
+    def __init__(self, tid: int, flags: int = 0):
+        self.tid = tid
+        self._fds: List[int] = []
+        try:
+            for config in PERF_SW_EVENTS.values():
+                group_fd = self._fds[0] if len(self._fds) > 0 else -1
+                self._fds.append(_perf_event_open(config, tid, group_fd, flags))
+        except OSError:
+            self.close()
+            raise
+
+    def read(self) -> Dict[str, int]:
+        data = os.read(self._fds[0], _READ_SIZE)
+        nr, time_enabled, time_running = _READ_HDR.unpack_from(data, 0)
+        values = struct.unpack_from(f'={nr}Q', data, _READ_HDR.size)
+        # 计数器被分时复用时按运行时间比例放大，软件事件一般不会被复用
+        scale = float(time_enabled) / time_running if 0 < time_running < time_enabled else 1.0
+        return {name: int(value * scale) for name, value in zip(PERF_SW_EVENTS.keys(), values)}
+
+    def close(self) -> None:
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+
+class PerfProcessCounters(object):
+    """
+    进程的软件事件计数：每个线程一个事件组，每次读取时同步线程列表，为新线程打开事件组，
+    已退出线程的最终计数累加后关闭。两次读取之间创建并退出的线程不会被统计。
+    max_groups限制打开的事件组数，线程数超出时抛出EMFILE，已打开的事件组由调用方close关闭。
+    """
+
+    def __init__(self, pid: int, flags: int = 0, base_dir: str = '/proc/', max_groups: Optional[int] = None):
+        self.pid = pid
+        self.max_groups = max_groups
+        self._flags = flags
+        self._task_dir = os.path.join(base_dir, str(pid), 'task')
+        self._groups: Dict[int, PerfEventGroup] = {}
+        # 已退出线程的累计值
+        self._exited = {name: 0 for name in PERF_SW_EVENTS.keys()}
+        try:
+            self._sync_threads()
+            if len(self._groups) == 0:
+                raise OSError(errno.ESRCH, f"no thread of process {pid} can be monitored")
+        except Exception:
+            # 打开部分事件组后失败（如EMFILE）时关闭已打开的事件组
+            self.close()
+            raise
+
+    @property
+    def num_groups(self) -> int:
+        return len(self._groups)
+
+    def _sync_threads(self) -> None:
+        tids = {int(tid) for tid in os.listdir(self._task_dir) if tid.isdigit()}
+        for tid in [tid for tid in self._groups.keys() if tid not in tids]:
+            group = self._groups.pop(tid)
+            for name, value in group.read().items():
+                self._exited[name] += value
+            group.close()
+        if self.max_groups is not None and len(tids) > self.max_groups:
+            raise OSError(errno.EMFILE, f"process {self.pid} has {len(tids)} threads, "
+                                        f"exceeds the fd budget of {self.max_groups} perf event groups")
+        for tid in tids:
+            if tid not in self._groups:
+                try:
+                    self._groups[tid] = PerfEventGroup(tid, self._flags)
+                except OSError as e:
+                    # 线程已退出
+                    if e.errno != errno.ESRCH:
+                        raise
+
+    def read(self) -> Dict[str, int]:
+        """
+        返回进程所有线程的累计计数，task_clock单位为纳秒
+        """
+        self._sync_threads()
+        totals = dict(self._exited)
+        for group in self._groups.values():
+            for name, value in group.read().items():
+                totals[name] += value
+        return totals
+
+    def close(self) -> None:
+        for group in self._groups.values():
+            group.close()
+        self._groups.clear()
+
+
+class PerfEventCollector(object):
+    """
+    为观测的进程打开perf_event_open软件事件（task-clock、上下文切换、CPU迁移、缺页），精确统计每个周期的计数。
+    每个线程占用len(PERF_SW_EVENTS)个fd，最多同时观测max_pids个进程，打开的fd总数不超过max_fds，
+    max_fds为None时取RLIMIT_NOFILE的软限制减去RESERVED_FDS。
+    无权限时（perf_event_paranoid）尝试仅统计用户态；perf_event_open不可用时初始化抛出OSError。
+    """
+
+    def __init__(self, max_pids: int = 256, max_fds: Optional[int] = None):
+        self.max_pids = max_pids
+        if max_fds is None:
+            soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+            max_fds = 1 << 20 if soft_limit == resource.RLIM_INFINITY else soft_limit - RESERVED_FDS
+        self.max_fds = max_fds
+        self._flags = 0
+        self._counters: Dict[int, PerfProcessCounters] = {}
+        self.skipped = 0
+        # 以自身进程验证可用性，并确定是否需要排除内核态
+        try:
+            PerfEventGroup(os.getpid(), self._flags).close()
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EPERM):
+                raise
+            self._flags = ATTR_FLAG_EXCLUDE_KERNEL | ATTR_FLAG_EXCLUDE_HV
+            PerfEventGroup(os.getpid(), self._flags).close()
+
+    @property
+    def user_only(self) -> bool:
+        return self._flags & ATTR_FLAG_EXCLUDE_KERNEL != 0
+
+    @property
+    def num_fds(self) -> int:
+        return sum(counters.num_groups for counters in self._counters.values()) * len(PERF_SW_EVENTS)
+
+    def _free_groups(self) -> int:
+        # fd预算内还可以打开的事件组数
+        return max(0, (self.max_fds - self.num_fds) // len(PERF_SW_EVENTS))
+
+    def attach(self, pids: Iterable[int]) -> None:
+        """
+        同步观测的进程：为新进程打开事件，关闭已退出进程的事件
+        """
+        pids = list(pids)
+        alive = set(pids)
+        for pid in [pid for pid in self._counters.keys() if pid not in alive]:
+            self._counters.pop(pid).close()
+        self.skipped = 0
+        for pid in pids:
+            if pid in self._counters:
+                continue
+            max_groups = self._free_groups()
+            if len(self._counters) >= self.max_pids or max_groups == 0:
+                self.skipped += 1
+                continue
+            try:
+                self._counters[pid] = PerfProcessCounters(pid, self._flags, max_groups=max_groups)
+            except OSError as e:
+                # 线程数超出fd预算，其余为进程已退出或无权限
+                if e.errno == errno.EMFILE:
+                    self.skipped += 1
+                continue
+
+    def read(self, pid: int) -> Optional[Dict[str, int]]:
+        counters = self._counters.get(pid)
+        if counters is None:
+            return None
+        # 新线程同样受fd预算限制
+        counters.max_groups = counters.num_groups + self._free_groups()
+        try:
+            return counters.read()
+        except OSError:
+            self._counters.pop(pid).close()
+            return None
+
+    def get_stats(self) -> Dict:
+        return {'pids': len(self._counters), 'fds': self.num_fds, 'skipped': self.skipped, 'user_only': self.user_only}
+
+    def close(self) -> None:
+        for counters in self._counters.values():
+            counters.close()
+        self._counters.clear()
@@ -0,0 +1,203 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from pypidstat.base.proc_sys import ProcSys
+from pypidstat.base.types import BaseModel
+
+
+class ProcAttrCache(BaseModel):
+    """
+    进程生命周期内的静态属性缓存。
+    comm、cmdline、exe、environ、sessionid及进程用户信息在进程存活期间不会变化，
+    以(pid, start_time)作为进程的唯一标识，仅在进程首次出现时读取一次，进程退出后清理。
+    """
+    # 进程存活期间会变化的属性，需要显式开启refresh_volatile才会重新读取
+    volatile_attrs = ('oom_score',)
+
+    def __init__(self, sys_proc: Optional[ProcSys] = None, refresh_volatile: bool = False):
+        self._sys = sys_proc if sys_proc is not None else ProcSys()
+        self.refresh_volatile = refresh_volatile
+        # key为pid，value为(start_time, attrs)
+        self._cache: Dict[int, Tuple[int, Dict]] = {}
+
+    def get_attrs(self, pid: int, start_time: int, refresh_volatile: Optional[bool] = None) -> Dict:
+        """
+        获取进程的属性信息，包含get_proc_pid_attrs和get_proc_user的结果
+        Args:
+            pid: 进程ID
+            start_time: 进程的启动时间（/proc/$pid/stat中的start_time），用于识别PID复用
+            refresh_volatile: 是否重新读取oom_score等易变属性，None则使用初始化时的配置
+
+        Returns:
+            返回进程属性字典的副本
+        """
+        if refresh_volatile is None:
+            refresh_volatile = self.refresh_volatile
+
+        entry = self._cache.get(pid)
+        if entry is None or entry[0] != start_time:
+            attrs = self._sys.get_proc_pid_attrs(pid)
+            attrs.update(self._sys.get_proc_user(pid))
+            self._cache[pid] = (start_time, attrs)
+        else:
+            attrs = entry[1]
+            if refresh_volatile:
+                attrs['oom_score'] = self._sys.get_proc_pid_oom_score(pid)
+
+        return dict(attrs)
+
+    def evict(self, alive_pids: Iterable[int]) -> int:
+        """
+        清理已经退出的进程的缓存项
+        Args:
+            alive_pids: 当前存活的进程PID
+
+        Returns:
+            返回清理的缓存项数量
+        """
+        alive_pids = set(alive_pids)
+        exited_pids = [pid for pid in self._cache.keys() if pid not in alive_pids]
+        for pid in exited_pids:
+            del self._cache[pid]
+        return len(exited_pids)
+
+    def put(self, pid: int, start_time: int, attrs: Dict) -> None:
+        # 直接设置进程的属性，用于已无法读取全部属性的进程（如已退出尚未回收）
+        self._cache[pid] = (start_time, dict(attrs))
+
+    def discard(self, pid: int) -> None:
+        self._cache.pop(pid, None)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._cache
+
+
+class SmapsRollupCache(BaseModel):
+    """
+    /proc/$pid/smaps_rollup的缓存。读取smaps_rollup时内核需要遍历进程的全部页表，对大内存进程代价较高，
+    每个进程在refresh秒内只读取一次，期间返回上一次的结果。以(pid, start_time)识别PID复用，进程退出后清理。
+    """
+
+    def __init__(self, sys_proc: Optional[ProcSys] = None, refresh: float = 10.0):
+        self._sys = sys_proc if sys_proc is not None else ProcSys()
+        self.refresh = refresh
+        # key为pid，value为(start_time, 读取时间, rollup)
+        self._cache: Dict[int, Tuple[int, float, Dict]] = {}
+        self.reads = 0
+        self.hits = 0
+
+    def get(self, pid: int, start_time: int, now: Optional[float] = None) -> Dict:
+        """
+        获取进程的smaps_rollup汇总，见ProcSys.get_proc_pid_smaps_rollup
+        Args:
+            pid: 进程ID
+            start_time: 进程的启动时间（/proc/$pid/stat中的start_time），用于识别PID复用
+            now: 当前时间，默认为time.time()
+
+        Returns:
+            返回smaps_rollup解析字典的副本，读取时间为key 'timestamp'
+        """
+        if now is None:
+            now = time.time()
+        entry = self._cache.get(pid)
+        if entry is None or entry[0] != start_time or now - entry[1] >= self.refresh:
+            rollup = self._sys.get_proc_pid_smaps_rollup(pid)
+            entry = (start_time, now, rollup)
+            self._cache[pid] = entry
+            self.reads += 1
+        else:
+            self.hits += 1
+        return dict(entry[2], timestamp=entry[1])
+
+    def evict(self, alive_pids: Iterable[int]) -> int:
+        # 清理已经退出的进程的缓存项，返回清理的数量
+        alive_pids = set(alive_pids)
+        exited_pids = [pid for pid in self._cache.keys() if pid not in alive_pids]
+        for pid in exited_pids:
+            del self._cache[pid]
+        return len(exited_pids)
+
+    def discard(self, pid: int) -> None:
+        self._cache.pop(pid, None)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._cache
+
+
+class NetNsCache(BaseModel):
+    """
+    按网络命名空间读取观测进程的TCP连接表。容器中的进程位于独立的网络命名空间，/proc/net/tcp中没有其连接，
+    需要读取/proc/$pid/net/tcp。观测的进程按/proc/$pid/ns/net的inode分组，每个命名空间只通过一个代表进程读取一次。
+    进程所在的命名空间每次直接读取链接：readlink的代价低于校验缓存所需的读取/proc/$pid/stat，且PID复用时不会得到过期的结果。
+    socket的inode在所有命名空间中唯一，各命名空间的连接表可以合并为一份以inode为key的连接表；
+    不同命名空间中可以存在相同的四元组，按四元组合并时以(命名空间, conn_key)为key。
+    无权限读取命名空间的进程（如非root时的其他用户进程）使用本进程所在命名空间的连接表。
+    """
+
+    def __init__(self, sys_proc: Optional[ProcSys] = None):
+        self._sys = sys_proc if sys_proc is not None else ProcSys()
+        try:
+            self.own_netns: Optional[int] = self._sys.get_proc_pid_netns('self')
+        except (OSError, ValueError):
+            self.own_netns = None
+        self.stats = {'namespaces': 0, 'table_reads': 0}
+
+    def get_netns(self, pid: int) -> Optional[int]:
+        # 返回进程所在网络命名空间的inode，无法读取时为None
+        try:
+            return self._sys.get_proc_pid_netns(pid)
+        except (OSError, ValueError):
+            return None
+
+    def group(self, pids: Iterable[int]) -> Dict[Optional[int], List[int]]:
+        """
+        将进程按网络命名空间分组
+        Returns:
+            key为网络命名空间的inode，与本进程相同或无法读取时为None，value为该命名空间中的进程
+        """
+        groups: Dict[Optional[int], List[int]] = {}
+        for pid in pids:
+            netns = self.get_netns(pid)
+            groups.setdefault(netns if netns != self.own_netns else None, []).append(pid)
+        return groups
+
+    def get_tcp_tables(self, pids: Iterable[int]) -> List[Dict[str, Dict]]:
+        """
+        读取观测进程所在的各网络命名空间的TCP连接表，每个命名空间读取一次，连接信息中增加netns字段
+        Returns:
+            返回各命名空间的连接表，见ProcSys.get_proc_net_tcp
+        """
+        tables = []
+        groups = self.group(pids)
+        self.stats['namespaces'] = len(groups)
+        for netns, members in groups.items():
+            # 本进程所在的命名空间读取/proc/net/tcp；代表进程在读取前退出时，由同一命名空间的其他进程读取
+            candidates = [None] if netns is None else members
+            for pid in candidates:
+                try:
+                    table = self._sys.get_proc_net_tcp(pid)
+                except OSError:
+                    continue
+                self.stats['table_reads'] += 1
+                for conn in table.values():
+                    conn['netns'] = netns if netns is not None else self.own_netns
+                tables.append(table)
+                break
+        return tables
+
+    def get_tcp_inodes(self, pids: Iterable[int]) -> Dict[int, Dict]:
+        # 合并各命名空间的连接表，key为socket的inode
+        return {conn['inode']: conn for table in self.get_tcp_tables(pids) for conn in table.values()}
+
+    def get_tcp_conns(self, pids: Iterable[int]) -> Dict[Tuple[int, str], Dict]:
+        # 合并各命名空间的连接表，key为(命名空间的inode, connect_key)，不同命名空间中相同的connect_key各自保留
+        return {(conn['netns'], conn_key): conn
+                for table in self.get_tcp_tables(pids) for conn_key, conn in table.items()}
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
@@ -2,12 +2,18 @@ import glob
 import os
 import functools
 import re
-from pypidstat.base.fields import pid_stat_fields, pid_statm_fields, pid_schedstat_fields
+from pypidstat.base.fields import pid_stat_fields, pid_statm_fields, pid_schedstat_fields, cpustat_fields
 from pypidstat import TCPConnectStatus
-from pypidstat.utils import get_all_users, page_to_kb, parse_kv_txt, get_ip_port_by_addr, get_clk_tick
-from typing import AnyStr, Dict, List, Union
+from pypidstat.utils import get_uid_user_map, page_to_kb, parse_kv_txt, get_ip_port_by_addr, get_clk_tick
+from typing import AnyStr, Dict, List, Optional, Set, Tuple, Union
 from pypidstat.base.types import BaseModel
 
+# 进程fd的采集层级：count仅统计数量；classify读取链接并分类，不探测fdinfo和文件类型；
+# full读取全部信息，并可基于上一周期的fd表只处理新增的fd
+FD_MODE_COUNT = 'count'
+FD_MODE_CLASSIFY = 'classify'
+FD_MODE_FULL = 'full'
+
 
 class ProcSys(BaseModel):
     def __init__(self, base_dir: str = "/proc/"):
@@ -84,14 +90,14 @@ class ProcSys(BaseModel):
             login_uid = "0"
 
         # 根据用户的login_uid补充进程用户信息
-        match_users = [user for user in get_all_users() if str(user['uid']) == login_uid]
+        match_user = get_uid_user_map().get(int(login_uid)) if login_uid.isdigit() else None
         proc_user_dict = {}
-        if len(match_users) == 0:
+        if match_user is None:
             proc_user_dict['uid'] = login_uid
             proc_user_dict['gid'], proc_user_dict['owner'] = None, None
         else:
             proc_user_dict['uid'] = login_uid
-            proc_user_dict['gid'], proc_user_dict['owner'] = match_users[0]['gid'], match_users[0]['name']
+            proc_user_dict['gid'], proc_user_dict['owner'] = match_user['gid'], match_user['name']
         return proc_user_dict
 
     def get_proc_pid_attrs(self, pid: int) -> Dict:
@@ -109,10 +115,21 @@ class ProcSys(BaseModel):
             'exe': os.readlink(os.path.join(self.base_proc_dir, str(pid), 'exe')),
             'environ': self._read_file(os.path.join(self.base_proc_dir, str(pid), 'environ')),
             'sessionid': self._read_file(os.path.join(self.base_proc_dir, str(pid), 'sessionid')),
-            'oom_score': self._read_file(os.path.join(self.base_proc_dir, str(pid), 'oom_score')),
+            'oom_score': self.get_proc_pid_oom_score(pid),
         }
         return attrs
 
+    def get_proc_pid_oom_score(self, pid: int) -> AnyStr:
+        """
+        读取/proc/$pid/oom_score，获取进程当前的OOM评值。该值随进程内存变化，不适合长期缓存
+        Args:
+            pid: 进程ID
+
+        Returns:
+            返回进程的OOM评值
+        """
+        return self._read_file(os.path.join(self.base_proc_dir, str(pid), 'oom_score'))
+
     def get_proc_pid_statm(self, pid: int) -> Dict:
         """
         读取/proc/$pid/statm，获取进程的statm信息，并解析为字典。
@@ -165,6 +182,82 @@ class ProcSys(BaseModel):
 
         return result_dict
 
+    def get_proc_pid_delays(self, pid: int, stat_info: Dict, schedstat_info: Dict) -> Dict:
+        """
+        返回进程的各类延迟累计值（纳秒）。/proc中仅能由schedstat得到CPU等待时间、由stat得到块设备IO等待时间，
+        换页延迟无法获取，返回None
+        Args:
+            pid: 进程的PID
+            stat_info: 已读取的get_proc_pid_stat结果
+            schedstat_info: 已读取的get_proc_pid_schedstat结果
+
+        Returns:
+            返回cpu_delay_total、blkio_delay_total、swapin_delay_total、freepages_delay_total
+        """
+        clk_tick = get_clk_tick()
+        return {'cpu_delay_total': float(schedstat_info['wait_time']) / clk_tick * 1e9,
+                'blkio_delay_total': float(stat_info['blkio_ticks']) / clk_tick * 1e9,
+                'swapin_delay_total': None, 'freepages_delay_total': None}
+
+    def get_proc_pid_cpu_times(self, pid: int, stat_info: Dict) -> Dict:
+        """
+        返回进程的用户态和内核态CPU时间（jiffies），/proc中即为stat的utime和stime
+        Args:
+            pid: 进程的PID
+            stat_info: 已读取的get_proc_pid_stat结果
+        """
+        return {'utime': stat_info['utime'], 'stime': stat_info['stime']}
+
+    def get_proc_pid_ctxt_switches(self, pid: int, status_info: Optional[Dict] = None) -> Dict:
+        """
+        返回进程的主动和被动上下文切换次数，/proc中取自status
+        Args:
+            pid: 进程的PID
+            status_info: 已读取的get_proc_pid_status结果，为None时读取
+
+        Returns:
+            返回voluntary_ctxt_switches、nonvoluntary_ctxt_switches
+        """
+        if status_info is None:
+            status_info = self.get_proc_pid_status(pid)
+        return {'voluntary_ctxt_switches': status_info['voluntary_ctxt_switches'],
+                'nonvoluntary_ctxt_switches': status_info['nonvoluntary_ctxt_switches']}
+
+    def prefetch(self, pids: List[int]) -> None:
+        # 批量预取进程信息，/proc按需读取，无需预取
+        pass
+
+    def get_proc_pid_smaps_rollup(self, pid: int) -> Dict[str, int]:
+        """
+        读取/proc/$pid/smaps_rollup，获取进程所有内存映射的汇总，单位为KB。
+        内核4.14以下没有smaps_rollup，回退到逐个累加/proc/$pid/smaps中各映射的值（较慢）。
+        读取时内核需要遍历进程的页表，代价与进程的内存大小相关，不宜每个周期读取。
+        内容示例：
+            558577a2c000-7ffd11e49000 ---p 00000000 00:00 0     [rollup]
+            Rss:                1416 kB
+            Pss:                 429 kB
+            Pss_Anon:            100 kB
+            Private_Dirty:       100 kB
+        Returns:
+            返回Rss、Pss、Pss_Anon、Pss_File、Pss_Shmem、Private_Clean、Private_Dirty、Swap、SwapPss等字段，
+            低版本内核缺少Pss_Anon等字段
+        """
+        pid_dir = os.path.join(self.base_proc_dir, str(pid))
+        try:
+            txt = self._read_file(os.path.join(pid_dir, 'smaps_rollup'))
+        except FileNotFoundError:
+            # 进程不存在时smaps同样无法读取，抛出异常
+            txt = self._read_file(os.path.join(pid_dir, 'smaps'))
+
+        rollup: Dict[str, int] = {}
+        for line in txt.splitlines():
+            # 映射的地址行和VmFlags等没有kB单位的行跳过
+            if not line.endswith(' kB'):
+                continue
+            key, value = line.split(':', 1)
+            rollup[key] = rollup.get(key, 0) + int(value[:-3])
+        return rollup
+
     def get_proc_pid_status(self, pid: int) -> Dict:
         """
         读取/proc/$pid/status，获取进程的status信息，并解析为字典
@@ -182,49 +275,132 @@ class ProcSys(BaseModel):
 
         return status_dict
 
-    def get_proc_pid_fds(self, pid: int) -> Dict:
+    def get_proc_pid_fd_count(self, pid: int) -> int:
+        """
+        根据进程PID返回打开的文件数量。内核6.2及以上/proc/$pid/fd目录的大小即为fd数量，
+        低版本内核则通过一次scandir统计，不读取任何链接
+        Args:
+            pid: 进程PID
+
+        Returns:
+            返回进程打开的fd数量
+        """
+        fd_dir = os.path.join(self.base_proc_dir, str(pid), 'fd')
+        fd_count = os.stat(fd_dir).st_size
+        if fd_count > 0:
+            return fd_count
+        with os.scandir(fd_dir) as it:
+            return sum(1 for _ in it)
+
+    @staticmethod
+    def _classify_fd_link(link: str, probe: bool = True) -> Tuple[str, Optional[int]]:
+        """
+        根据fd的链接判断文件类型，probe为False时不对路径进行isfile探测
+        Returns:
+            返回(type, inode)，非socket时inode为None
+        """
+        if link.startswith('socket:'):
+            return 'socket', int(link[8:-1])
+        elif link.startswith('/') and (not probe or os.path.isfile(link)):
+            return 'regular', None
+        elif link.startswith('anon_inode'):
+            return 'anon_inode', None
+        else:
+            return 'other', None
+
+    def get_proc_pid_fds(self, pid: int, mode: str = FD_MODE_FULL, prev_fds: Optional[Dict] = None) -> Dict:
         """
         根据进程PID返回打开的文件列表
         Args:
             pid: 进程PID
+            mode: 采集层级，FD_MODE_CLASSIFY仅读取链接并分类（不含ctime），FD_MODE_FULL读取全部信息
+            prev_fds: FD_MODE_FULL时上一周期同一进程的fd表，fd号及其指向文件的(st_dev, st_ino)均相同时直接复用，
+                仅处理新增的或fd号被关闭后重新分配给其他文件的fd
 
         Returns:
             返回进程相关的打开文件字典，KEY为fd，Value为文件的描述信息
         """
-        fds = os.listdir(os.path.join(self.base_proc_dir, str(pid), 'fd'))
+        fd_dir = os.path.join(self.base_proc_dir, str(pid), 'fd')
+        is_full = mode == FD_MODE_FULL
         pid_fds_info = {}
-        for f in fds:
-            try:
-                link = os.readlink(os.path.join(self.base_proc_dir, str(pid), 'fd', f))
-            except Exception:
-                continue
-            else:
-                ctime = os.stat(os.path.join(self.base_proc_dir, str(pid), 'fdinfo', f)).st_ctime
-                pid_fd_info = {
-                    'fd': f, "pid": pid, "ctime": ctime, 'file': link,
-                }
-
-                if link.startswith('/') and os.path.isfile(link):
-                    pid_fd_info['type'] = 'regular'
-                elif link.startswith('socket:'):
-                    pid_fd_info['type'] = 'socket'
-                    inode = int(link[8:-1])
+        with os.scandir(fd_dir) as it:
+            for entry in it:
+                f = entry.name
+                file_id = None
+                if is_full:
+                    # fd指向的文件的标识，fd号可能被关闭后重新分配，仅凭fd号复用会得到旧的链接
+                    try:
+                        st = entry.stat()
+                        file_id = (st.st_dev, st.st_ino)
+                    except Exception:
+                        continue
+                    if prev_fds is not None and f in prev_fds and prev_fds[f].get('file_id') == file_id:
+                        pid_fds_info[f] = prev_fds[f]
+                        continue
+
+                try:
+                    link = os.readlink(entry.path)
+                except Exception:
+                    continue
+
+                pid_fd_info = {'fd': f, "pid": pid, 'file': link}
+                if is_full:
+                    pid_fd_info['file_id'] = file_id
+                    try:
+                        pid_fd_info['ctime'] = os.stat(os.path.join(self.base_proc_dir, str(pid), 'fdinfo', f)).st_ctime
+                    except Exception:
+                        continue
+
+                pid_fd_info['type'], inode = self._classify_fd_link(link, probe=is_full)
+                if inode is not None:
                     pid_fd_info['inode'] = inode
-                elif link.startswith('anon_inode'):
-                    pid_fd_info['type'] = 'anon_inode'
-                else:
-                    pid_fd_info['type'] = 'other'
 
                 pid_fds_info[f] = pid_fd_info
         return pid_fds_info
 
-    def get_proc_net_tcp(self) -> Dict[str, Dict]:
+    def get_proc_pid_socket_inodes(self, pid: int) -> Set[int]:
+        """
+        根据进程PID返回打开的socket的inode集合，仅读取fd链接
+        Args:
+            pid: 进程PID
+
+        Returns:
+            返回进程socket的inode集合
+        """
+        inodes = set()
+        with os.scandir(os.path.join(self.base_proc_dir, str(pid), 'fd')) as it:
+            for entry in it:
+                try:
+                    link = os.readlink(entry.path)
+                except Exception:
+                    continue
+                if link.startswith('socket:['):
+                    inodes.add(int(link[8:-1]))
+        return inodes
+
+    def get_proc_pid_netns(self, pid: Union[int, str]) -> int:
+        """
+        根据进程PID返回所在网络命名空间的inode，/proc/$pid/ns/net的链接形如net:[4026531840]
+        Args:
+            pid: 进程PID，self为本进程
+
+        Returns:
+            返回网络命名空间的inode
+        """
+        link = os.readlink(os.path.join(self.base_proc_dir, str(pid), 'ns', 'net'))
+        return int(link[link.index('[') + 1:-1])
+
+    def get_proc_net_tcp(self, pid: Optional[int] = None) -> Dict[str, Dict]:
         """
-        读取/proc/net/tcp，获取主机中所有的网络连接信息，
+        读取/proc/net/tcp，获取主机中所有的网络连接信息；指定pid时读取/proc/$pid/net/tcp，即该进程所在网络命名空间的连接
+        Args:
+            pid: 网络命名空间中任一进程的PID，None为本进程所在的命名空间
+
         Returns:
             返回进程的列表
         """
-        file_path = os.path.join(self.base_proc_dir, 'net/tcp')
+        file_path = os.path.join(self.base_proc_dir, 'net/tcp') if pid is None else \
+            os.path.join(self.base_proc_dir, str(pid), 'net/tcp')
         txt = self._read_file(file_path)
         global_tcp_connection = {}
         for line in txt.splitlines()[1:]:
@@ -309,10 +485,12 @@ class ProcSys(BaseModel):
 
         cpustat_dict = {}
 
-        # 处理CPU的记录
-        cpustat_fields = pid_stat_fields.keys()
+        # 处理CPU的记录，除cpu_name外均转换为jiffies整数
+        cpu_fields = list(cpustat_fields.keys())
         for cpu_txt in [line for line in lines if str(line).startswith('cpu')]:
-            cpu_dict = {k: v for k, v in zip(cpustat_fields, cpu_txt.split())}
+            items = cpu_txt.split()
+            cpu_dict = {'cpu_name': items[0]}
+            cpu_dict.update({k: int(v) for k, v in zip(cpu_fields[1:], items[1:])})
             cpustat_dict[cpu_dict['cpu_name']] = cpu_dict
 
         # 处理关注项的值
@@ -320,7 +498,7 @@ class ProcSys(BaseModel):
         key_lines = [line for line in lines for key in keys if str(line).startswith(key)]
         key_line_text = '\n'.join(key_lines)
         key_value_dict = parse_kv_txt(key_line_text, None)
-        cpustat_dict.update(key_value_dict)
+        cpustat_dict.update({k: int(v) for k, v in key_value_dict.items()})
 
         return cpustat_dict
 
@@ -351,26 +529,34 @@ class ProcSys(BaseModel):
                     match_pids.append(pid)
         return match_pids
 
-    def get_proc_pid_net_connections(self, pid: int) -> Dict[str, Dict]:
+    def get_proc_pid_net_connections(self, pid: int, inode_conns: Optional[Dict[int, Dict]] = None,
+                                     statuses: Tuple[str, ...] = ('ESTABLISHED',)) -> Dict[str, Dict]:
         """
         根据进程PID，获取进程相关的网络连接
         Args:
             pid: 进程PID
+            inode_conns: 以inode为key的/proc/net/tcp连接表，多个进程可共享同一份，未指定则重新读取
+            statuses: 需要返回的连接状态
 
         Returns:
             返回进程的网络连接的字典列表。key为connect_key
         """
-        global_tcp_conns = {conn['inode']: conn for conn in self.get_proc_net_tcp().values()}
-        pid_tcp_fds = self.get_proc_pid_fds(pid)
-
-        inode_map_dict = {fd_info['inode']: fd_info for fd_info in pid_tcp_fds.values()
-                          if 'inode' in fd_info and fd_info['type'] == 'socket'}
+        if inode_conns is None:
+            inode_conns = self.get_proc_net_tcp_inodes()
 
         pid_tcp_connections = {}
-        for inode in inode_map_dict.keys():
-            if inode in global_tcp_conns:
-                if global_tcp_conns[inode]['status'] == "ESTABLISHED":
-                    conn_key = global_tcp_conns[inode]['connect_key']
-                    pid_tcp_connections[conn_key] = global_tcp_conns[inode]
+        for inode in self.get_proc_pid_socket_inodes(pid):
+            if inode in inode_conns:
+                if inode_conns[inode]['status'] in statuses:
+                    conn_key = inode_conns[inode]['connect_key']
+                    pid_tcp_connections[conn_key] = inode_conns[inode]
 
         return pid_tcp_connections
+
+    def get_proc_net_tcp_inodes(self, pid: Optional[int] = None) -> Dict[int, Dict]:
+        """
+        读取/proc/net/tcp，返回以socket inode为key的连接表，pid见get_proc_net_tcp
+        Returns:
+            返回连接字典，key为inode，value为连接信息
+        """
+        return {conn['inode']: conn for conn in self.get_proc_net_tcp(pid).values()}
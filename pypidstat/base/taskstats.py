@@ -0,0 +1,255 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: taskstats.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 21:00
+"""
+import errno
+import os
+import socket
+import struct
+from typing import Dict, Iterable, List, Optional
+
+from pypidstat.base.proc_sys import ProcSys
+from pypidstat.utils import get_clk_tick
+
+# linux/netlink.h、linux/genetlink.h、linux/taskstats.h
+NETLINK_GENERIC = 16
+NLM_F_REQUEST = 0x01
+NLMSG_ERROR = 2
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+TASKSTATS_GENL_NAME = b'TASKSTATS'
+TASKSTATS_CMD_GET = 1
+TASKSTATS_CMD_ATTR_TGID = 2
+TASKSTATS_TYPE_STATS = 3
+TASKSTATS_TYPE_AGGR_TGID = 5
+
+_NLMSG_HDR = struct.Struct('=IHHII')
+_GENL_HDR = struct.Struct('=BBH')
+_NLA_HDR = struct.Struct('=HH')
+
+# struct taskstats（版本8及以上的公共部分），各字段按内核中的对齐方式排列
+_TASKSTATS = struct.Struct('=H2xIBB6x' + 'Q' * 8 + '32s' + 'B3x4x' + 'IIIII4x' + 'Q' * 23)
+_TASKSTATS_FIELDS = [
+    'version', 'ac_exitcode', 'ac_flag', 'ac_nice',
+    'cpu_count', 'cpu_delay_total', 'blkio_count', 'blkio_delay_total', 'swapin_count', 'swapin_delay_total',
+    'cpu_run_real_total', 'cpu_run_virtual_total',
+    'ac_comm', 'ac_sched', 'ac_uid', 'ac_gid', 'ac_pid', 'ac_ppid', 'ac_btime',
+    'ac_etime', 'ac_utime', 'ac_stime', 'ac_minflt', 'ac_majflt', 'coremem', 'virtmem', 'hiwater_rss',
+    'hiwater_vm', 'read_char', 'write_char', 'read_syscalls', 'write_syscalls', 'read_bytes', 'write_bytes',
+    'cancelled_write_bytes', 'nvcsw', 'nivcsw', 'ac_utimescaled', 'ac_stimescaled', 'cpu_scaled_run_real_total',
+    'freepages_count', 'freepages_delay_total',
+]
+
+# 每批发送的请求数，避免应答超出socket接收缓冲区
+_BATCH_SIZE = 64
+
+
+def _nla(attr_type: int, payload: bytes) -> bytes:
+    attr = _NLA_HDR.pack(_NLA_HDR.size + len(payload), attr_type) + payload
+    return attr + b'\0' * ((4 - len(attr) % 4) % 4)
+
+
+def _parse_nlas(data: bytes, offset: int, end: int) -> Dict[int, bytes]:
+    attrs = {}
+    while offset + _NLA_HDR.size <= end:
+        attr_len, attr_type = _NLA_HDR.unpack_from(data, offset)
+        if attr_len < _NLA_HDR.size:
+            break
+        # 去掉NLA_F_NESTED等标记位
+        attrs[attr_type & 0x3fff] = data[offset + _NLA_HDR.size:offset + attr_len]
+        offset += (attr_len + 3) & ~3
+    return attrs
+
+
+def _decode_taskstats(payload: bytes) -> Dict:
+    # 低版本内核的结构体较短，缺少的字段补0
+    if len(payload) < _TASKSTATS.size:
+        payload = payload + b'\0' * (_TASKSTATS.size - len(payload))
+    stats = dict(zip(_TASKSTATS_FIELDS, _TASKSTATS.unpack_from(payload, 0)))
+    stats['ac_comm'] = stats['ac_comm'].split(b'\0', 1)[0].decode('utf-8', errors='replace')
+    return stats
+
+
+class TaskStatsClient(object):
+    """
+    通过genetlink的TASKSTATS接口按线程组查询进程的统计，复用同一个netlink socket，批量发送请求后统一接收应答。
+    按线程组查询时内核只汇总CPU时间、上下文切换次数和各类延迟，缺页、IO、内存等字段为0。
+    """
+
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._seq = 0
+        try:
+            self.family_id = self._resolve_family()
+        except OSError:
+            self._sock.close()
+            raise
+
+    def _send(self, msg_type: int, cmd: int, attrs: bytes) -> int:
+        self._seq += 1
+        payload = _GENL_HDR.pack(cmd, 1, 0) + attrs
+        self._sock.send(_NLMSG_HDR.pack(_NLMSG_HDR.size + len(payload), msg_type, NLM_F_REQUEST, self._seq, 0)
+                        + payload)
+        return self._seq
+
+    def _messages(self):
+        # 逐条返回一次recv中的netlink消息(type, seq, data, body, end)
+        data = self._sock.recv(1 << 16)
+        offset = 0
+        while offset + _NLMSG_HDR.size <= len(data):
+            msg_len, msg_type, _, seq, _ = _NLMSG_HDR.unpack_from(data, offset)
+            if msg_len < _NLMSG_HDR.size:
+                break
+            yield msg_type, seq, data, offset + _NLMSG_HDR.size, offset + msg_len
+            offset += (msg_len + 3) & ~3
+
+    def _resolve_family(self) -> int:
+        self._send(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, _nla(CTRL_ATTR_FAMILY_NAME, TASKSTATS_GENL_NAME + b'\0'))
+        for msg_type, _, data, body, end in self._messages():
+            if msg_type == NLMSG_ERROR:
+                err = -struct.unpack_from('=i', data, body)[0]
+                raise OSError(err, f"taskstats genetlink family is not available: {os.strerror(err)}")
+            attrs = _parse_nlas(data, body + _GENL_HDR.size, end)
+            if CTRL_ATTR_FAMILY_ID in attrs:
+                return struct.unpack('=H', attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+        raise OSError(errno.ENOENT, "taskstats genetlink family is not available")
+
+    def get_tgids(self, tgids: Iterable[int]) -> Dict[int, Dict]:
+        """
+        批量查询多个进程的统计
+        Returns:
+            key为进程PID，value为struct taskstats解析后的字典；已退出的进程不在结果中
+        Raises:
+            OSError: 无权限等查询失败的情况（进程不存在除外）
+        """
+        result: Dict[int, Dict] = {}
+        tgids = list(tgids)
+        for i in range(0, len(tgids), _BATCH_SIZE):
+            pending: Dict[int, int] = {}
+            for tgid in tgids[i:i + _BATCH_SIZE]:
+                seq = self._send(self.family_id, TASKSTATS_CMD_GET, _nla(TASKSTATS_CMD_ATTR_TGID,
+                                                                         struct.pack('=I', tgid)))
+                pending[seq] = tgid
+            while len(pending) > 0:
+                for msg_type, seq, data, body, end in self._messages():
+                    tgid = pending.pop(seq, None)
+                    if tgid is None:
+                        continue
+                    if msg_type == NLMSG_ERROR:
+                        err = -struct.unpack_from('=i', data, body)[0]
+                        if err == errno.ESRCH:
+                            continue
+                        raise OSError(err, f"taskstats query for {tgid} failed: {os.strerror(err)}")
+                    aggr = _parse_nlas(data, body + _GENL_HDR.size, end).get(TASKSTATS_TYPE_AGGR_TGID)
+                    if aggr is None:
+                        continue
+                    stats = _parse_nlas(aggr, 0, len(aggr)).get(TASKSTATS_TYPE_STATS)
+                    if stats is not None:
+                        result[tgid] = _decode_taskstats(stats)
+        return result
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+def _is_delayacct_enabled() -> bool:
+    # 5.14及以上内核的延迟统计默认关闭，由kernel.task_delayacct开启；更低版本内核默认开启
+    try:
+        with open('/proc/sys/kernel/task_delayacct', 'r') as f:
+            return f.read().strip() != '0'
+    except OSError:
+        return True
+
+
+class TaskStatsProcSys(ProcSys):
+    """
+    使用taskstats获取进程的调度和延迟信息：schedstat和延迟统计不再读取/proc；
+    CPU时间（ac_utime、ac_stime，微秒精度）和上下文切换次数（nvcsw、nivcsw）也取自taskstats，
+    不需要status中的其他信息时不再读取/proc/pid/status。其余信息仍读取/proc。
+    每个周期先调用prefetch批量查询所有进程，未预取的进程单独查询。
+    查询因权限等原因失败后，或内核未开启延迟统计时，回退到/proc。
+    """
+
+    def __init__(self, base_dir: str = "/proc/"):
+        super().__init__(base_dir)
+        self._client = TaskStatsClient()
+        self.delayacct = _is_delayacct_enabled()
+        self.available = True
+        self._cache: Dict[int, Dict] = {}
+
+    def prefetch(self, pids: List[int]) -> None:
+        self._cache.clear()
+        if not self.available:
+            return
+        try:
+            self._cache = self._client.get_tgids(pids)
+        except OSError:
+            self.available = False
+
+    def get_proc_pid_taskstats(self, pid: int) -> Optional[Dict]:
+        if not self.available:
+            return None
+        stats = self._cache.get(pid)
+        if stats is None:
+            try:
+                stats = self._client.get_tgids([pid]).get(pid)
+            except OSError:
+                self.available = False
+                return None
+            if stats is None:
+                raise ProcessLookupError(errno.ESRCH, f"process {pid} does not exist")
+        return stats
+
+    def get_proc_pid_schedstat(self, pid: int) -> Dict:
+        stats = self.get_proc_pid_taskstats(pid) if self.delayacct else None
+        if stats is None:
+            return super().get_proc_pid_schedstat(pid)
+        # 与/proc/pid/schedstat的字段一致，wait_time转换为jiffies
+        return {'cpu_time': stats['cpu_run_real_total'],
+                'wait_time': (float(stats['cpu_delay_total']) / 1e9) * get_clk_tick(),
+                'slice_time': stats['cpu_count']}
+
+    def get_proc_pid_delays(self, pid: int, stat_info: Dict, schedstat_info: Dict) -> Dict:
+        stats = self.get_proc_pid_taskstats(pid) if self.delayacct else None
+        if stats is None:
+            return super().get_proc_pid_delays(pid, stat_info, schedstat_info)
+        return {'cpu_delay_total': stats['cpu_delay_total'], 'blkio_delay_total': stats['blkio_delay_total'],
+                'swapin_delay_total': stats['swapin_delay_total'],
+                'freepages_delay_total': stats['freepages_delay_total']}
+
+    def get_proc_pid_cpu_times(self, pid: int, stat_info: Dict) -> Dict:
+        stats = self.get_proc_pid_taskstats(pid)
+        # 部分内核按tgid查询时不填写ac_utime和ac_stime，此时使用/proc的值
+        if stats is None or stats['ac_utime'] + stats['ac_stime'] == 0:
+            return super().get_proc_pid_cpu_times(pid, stat_info)
+        # 微秒转换为jiffies，与/proc/pid/stat的单位一致
+        clk_tick = get_clk_tick()
+        return {'utime': stats['ac_utime'] * clk_tick / 1e6, 'stime': stats['ac_stime'] * clk_tick / 1e6}
+
+    def get_proc_pid_ctxt_switches(self, pid: int, status_info: Optional[Dict] = None) -> Dict:
+        stats = self.get_proc_pid_taskstats(pid)
+        if stats is None:
+            return super().get_proc_pid_ctxt_switches(pid, status_info)
+        # taskstats为所有线程之和，/proc/pid/status仅为主线程
+        return {'voluntary_ctxt_switches': stats['nvcsw'], 'nonvoluntary_ctxt_switches': stats['nivcsw']}
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_proc_sys(taskstats: bool = False) -> ProcSys:
+    """
+    创建进程信息的读取方式，taskstats不可用（如内核未编译、无权限）时回退到/proc
+    """
+    if taskstats:
+        try:
+            return TaskStatsProcSys()
+        except OSError:
+            pass
+    return ProcSys()
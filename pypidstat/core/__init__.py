@@ -1,2 +1,9 @@
-
-from .process_stat import ProcessStat, ProcSys, BaseModel
+from .process_stat import ProcessStat, ProcSys, BaseModel, ProcAttrCache, SmapsRollupCache
+from .system_stat import SystemSnapshot, SystemCpuStat
+from .shm import ShmPublisher, ShmReader
+from .history import HistoryStore
+from .scheduler import AdaptiveScheduler, BudgetScheduler
+from .proc_events import ProcEventMonitor
+from .predicate import Predicate
+from .export import ParquetSink
+from .wait_sampler import WaitStateSampler
@@ -0,0 +1,172 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: export.py
+@Author: thirsd@sina.com
+@Date: 2026/10/20 14:00
+"""
+import os
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from pypidstat.base.fields import shm_record_fields
+from pypidstat.base.types import BaseModel
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow为可选依赖，未安装时无法导出Parquet
+    pa = pc = pq = None
+
+# 默认导出的列，与共享内存记录的字段一致
+EXPORT_COLUMNS = list(shm_record_fields.keys())
+
+
+class _Column(object):
+    """
+    一列的缓冲区：数值列使用array连续存储，写入时零拷贝构造Arrow数组；缺失的数值记为NaN或-1，写入时转换为null
+    """
+    __slots__ = ('name', 'kind', 'values')
+
+    def __init__(self, name: str):
+        self.name = name
+        fmt = shm_record_fields[name][0] if name in shm_record_fields else 'd'
+        if name == 'timestamp':
+            self.kind = 'timestamp'
+        elif fmt.endswith('s'):
+            self.kind = 'string'
+        elif fmt in ('i', 'I'):
+            self.kind = 'int'
+        else:
+            self.kind = 'double'
+        self.values = None
+        self.reset()
+
+    def reset(self) -> None:
+        if self.kind == 'string':
+            self.values = []
+        elif self.kind == 'int':
+            self.values = array('i')
+        elif self.kind == 'timestamp':
+            self.values = array('q')
+        else:
+            self.values = array('d')
+
+    def append(self, value) -> None:
+        if self.kind == 'string':
+            self.values.append(str(value) if value is not None else None)
+        elif self.kind == 'int':
+            self.values.append(int(value) if value is not None else -1)
+        elif self.kind == 'timestamp':
+            # 微秒精度，保存为UTC时间
+            self.values.append(int(value * 1e6))
+        else:
+            self.values.append(float(value) if value is not None else float('nan'))
+
+    @property
+    def arrow_type(self):
+        return {'string': pa.string(), 'int': pa.int32(), 'timestamp': pa.timestamp('us', tz='UTC'),
+                'double': pa.float64()}[self.kind]
+
+    def to_arrow(self):
+        if self.kind == 'string':
+            return pa.array(self.values, type=pa.string())
+        arr = pa.Array.from_buffers(self.arrow_type, len(self.values), [None, pa.py_buffer(self.values)])
+        if self.kind == 'int':
+            return pc.if_else(pc.equal(arr, -1), None, arr)
+        if self.kind == 'double':
+            return pc.if_else(pc.is_nan(arr), None, arr)
+        return arr
+
+
+class ParquetSink(BaseModel):
+    """
+    将每个周期采集的进程统计按列写入Parquet文件，保留原始精度，用于离线分析。
+    每列使用连续的缓冲区，每累积row_group_size行构造一个Arrow RecordBatch并写为一个row group，
+    内存占用与row_group_size成正比，与总行数无关。每个文件写满rotate_rows行后切换到新文件，
+    文件名为{prefix}-{创建时间}-{序号}.parquet，写入期间使用.inprogress后缀，关闭后才可被读取。
+    依赖pyarrow，未安装时初始化抛出异常。
+    """
+
+    def __init__(self, prefix: str, columns: Optional[List[str]] = None, row_group_size: int = 65536,
+                 rotate_rows: int = 10000000, compression: str = 'zstd'):
+        if pa is None:
+            raise Exception("pyarrow is required for parquet export, install it with: pip install pyarrow")
+        if row_group_size <= 0 or rotate_rows <= 0:
+            raise Exception("row_group_size and rotate_rows must be positive")
+        self.prefix = prefix
+        self.row_group_size = row_group_size
+        # 文件的行数为row_group_size的整数倍
+        self.rotate_rows = max(rotate_rows, row_group_size)
+        self.compression = compression
+        self._columns = [_Column(name) for name in (columns if columns is not None else EXPORT_COLUMNS)]
+        self.schema = pa.schema([pa.field(column.name, column.arrow_type) for column in self._columns])
+        self._pending = 0
+
+        self._writer = None
+        self._path: Optional[str] = None
+        self._file_rows = 0
+        self._file_seq = 0
+        # 已完成的文件
+        self.files: List[str] = []
+        self.stats = {'rows': 0, 'row_groups': 0, 'files': 0}
+
+    def append(self, row: Dict) -> None:
+        """
+        追加一行，字段名与collect_row的结果一致，缺失的字段写入null
+        """
+        for column in self._columns:
+            column.append(row.get(column.name))
+        self._pending += 1
+        if self._pending >= self.row_group_size:
+            self.flush()
+
+    def extend(self, rows: Iterable[Dict]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def _open(self) -> None:
+        self._file_seq += 1
+        self._path = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{self._file_seq:04d}.parquet"
+        self._writer = pq.ParquetWriter(self._path + '.inprogress', self.schema, compression=self.compression)
+        self._file_rows = 0
+
+    def _close_file(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.rename(self._path + '.inprogress', self._path)
+        self.files.append(self._path)
+        self.stats['files'] += 1
+        self._writer = None
+
+    def flush(self) -> None:
+        """
+        将缓冲的行写为一个row group，文件行数达到rotate_rows时切换文件
+        """
+        if self._pending == 0:
+            return
+        batch = pa.RecordBatch.from_arrays([column.to_arrow() for column in self._columns], schema=self.schema)
+        if self._writer is None:
+            self._open()
+        self._writer.write_table(pa.Table.from_batches([batch]), row_group_size=self.row_group_size)
+        self._file_rows += self._pending
+        self.stats['rows'] += self._pending
+        self.stats['row_groups'] += 1
+        # 已写入文件后重新分配缓冲区，Arrow数组引用的旧缓冲区不再修改
+        for column in self._columns:
+            column.reset()
+        self._pending = 0
+        if self._file_rows >= self.rotate_rows:
+            self._close_file()
+
+    def close(self) -> None:
+        self.flush()
+        self._close_file()
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, pending=self._pending)
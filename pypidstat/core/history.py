@@ -0,0 +1,293 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: history.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 19:00
+"""
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pypidstat.base.types import BaseModel
+
+TIER_RAW = 'raw'
+TIER_MINUTE = '1m'
+TIER_HOUR = '1h'
+
+# 默认保存历史的指标
+DEFAULT_HISTORY_METRICS = ['%CPU', '%MEM', 'rss', 'kB_rd/s', 'kB_wr/s', 'cswch/s', 'send_packet_bytes/s',
+                           'recv_packet_bytes/s']
+
+_NAN = math.nan
+
+
+def _p95(values: List[float]) -> float:
+    # nearest-rank法计算95分位数
+    if len(values) == 0:
+        return _NAN
+    values.sort()
+    return values[max(0, math.ceil(len(values) * 0.95) - 1)]
+
+
+class _Ring(object):
+    """
+    每个进程槽位一段定长的环形区域，所有数据预先分配在array('d')中
+    """
+
+    def __init__(self, max_slots: int, size: int, metrics: List[str], rollup: bool):
+        self.size = size
+        self.ts = array('d', [_NAN]) * (max_slots * size)
+        self.pos = array('l', [0]) * max_slots
+        self.filled = array('l', [0]) * max_slots
+        # 原始数据每个指标一个值；汇总数据每个指标为min、avg、max、p95
+        fields = ('min', 'avg', 'max', 'p95') if rollup else ('value',)
+        self.fields = fields
+        self.values: Dict[str, Dict[str, array]] = {
+            metric: {field: array('d', [_NAN]) * (max_slots * size) for field in fields} for metric in metrics}
+
+    def append(self, slot: int, ts: float) -> int:
+        # 写入一个位置的时间戳，返回该位置在数组中的下标
+        idx = slot * self.size + self.pos[slot]
+        self.ts[idx] = ts
+        self.pos[slot] = (self.pos[slot] + 1) % self.size
+        self.filled[slot] = min(self.filled[slot] + 1, self.size)
+        return idx
+
+    def reset(self, slot: int) -> None:
+        self.pos[slot] = 0
+        self.filled[slot] = 0
+
+    def indexes(self, slot: int) -> Iterable[int]:
+        # 按时间顺序返回已写入位置的下标
+        base, pos, filled = slot * self.size, self.pos[slot], self.filled[slot]
+        start = (pos - filled) % self.size
+        return (base + (start + i) % self.size for i in range(filled))
+
+
+class _Bucket(object):
+    """
+    每个进程槽位正在汇总的一个时间段，每个指标记录min、max、加权的sum和权重，并保留最多cap个值用于计算p95
+    """
+
+    def __init__(self, max_slots: int, cap: int, metrics: List[str]):
+        self.cap = cap
+        self.start = array('d', [_NAN]) * max_slots
+        self.min = {metric: array('d', [_NAN]) * max_slots for metric in metrics}
+        self.max = {metric: array('d', [_NAN]) * max_slots for metric in metrics}
+        self.sum = {metric: array('d', [0.0]) * max_slots for metric in metrics}
+        self.weight = {metric: array('l', [0]) * max_slots for metric in metrics}
+        self.cnt = {metric: array('l', [0]) * max_slots for metric in metrics}
+        self.buf = {metric: array('d', [_NAN]) * (max_slots * cap) for metric in metrics}
+
+    def reset(self, slot: int, start: float) -> None:
+        self.start[slot] = start
+        for metric in self.min.keys():
+            self.min[metric][slot] = _NAN
+            self.max[metric][slot] = _NAN
+            self.sum[metric][slot] = 0.0
+            self.weight[metric][slot] = 0
+            self.cnt[metric][slot] = 0
+
+    def is_empty(self, slot: int) -> bool:
+        return all(cnt[slot] == 0 for cnt in self.cnt.values())
+
+    def add(self, slot: int, metric: str, value: float, weight: int = 1, v_min: float = None, v_max: float = None,
+            v_p95: float = None) -> None:
+        """
+        加入一个值。汇总上一级的结果时，value为上一级的平均值，weight为其采样数，并传入上一级的min、max、p95
+        """
+        if math.isnan(value):
+            return
+        v_min = value if v_min is None else v_min
+        v_max = value if v_max is None else v_max
+        curr_min, curr_max = self.min[metric][slot], self.max[metric][slot]
+        self.min[metric][slot] = v_min if math.isnan(curr_min) or v_min < curr_min else curr_min
+        self.max[metric][slot] = v_max if math.isnan(curr_max) or v_max > curr_max else curr_max
+        self.sum[metric][slot] += value * weight
+        self.weight[metric][slot] += weight
+        # 超过cap个值后循环覆盖，p95由最近的cap个值计算
+        cnt = self.cnt[metric][slot]
+        self.buf[metric][slot * self.cap + cnt % self.cap] = value if v_p95 is None else v_p95
+        self.cnt[metric][slot] = cnt + 1
+
+    def rollup(self, slot: int, metric: str) -> Tuple[float, float, float, float, int]:
+        """
+        返回(min, avg, max, p95, 权重)
+        """
+        weight = self.weight[metric][slot]
+        if weight == 0:
+            return _NAN, _NAN, _NAN, _NAN, 0
+        base = slot * self.cap
+        values = list(self.buf[metric][base:base + min(self.cnt[metric][slot], self.cap)])
+        return self.min[metric][slot], self.sum[metric][slot] / weight, self.max[metric][slot], _p95(values), weight
+
+
+class HistoryStore(BaseModel):
+    """
+    进程指标的多级历史：最近raw_size个原始采样，以及按分钟、按小时汇总的min/avg/max/p95。
+    所有数据保存在预先分配的数组中，最多max_pids个进程，槽位用尽时淘汰最久未更新的进程，内存占用固定。
+    小时汇总的p95由各分钟的p95近似计算。查询只返回已经结束的分钟和小时。
+    """
+
+    def __init__(self, metrics: Optional[List[str]] = None, max_pids: int = 256, raw_size: int = 120,
+                 minute_size: int = 180, hour_size: int = 72, bucket_cap: int = 128):
+        self.metrics = list(metrics) if metrics is not None else list(DEFAULT_HISTORY_METRICS)
+        self.max_pids = max_pids
+        self._slots: Dict[int, int] = {}
+        self._free_slots = list(range(max_pids - 1, -1, -1))
+        self._last_ts = array('d', [_NAN]) * max_pids
+
+        self._tiers = {
+            TIER_RAW: _Ring(max_pids, raw_size, self.metrics, rollup=False),
+            TIER_MINUTE: _Ring(max_pids, minute_size, self.metrics, rollup=True),
+            TIER_HOUR: _Ring(max_pids, hour_size, self.metrics, rollup=True),
+        }
+        # 正在汇总的分钟和小时，分钟的计数为采样数，小时的计数为采样数之和
+        self._minute_bucket = _Bucket(max_pids, bucket_cap, self.metrics)
+        self._hour_bucket = _Bucket(max_pids, 60, self.metrics)
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        # 预先分配的数组占用的内存，不随运行时间增长
+        def _arrays(obj):
+            if isinstance(obj, array):
+                yield obj
+            elif isinstance(obj, (list, dict)):
+                for value in (obj.values() if isinstance(obj, dict) else obj):
+                    yield from _arrays(value)
+            elif isinstance(obj, (_Ring, _Bucket)):
+                yield from _arrays(obj.__dict__)
+
+        return sum(a.itemsize * len(a) for a in _arrays(
+            [self._last_ts, self._minute_bucket, self._hour_bucket] + list(self._tiers.values())))
+
+    def _get_slot(self, pid: int, ts: float) -> int:
+        slot = self._slots.get(pid)
+        if slot is not None:
+            return slot
+        if len(self._free_slots) == 0:
+            # 淘汰最久未更新的进程
+            oldest_pid = min(self._slots.keys(), key=lambda p: self._last_ts[self._slots[p]])
+            self.discard(oldest_pid)
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._slots[pid] = slot
+        for ring in self._tiers.values():
+            ring.reset(slot)
+        self._minute_bucket.reset(slot, math.floor(ts / 60) * 60)
+        self._hour_bucket.reset(slot, math.floor(ts / 3600) * 3600)
+        return slot
+
+    def discard(self, pid: int) -> None:
+        # 进程退出后释放槽位
+        slot = self._slots.pop(pid, None)
+        if slot is not None:
+            self._free_slots.append(slot)
+
+    def pids(self) -> List[int]:
+        return list(self._slots.keys())
+
+    def add(self, pid: int, timestamp: float, row: Dict) -> None:
+        """
+        写入进程的一次采样
+        Args:
+            pid: 进程PID
+            timestamp: 采样时间（秒）
+            row: 以指标名为key的采样值，缺失的指标记为NaN
+        """
+        slot = self._get_slot(pid, timestamp)
+        self._last_ts[slot] = timestamp
+
+        minute_start = math.floor(timestamp / 60) * 60
+        if minute_start != self._minute_bucket.start[slot]:
+            self._flush_minute(slot)
+            self._minute_bucket.reset(slot, minute_start)
+
+        raw = self._tiers[TIER_RAW]
+        idx = raw.append(slot, timestamp)
+        bucket = self._minute_bucket
+        for metric in self.metrics:
+            value = row.get(metric)
+            value = float(value) if value is not None else _NAN
+            raw.values[metric]['value'][idx] = value
+            bucket.add(slot, metric, value)
+
+    def add_rows(self, rows: Iterable[Dict], timestamp: Optional[float] = None) -> None:
+        # 写入一个周期内多个进程的采样，row中需要包含pid，时间默认取row中的timestamp
+        for row in rows:
+            self.add(row['pid'], timestamp if timestamp is not None else row['timestamp'], row)
+
+    def _flush_minute(self, slot: int) -> None:
+        bucket = self._minute_bucket
+        if bucket.is_empty(slot):
+            return
+        minute_start = bucket.start[slot]
+        hour_start = math.floor(minute_start / 3600) * 3600
+        if hour_start != self._hour_bucket.start[slot]:
+            self._flush_hour(slot)
+            self._hour_bucket.reset(slot, hour_start)
+
+        minute_ring = self._tiers[TIER_MINUTE]
+        idx = minute_ring.append(slot, minute_start)
+        for metric in self.metrics:
+            v_min, v_avg, v_max, v_p95, weight = bucket.rollup(slot, metric)
+            self._write_rollup(minute_ring, metric, idx, v_min, v_avg, v_max, v_p95)
+            # 小时汇总以分钟的采样数为权重计算平均值
+            self._hour_bucket.add(slot, metric, v_avg, weight=weight, v_min=v_min, v_max=v_max, v_p95=v_p95)
+
+    def _flush_hour(self, slot: int) -> None:
+        bucket = self._hour_bucket
+        if bucket.is_empty(slot):
+            return
+        hour_ring = self._tiers[TIER_HOUR]
+        idx = hour_ring.append(slot, bucket.start[slot])
+        for metric in self.metrics:
+            v_min, v_avg, v_max, v_p95, _ = bucket.rollup(slot, metric)
+            self._write_rollup(hour_ring, metric, idx, v_min, v_avg, v_max, v_p95)
+
+    @staticmethod
+    def _write_rollup(ring: _Ring, metric: str, idx: int, v_min: float, v_avg: float, v_max: float,
+                      v_p95: float) -> None:
+        fields = ring.values[metric]
+        fields['min'][idx], fields['avg'][idx], fields['max'][idx], fields['p95'][idx] = v_min, v_avg, v_max, v_p95
+
+    def query(self, pid: int, metric: str, start: Optional[float] = None, end: Optional[float] = None,
+              resolution: str = 'auto') -> List[Tuple]:
+        """
+        查询进程某个指标在时间范围内的历史
+        Args:
+            pid: 进程PID
+            metric: 指标名
+            start: 开始时间（秒），None表示不限制
+            end: 结束时间（秒），None表示不限制
+            resolution: raw、1m、1h，或auto（选择能覆盖开始时间的最精细的一级）
+
+        Returns:
+            raw返回[(时间, 值)]，1m和1h返回[(时间段开始时间, min, avg, max, p95)]，按时间排序
+        """
+        if metric not in self.metrics:
+            raise Exception(f"metric {metric} is not recorded in history")
+        slot = self._slots.get(pid)
+        if slot is None:
+            return []
+        if resolution == 'auto':
+            resolution = TIER_HOUR
+            for tier in (TIER_RAW, TIER_MINUTE):
+                ring = self._tiers[tier]
+                indexes = list(ring.indexes(slot))
+                if len(indexes) > 0 and (start is None and ring.filled[slot] < ring.size
+                                         or start is not None and ring.ts[indexes[0]] <= start):
+                    resolution = tier
+                    break
+        ring = self._tiers[resolution]
+
+        result = []
+        for idx in ring.indexes(slot):
+            ts = ring.ts[idx]
+            if start is not None and ts < start or end is not None and ts > end:
+                continue
+            result.append((ts,) + tuple(ring.values[metric][field][idx] for field in ring.fields))
+        return result
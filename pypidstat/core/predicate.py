@@ -0,0 +1,450 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: predicate.py
+@Author: thirsd@sina.com
+@Date: 2026/10/20 10:30
+"""
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pypidstat.base.fields import shm_record_fields
+from pypidstat.base.proc_sys import ProcSys
+from pypidstat.base.proc_cache import ProcAttrCache
+from pypidstat.base.types import BaseModel
+
+# 数据源按读取代价从低到高排列，row为计算负载后的输出行（速率、百分比等，需要两次采集）。
+# status为单个文件，属性需要读取cmdline、exe、loginuid等多个文件，status先于属性
+STAGES = ('stat', 'status', 'attrs', 'io', 'fd', 'row')
+
+# 读取/proc时即可过滤的字段，key为表达式中的字段名，value为(数据源, 数据源中的key, 单位)。
+# 单位为kb的字段，1G等带单位的值按KB换算，其余字段按字节换算
+PREDICATE_FIELDS = {
+    'pid': ('stat', 'pid', None),
+    'ppid': ('stat', 'ppid', None),
+    'comm': ('stat', 'tcomm', None),
+    'state': ('stat', 'state', None),
+    'nice': ('stat', 'nice', None),
+    'priority': ('stat', 'priority', None),
+    'threads': ('stat', 'num_threads', None),
+    'cpu': ('stat', 'task_cpu', None),
+    'rss': ('stat', 'rss', 'kb'),
+    'vsize': ('stat', 'vsize', 'kb'),
+    'vsz': ('stat', 'vsize', 'kb'),
+    'utime': ('stat', 'utime', None),
+    'stime': ('stat', 'stime', None),
+    'start_time': ('stat', 'start_time', None),
+    'minflt': ('stat', 'min_flt', None),
+    'majflt': ('stat', 'maj_flt', None),
+    'user': ('attrs', 'owner', None),
+    'uid': ('attrs', 'uid', None),
+    'cmdline': ('attrs', 'cmdline', None),
+    'exe': ('attrs', 'exe', None),
+    'swap': ('status', 'VmSwap', 'kb'),
+    'hwm': ('status', 'VmHWM', 'kb'),
+    'rss_anon': ('status', 'RssAnon', 'kb'),
+    'rss_file': ('status', 'RssFile', 'kb'),
+    'rss_shmem': ('status', 'RssShmem', 'kb'),
+    'vm_data': ('status', 'VmData', 'kb'),
+    'cswch': ('status', 'voluntary_ctxt_switches', None),
+    'nvcswch': ('status', 'nonvoluntary_ctxt_switches', None),
+    'rchar': ('io', 'rchar', None),
+    'wchar': ('io', 'wchar', None),
+    'syscr': ('io', 'syscr', None),
+    'syscw': ('io', 'syscw', None),
+    'read_bytes': ('io', 'read_bytes', None),
+    'write_bytes': ('io', 'write_bytes', None),
+    'fds': ('fd', 'fds', None),
+}
+# 输出行中的字段：共享内存记录的字段，以及仅在终端输出的字段
+ROW_FIELDS = set(shm_record_fields.keys()) | {'threads_num'}
+# 输出行中以KB为单位的字段
+_ROW_KB_FIELDS = {'vsize', 'rss', 'VmPeak(KB)', 'PSS', 'USS', 'SwapPss', 'Pss_Anon', 'Pss_File', 'Pss_Shmem',
+                  'kB_rd/s', 'kB_wr/s', 'kB_cwr/s'}
+
+_TOKEN = re.compile(r"""\s*(?:(?P<str>'[^']*'|"[^"]*")|(?P<op>>=|<=|!=|==|!~|=|<|>|~)|(?P<punct>[(),])"""
+                    r"""|(?P<word>[\w%/.:*+?^$|\[\]{}\\\-]+(?:\(KB\))?))""")
+_KEYWORDS = ('and', 'or', 'not', 'in')
+_SIZE = re.compile(r'^(\d+(?:\.\d+)?)([kmgt])b?$', re.IGNORECASE)
+_SIZE_UNITS = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+
+def _to_number(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_literal(text: str, unit: Optional[str]) -> Tuple[str, Optional[float]]:
+    # 返回(原始文本, 数值)，非数值时数值为None；1G等大小按字段的单位换算
+    match = _SIZE.match(text)
+    if match is not None:
+        size = float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()]
+        return text, size / 1024 if unit == 'kb' else size
+    return text, _to_number(text)
+
+
+def _equals(value, literal: Tuple[str, Optional[float]]) -> bool:
+    number = literal[1]
+    if number is not None:
+        value_number = _to_number(value)
+        if value_number is not None:
+            return value_number == number
+    return str(value) == literal[0]
+
+
+class _Compare(object):
+    def __init__(self, field: str, op: str, literals: List[Tuple[str, Optional[float]]]):
+        self.field = field
+        self.op = op
+        self.literals = literals
+        self.pattern = re.compile(literals[0][0]) if op in ('~', '!~') else None
+
+    def fields(self) -> List[str]:
+        return [self.field]
+
+    def evaluate(self, lookup: Callable[[str], object]) -> Optional[bool]:
+        value = lookup(self.field)
+        if value is None:
+            return None
+        op = self.op
+        if op in ('~', '!~'):
+            return (self.pattern.search(str(value)) is not None) == (op == '~')
+        if op in ('in', 'not in'):
+            return any(_equals(value, literal) for literal in self.literals) == (op == 'in')
+        if op in ('=', '==', '!='):
+            return _equals(value, self.literals[0]) == (op != '!=')
+        value_number, number = _to_number(value), self.literals[0][1]
+        if value_number is None or number is None:
+            return None
+        if op == '>':
+            return value_number > number
+        if op == '>=':
+            return value_number >= number
+        if op == '<':
+            return value_number < number
+        return value_number <= number
+
+
+class _Not(object):
+    def __init__(self, child):
+        self.child = child
+
+    def fields(self) -> List[str]:
+        return self.child.fields()
+
+    def evaluate(self, lookup: Callable[[str], object]) -> Optional[bool]:
+        result = self.child.evaluate(lookup)
+        return None if result is None else not result
+
+
+class _And(object):
+    def __init__(self, children: List):
+        self.children = children
+
+    def fields(self) -> List[str]:
+        return [field for child in self.children for field in child.fields()]
+
+    def evaluate(self, lookup: Callable[[str], object]) -> Optional[bool]:
+        # 任一为假即为假，否则存在未知即为未知
+        unknown = False
+        for child in self.children:
+            result = child.evaluate(lookup)
+            if result is False:
+                return False
+            unknown = unknown or result is None
+        return None if unknown else True
+
+
+class _Or(_And):
+    def evaluate(self, lookup: Callable[[str], object]) -> Optional[bool]:
+        # 任一为真即为真，否则存在未知即为未知
+        unknown = False
+        for child in self.children:
+            result = child.evaluate(lookup)
+            if result is True:
+                return True
+            unknown = unknown or result is None
+        return None if unknown else False
+
+
+class _Parser(object):
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens: List[Tuple[str, str, int]] = []
+        pos = 0
+        while pos < len(expr):
+            match = _TOKEN.match(expr, pos)
+            if match is None or match.end() == pos:
+                if expr[pos:].strip() == '':
+                    break
+                raise Exception(f"invalid predicate '{expr}': unexpected character at {pos}")
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == 'str':
+                text = text[1:-1]
+            self.tokens.append((kind, text, match.start(kind)))
+            pos = match.end()
+        self.index = 0
+
+    def _error(self, message: str):
+        pos = self.tokens[self.index][2] if self.index < len(self.tokens) else len(self.expr)
+        raise Exception(f"invalid predicate '{self.expr}': {message} at {pos}")
+
+    def _peek(self) -> Optional[Tuple[str, str, int]]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _is_keyword(self, keyword: str, offset: int = 0) -> bool:
+        index = self.index + offset
+        return index < len(self.tokens) and self.tokens[index][0] == 'word' and \
+            self.tokens[index][1].lower() == keyword
+
+    def _is_punct(self, punct: str) -> bool:
+        token = self._peek()
+        return token is not None and token[0] == 'punct' and token[1] == punct
+
+    def _expect_punct(self, punct: str) -> None:
+        if not self._is_punct(punct):
+            self._error(f"expected '{punct}'")
+        self.index += 1
+
+    def parse(self):
+        if len(self.tokens) == 0:
+            self._error("empty expression")
+        node = self._parse_or()
+        if self.index < len(self.tokens):
+            self._error(f"unexpected '{self.tokens[self.index][1]}'")
+        return node
+
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._is_keyword('or'):
+            self.index += 1
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else _Or(children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._is_keyword('and'):
+            self.index += 1
+            children.append(self._parse_not())
+        return children[0] if len(children) == 1 else _And(children)
+
+    def _parse_not(self):
+        if self._is_keyword('not'):
+            self.index += 1
+            return _Not(self._parse_not())
+        return self._parse_atom()
+
+    def _parse_value(self) -> str:
+        token = self._peek()
+        if token is None or token[0] not in ('word', 'str'):
+            self._error("expected a value")
+        self.index += 1
+        return token[1]
+
+    def _parse_atom(self):
+        if self._is_punct('('):
+            self.index += 1
+            node = self._parse_or()
+            self._expect_punct(')')
+            return node
+
+        token = self._peek()
+        if token is None or token[0] != 'word' or token[1].lower() in _KEYWORDS:
+            self._error("expected a field")
+        field = token[1]
+        if field in PREDICATE_FIELDS:
+            unit = PREDICATE_FIELDS[field][2]
+        elif field in ROW_FIELDS:
+            unit = 'kb' if field in _ROW_KB_FIELDS else None
+        else:
+            self._error(f"unknown field '{field}'")
+        self.index += 1
+
+        if self._is_keyword('in') or (self._is_keyword('not') and self._is_keyword('in', 1)):
+            op = 'in' if self._is_keyword('in') else 'not in'
+            self.index += len(op.split())
+            self._expect_punct('(')
+            literals = [_parse_literal(self._parse_value(), unit)]
+            while self._is_punct(','):
+                self.index += 1
+                literals.append(_parse_literal(self._parse_value(), unit))
+            self._expect_punct(')')
+            return _Compare(field, op, literals)
+
+        token = self._peek()
+        if token is None or token[0] != 'op':
+            self._error("expected an operator")
+        self.index += 1
+        literal = _parse_literal(self._parse_value(), unit)
+        if token[1] in ('>', '>=', '<', '<=') and literal[1] is None:
+            self._error(f"'{token[1]}' requires a number")
+        if token[1] in ('~', '!~'):
+            try:
+                re.compile(literal[0])
+            except re.error as e:
+                self._error(f"invalid regex ({e})")
+        return _Compare(field, token[1], [literal])
+
+
+def _field_stage(field: str) -> str:
+    spec = PREDICATE_FIELDS.get(field)
+    return spec[0] if spec is not None else 'row'
+
+
+class Predicate(BaseModel):
+    """
+    进程的过滤表达式，例如：user=postgres and state in (R,D) and rss>1G and %CPU>5。
+    支持and、or、not、括号，比较符=、!=、>、>=、<、<=、~（正则匹配）、!~、in (...)、not in (...)，
+    数值可以带K、M、G、T单位。字段见PREDICATE_FIELDS及输出行的字段（如%CPU、kB_rd/s）。
+
+    表达式编译一次，按字段所在的数据源由低到高的代价分阶段求值（stat、status、属性、io、fd，最后为输出行）：
+    每读取一个数据源求值一次，尚未读取的字段为未知，采用三值逻辑，结果为假即丢弃该进程，不再读取后续的数据源。
+    只有依赖输出行的字段（速率、百分比）时才需要完整采集后再由accept判断；读取失败或值缺失的字段同样为未知，
+    最终结果为未知的进程不输出。
+    """
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        self._root = _Parser(expr).parse()
+        fields = set(self._root.fields())
+        # 表达式涉及的数据源，按读取代价排列
+        self.stages: List[str] = [stage for stage in STAGES if any(_field_stage(field) == stage for field in fields)]
+        self.needs_row = 'row' in self.stages
+        self.stats = {'checked': 0, 'passed': 0, 'deferred': 0}
+        # filter_pids保留的通过进程已读取的数据源，key为pid，由ProcessStat.init复用
+        self._sources: Dict[int, Dict[str, Dict]] = {}
+        for stage in self.stages:
+            if stage != 'row':
+                self.stats[f'{stage}_reads'] = 0
+                self.stats[f'{stage}_dropped'] = 0
+
+    def evaluate(self, lookup: Callable[[str], object]) -> Optional[bool]:
+        """
+        按lookup返回的字段值求值，值为None的字段为未知
+        Returns:
+            返回True、False，或无法确定时返回None
+        """
+        return self._root.evaluate(lookup)
+
+    @staticmethod
+    def _load(stage: str, pid: int, proc_sys: ProcSys, attr_cache: Optional[ProcAttrCache],
+              sources: Dict[str, Dict]) -> Dict:
+        if stage == 'stat':
+            return proc_sys.get_proc_pid_stat(pid)
+        if stage == 'attrs':
+            if attr_cache is not None:
+                if 'stat' not in sources:
+                    sources['stat'] = proc_sys.get_proc_pid_stat(pid)
+                return attr_cache.get_attrs(pid, int(sources['stat']['start_time']))
+            attrs = proc_sys.get_proc_pid_attrs(pid)
+            attrs.update(proc_sys.get_proc_user(pid))
+            return attrs
+        if stage == 'status':
+            return proc_sys.get_proc_pid_status(pid)
+        if stage == 'io':
+            return proc_sys.get_proc_pid_io(pid)
+        return {'fds': proc_sys.get_proc_pid_fd_count(pid)}
+
+    def prefilter(self, pid: int, proc_sys: Optional[ProcSys] = None, attr_cache: Optional[ProcAttrCache] = None,
+                  record_stats: bool = True, sources: Optional[Dict[str, Dict]] = None) -> Optional[bool]:
+        """
+        按数据源的代价依次读取并求值，结果确定后不再读取后续的数据源
+        Args:
+            sources: 传入时保存已读取的数据源，key为数据源，读取失败的数据源不保存
+        Returns:
+            返回True、False，或需要输出行才能确定时返回None；进程已退出时返回False
+        """
+        proc_sys = proc_sys if proc_sys is not None else ProcSys()
+        sources = sources if sources is not None else {}
+
+        def lookup(field: str):
+            # 无权限读取的数据源不在sources中，其字段为未知
+            spec = PREDICATE_FIELDS.get(field)
+            if spec is None or spec[0] not in sources:
+                return None
+            return sources[spec[0]].get(spec[1])
+
+        result = None
+        for stage in self.stages:
+            if stage == 'row':
+                break
+            try:
+                sources[stage] = self._load(stage, pid, proc_sys, attr_cache, sources)
+            except OSError:
+                if stage == 'stat':
+                    return False
+            if record_stats:
+                self.stats[f'{stage}_reads'] += 1
+            result = self._root.evaluate(lookup)
+            if result is not None:
+                if result is False and record_stats:
+                    self.stats[f'{stage}_dropped'] += 1
+                return result
+        return result
+
+    def filter_pids(self, pids: Iterable[int], proc_sys: Optional[ProcSys] = None,
+                    attr_cache: Optional[ProcAttrCache] = None, record_stats: bool = True,
+                    keep_sources: bool = False, deadline: Optional[float] = None) -> List[int]:
+        """
+        返回可能满足表达式的进程：读取/proc即可确定满足的进程，以及需要输出行才能确定的进程。
+        keep_sources为True时保留通过的进程已读取的数据源，替换上一次保留的数据源，由pop_sources取出。
+        设置deadline（time.monotonic()）时超过后不再求值，剩余的进程同样视为可能满足，由accept在采集后判断
+        """
+        proc_sys = proc_sys if proc_sys is not None else ProcSys()
+        pids = list(pids)
+        result = []
+        deferred = []
+        kept_sources: Dict[int, Dict[str, Dict]] = {}
+        for index, pid in enumerate(pids):
+            if deadline is not None and time.monotonic() >= deadline:
+                deferred = pids[index:]
+                break
+            sources: Dict[str, Dict] = {}
+            matched = self.prefilter(pid, proc_sys, attr_cache, record_stats=record_stats, sources=sources)
+            if matched is True or (matched is None and self.needs_row):
+                result.append(pid)
+                kept_sources[pid] = sources
+        if keep_sources:
+            self._sources = kept_sources
+        if record_stats:
+            self.stats['checked'] += len(pids) - len(deferred)
+            self.stats['passed'] += len(result)
+            self.stats['deferred'] += len(deferred)
+        return result + deferred
+
+    def pop_sources(self, pid: int) -> Optional[Dict[str, Dict]]:
+        """
+        取出filter_pids保留的进程的数据源，只能取出一次，见ProcessStat.init
+        """
+        return self._sources.pop(pid, None)
+
+    def match(self, ps_stat=None, row: Optional[Dict] = None) -> Optional[bool]:
+        """
+        对已采集的进程求值，字段取自ProcessStat读取的数据源，输出行的字段取自row。
+        未提供ps_stat时（如查看共享内存中的记录）字段均取自row
+        """
+        def lookup(field: str):
+            spec = PREDICATE_FIELDS.get(field)
+            if spec is not None and ps_stat is not None:
+                if spec[0] == 'fd':
+                    return ps_stat.fd_count
+                source = {'stat': ps_stat.stat_info, 'attrs': ps_stat.attrs, 'status': ps_stat.status_info,
+                          'io': ps_stat.io_info}[spec[0]]
+                return source.get(spec[1]) if source is not None else None
+            return row.get(field) if row is not None else None
+
+        return self._root.evaluate(lookup)
+
+    def accept(self, ps_stat=None, row: Optional[Dict] = None) -> bool:
+        # 三值逻辑中仅结果为真时输出
+        return self.match(ps_stat, row) is True
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
@@ -0,0 +1,255 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: proc_events.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 22:00
+"""
+import errno
+import os
+import re
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from queue import Queue, Empty, Full
+from typing import Dict, List, Optional
+
+from pypidstat.base.proc_sys import ProcSys, FD_MODE_COUNT
+from pypidstat.base.proc_cache import ProcAttrCache
+from pypidstat.core.process_stat import ProcessStat
+
+# linux/netlink.h、linux/connector.h、linux/cn_proc.h
+NETLINK_CONNECTOR = 11
+NLMSG_DONE = 3
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+_NLMSG_HDR = struct.Struct('=IHHII')
+# struct cn_msg: idx, val, seq, ack, len, flags
+_CN_MSG = struct.Struct('=IIIIHH')
+# struct proc_event: what, cpu, timestamp_ns
+_PROC_EVENT = struct.Struct('=IIQ')
+# fork: parent_pid, parent_tgid, child_pid, child_tgid
+_FORK_EVENT = struct.Struct('=IIII')
+# exec: process_pid, process_tgid
+_EXEC_EVENT = struct.Struct('=II')
+# exit: process_pid, process_tgid, exit_code, exit_signal
+_EXIT_EVENT = struct.Struct('=IIII')
+
+
+class ProcEventMonitor(threading.Thread):
+    """
+    通过NETLINK_CONNECTOR的proc connector接收进程的fork、exec、exit事件，增量维护进程列表，无需每个周期扫描/proc。
+    进程退出时由单独的采集线程尽快读取其最终的计数器（此时进程通常尚未被父进程回收），事件线程只负责接收事件，
+    两次统计之间启动并退出的进程也能被统计。父进程回收过快导致无法读取时，退出记录中的stat为None。
+    设置cmd_regex时缓存各进程的命令行，按缓存过滤进程列表，命令行不匹配的退出进程不读取。需要CAP_NET_ADMIN权限。
+    """
+
+    def __init__(self, proc_sys: Optional[ProcSys] = None, max_exited: int = 4096, cmd_regex: Optional[str] = None):
+        super().__init__(daemon=True)
+        self._sys = proc_sys if proc_sys is not None else ProcSys()
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            self._sock.bind((0, CN_IDX_PROC))
+            self._subscribe(PROC_CN_MCAST_LISTEN)
+        except OSError:
+            self._sock.close()
+            raise
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # 进程退出后仍可能无法读取exe等属性，单独维护属性缓存，读取失败时使用最少的属性
+        self._attr_cache = ProcAttrCache(self._sys)
+        # exec时记录原始命令行（以\0分隔），fork时继承父进程的命令行，进程退出后/proc/$pid/cmdline为空
+        self._cmdlines: Dict[int, str] = {}
+        self._cmd_regex = re.compile(cmd_regex) if cmd_regex is not None else None
+        self._exited = deque(maxlen=max_exited)
+        # 待读取最终计数器的退出进程，由采集线程处理
+        self._exit_queue: Queue = Queue(maxsize=max_exited)
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True, name='pidstat_proc_capture')
+        self.stats = {'forks': 0, 'execs': 0, 'exits': 0, 'captured': 0, 'skipped': 0, 'dropped': 0, 'resyncs': 0}
+        # 先订阅再扫描，扫描期间的变化由事件补齐
+        self._pids = set(self._sys.get_proc_pid_list())
+        if self._cmd_regex is not None:
+            self._cmdlines = self._read_cmdlines(self._pids)
+
+    def _read_cmdlines(self, pids) -> Dict[int, str]:
+        cmdlines = {}
+        for pid in pids:
+            cmdline = self._read_cmdline(pid)
+            if cmdline is not None:
+                cmdlines[pid] = cmdline
+        return cmdlines
+
+    def _read_cmdline(self, pid: int) -> Optional[str]:
+        try:
+            return self._sys._read_file(os.path.join(self._sys.base_proc_dir, str(pid), 'cmdline'))
+        except OSError:
+            return None
+
+    def start(self) -> None:
+        self._capture_thread.start()
+        super().start()
+
+    def _subscribe(self, op: int) -> None:
+        payload = struct.pack('=I', op)
+        cn_msg = _CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0) + payload
+        self._sock.send(_NLMSG_HDR.pack(_NLMSG_HDR.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid()) + cn_msg)
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([self._sock], [], [], 0.5)
+                if len(readable) == 0:
+                    continue
+                try:
+                    data = self._sock.recv(1 << 16)
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    # 事件过多导致接收缓冲区溢出，重新扫描/proc
+                    pids = set(self._sys.get_proc_pid_list())
+                    new_cmdlines = self._read_cmdlines(pids - self._cmdlines.keys()) \
+                        if self._cmd_regex is not None else {}
+                    with self._lock:
+                        self._pids = pids
+                        self._cmdlines = {pid: cmdline for pid, cmdline in self._cmdlines.items() if pid in pids}
+                        self._cmdlines.update(new_cmdlines)
+                        self.stats['resyncs'] += 1
+                    continue
+                self._handle(data)
+        finally:
+            self._sock.close()
+
+    def _handle(self, data: bytes) -> None:
+        offset = 0
+        while offset + _NLMSG_HDR.size + _CN_MSG.size + _PROC_EVENT.size <= len(data):
+            msg_len = _NLMSG_HDR.unpack_from(data, offset)[0]
+            if msg_len < _NLMSG_HDR.size:
+                break
+            event = offset + _NLMSG_HDR.size + _CN_MSG.size
+            what = _PROC_EVENT.unpack_from(data, event)[0]
+            event_data = event + _PROC_EVENT.size
+            if what == PROC_EVENT_FORK:
+                _, parent_tgid, child_pid, child_tgid = _FORK_EVENT.unpack_from(data, event_data)
+                # 仅关注新进程，忽略新线程
+                if child_pid == child_tgid:
+                    with self._lock:
+                        self._pids.add(child_tgid)
+                        self.stats['forks'] += 1
+                        if parent_tgid in self._cmdlines:
+                            self._cmdlines[child_tgid] = self._cmdlines[parent_tgid]
+            elif what == PROC_EVENT_EXEC:
+                pid, tgid = _EXEC_EVENT.unpack_from(data, event_data)
+                self._on_exec(tgid)
+            elif what == PROC_EVENT_EXIT:
+                pid, tgid, exit_code, exit_signal = _EXIT_EVENT.unpack_from(data, event_data)
+                if pid == tgid:
+                    self._on_exit(tgid, exit_code, exit_signal)
+            offset += (msg_len + 3) & ~3
+
+    def _on_exec(self, pid: int) -> None:
+        cmdline = self._read_cmdline(pid)
+        with self._lock:
+            self._pids.add(pid)
+            self.stats['execs'] += 1
+            if cmdline is not None:
+                self._cmdlines[pid] = cmdline
+
+    def _capture(self, pid: int) -> Optional[ProcessStat]:
+        # 读取退出中进程的最终计数器
+        try:
+            stat_info = self._sys.get_proc_pid_stat(pid)
+            start_time = int(stat_info['start_time'])
+            try:
+                self._attr_cache.get_attrs(pid, start_time)
+            except OSError:
+                attrs = {'comm': stat_info['tcomm'], 'cmdline': '', 'exe': '', 'environ': '', 'sessionid': '',
+                         'oom_score': ''}
+                attrs.update(self._sys.get_proc_user(pid))
+                self._attr_cache.put(pid, start_time, attrs)
+            ps_stat = ProcessStat(proc_id=pid, attr_cache=self._attr_cache, fd_mode=FD_MODE_COUNT,
+                                  proc_sys=self._sys)
+            ps_stat.init()
+        except OSError:
+            return None
+        finally:
+            self._attr_cache.discard(pid)
+        return ps_stat
+
+    def _on_exit(self, pid: int, exit_code: int, exit_signal: int) -> None:
+        with self._lock:
+            self._pids.discard(pid)
+            cmdline = self._cmdlines.pop(pid, None)
+            self.stats['exits'] += 1
+            if self._cmd_regex is not None and (cmdline is None or self._cmd_regex.match(cmdline) is None):
+                # 命令行不匹配的进程不读取最终计数器
+                self.stats['skipped'] += 1
+                return
+        try:
+            self._exit_queue.put_nowait((pid, exit_code, exit_signal, time.time(), cmdline))
+        except Full:
+            with self._lock:
+                self.stats['dropped'] += 1
+
+    def _capture_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                pid, exit_code, exit_signal, exit_time, cmdline = self._exit_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            ps_stat = self._capture(pid)
+            with self._lock:
+                if ps_stat is not None:
+                    self.stats['captured'] += 1
+                    if cmdline is not None:
+                        ps_stat.attrs['cmdline'] = cmdline.replace('\0', ' ')
+                # exit_code为wait返回的状态值，高8位为退出码，低7位为终止信号
+                self._exited.append({'pid': pid, 'exit_code': exit_code >> 8, 'term_signal': exit_code & 0x7f,
+                                     'exit_signal': exit_signal, 'exit_time': exit_time, 'stat': ps_stat})
+
+    def get_pids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._pids)
+
+    def get_matched_pids(self) -> List[int]:
+        """
+        返回命令行匹配cmd_regex的进程，按缓存的命令行过滤，不读取/proc；未设置cmd_regex时返回所有进程
+        """
+        with self._lock:
+            if self._cmd_regex is None:
+                return sorted(self._pids)
+            return sorted(pid for pid in self._pids
+                          if pid in self._cmdlines and self._cmd_regex.match(self._cmdlines[pid]) is not None)
+
+    def pop_exited(self) -> List[Dict]:
+        """
+        返回上次调用以来退出的进程，包括pid、exit_code、term_signal、exit_signal、exit_time，
+        以及退出时的统计stat（无法读取时为None）
+        """
+        with self._lock:
+            exited = list(self._exited)
+            self._exited.clear()
+        return exited
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, pids=len(self._pids), queued=self._exit_queue.qsize())
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        try:
+            self._subscribe(PROC_CN_MCAST_IGNORE)
+        except OSError:
+            pass
+        # 线程运行时由线程在退出时关闭socket
+        if not self.is_alive():
+            self._sock.close()
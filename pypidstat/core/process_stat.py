@@ -1,9 +1,17 @@
-from typing import Union, Dict, List, Optional
+from typing import Union, Dict, List, Optional, Tuple
 import copy
 import time
-from pypidstat.base.proc_sys import ProcSys
+from pypidstat.base.proc_sys import ProcSys, FD_MODE_COUNT, FD_MODE_FULL
+from pypidstat.base.proc_cache import ProcAttrCache, SmapsRollupCache
+from pypidstat.core.system_stat import SystemSnapshot
 from pypidstat.base.types import BaseModel
-from pypidstat.utils import get_clk_tick
+from pypidstat.utils import get_clk_tick, get_sample_error, get_flow_sample_error
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy为可选依赖，未安装时逐个连接计算
+    np = None
 
 
 def SP_VALUE(prev: float, curr: float, itv: float) -> float:
@@ -17,11 +25,27 @@ def S_VALUE(prev: float, curr: float, itv: float) -> float:
 
 
 class ProcessStat(BaseModel):
-    def __init__(self, proc_id: int,):
+    def __init__(self, proc_id: int, attr_cache: Optional[ProcAttrCache] = None,
+                 snapshot: Optional[SystemSnapshot] = None, fd_mode: str = FD_MODE_FULL,
+                 proc_sys: Optional[ProcSys] = None, smaps_cache: Optional[SmapsRollupCache] = None,
+                 read_status: bool = True, read_smaps: bool = False):
         self.curr_timestamp: float = None
 
         self.proc_id: int = proc_id
-        self.sys = ProcSys()
+        # 进程信息的读取方式，可以使用TaskStatsProcSys
+        self.sys = proc_sys if proc_sys is not None else ProcSys()
+        # 进程静态属性的缓存，跨周期共享；未设置时每次均重新读取
+        self.attr_cache = attr_cache
+        # 同一周期共享的主机快照；未设置时按需读取/proc下的主机信息
+        self.snapshot = snapshot
+        # fd的采集层级，见FD_MODE_COUNT/FD_MODE_CLASSIFY/FD_MODE_FULL
+        self.fd_mode = fd_mode
+        # smaps_rollup的缓存，跨周期共享；未设置时每次调用get_pss_loads均重新读取
+        self.smaps_cache = smaps_cache
+        # 是否读取完整的/proc/pid/status；为False时status_info只包含上下文切换次数，taskstats时不读取/proc
+        self.read_status = read_status
+        # 是否在init时读取smaps_rollup，进程退出后无法再读取
+        self.read_smaps = read_smaps
 
         self.base_proc_dir = f"/proc/{self.proc_id}"
         self.attrs: Union[Dict, None] = None
@@ -34,62 +58,141 @@ class ProcessStat(BaseModel):
         self.stat_info: Union[Dict, None] = None
         self.status_info: Union[Dict, None] = None
         self.schedstat_info: Union[Dict, None] = None
+        self.delay_info: Union[Dict, None] = None
+        # read_smaps为True时在init时读取，否则在get_pss_loads时读取；读取失败时为空字典
+        self.smaps_info: Union[Dict, None] = None
         self.fd_info: Union[Dict, None] = {}
+        self.fd_count: int = 0
         self.is_init = False
 
         self._proc_net_traffic = None
         self._proc_net_conn_traffic = None
+        # 流量为报文采样得到的估计值时为采样方法（count或flow），否则为None
+        self._net_sampled: Optional[str] = None
+        # perf_event_open软件事件的累计计数
+        self._perf_counters: Optional[Dict[str, int]] = None
 
         self.whole_stat = {}
 
-    def init(self):
+    def init(self, prev: 'ProcessStat' = None, sources: Optional[Dict[str, Dict]] = None):
+        """
+        采集进程的各项信息
+        Args:
+            prev: 同一进程上一周期的统计，FD_MODE_FULL时用于增量读取fd表
+            sources: 本周期过滤进程时已读取的数据源（stat、attrs、status、io），见Predicate.pop_sources，不再重复读取
+        """
+        sources = sources if sources is not None else {}
         self.curr_timestamp = time.time()
-        self.attrs = self.sys.get_proc_pid_attrs(self.proc_id)
-        self.attrs.update(self.sys.get_proc_user(self.proc_id))
+        # stat需要优先读取，start_time用于识别进程属性缓存
+        self.stat_info = sources['stat'] if 'stat' in sources else self.sys.get_proc_pid_stat(self.proc_id)
+        if 'attrs' in sources:
+            self.attrs = sources['attrs']
+        elif self.attr_cache is not None:
+            self.attrs = self.attr_cache.get_attrs(self.proc_id, int(self.stat_info['start_time']))
+        else:
+            self.attrs = self.sys.get_proc_pid_attrs(self.proc_id)
+            self.attrs.update(self.sys.get_proc_user(self.proc_id))
         self.whole_stat.update(self.attrs)
 
-        self.stat_info = self.sys.get_proc_pid_stat(self.proc_id)
-        self.io_info = self.sys.get_proc_pid_io(self.proc_id)
+        self.io_info = sources['io'] if 'io' in sources else self.sys.get_proc_pid_io(self.proc_id)
         self.statm_info = self.sys.get_proc_pid_statm(self.proc_id)
-        self.status_info = self.sys.get_proc_pid_status(self.proc_id)
+        self.stat_info.update(self.sys.get_proc_pid_cpu_times(self.proc_id, self.stat_info))
+        if self.read_status:
+            self.status_info = sources['status'] if 'status' in sources \
+                else self.sys.get_proc_pid_status(self.proc_id)
+            self.status_info.update(self.sys.get_proc_pid_ctxt_switches(self.proc_id, self.status_info))
+        else:
+            self.status_info = self.sys.get_proc_pid_ctxt_switches(self.proc_id)
         self.schedstat_info = self.sys.get_proc_pid_schedstat(self.proc_id)
-        self.fd_info = self.sys.get_proc_pid_fds(self.proc_id)
+        self.delay_info = self.sys.get_proc_pid_delays(self.proc_id, self.stat_info, self.schedstat_info)
+        if self.fd_mode == FD_MODE_COUNT:
+            self.fd_count = self.sys.get_proc_pid_fd_count(self.proc_id)
+        else:
+            prev_fds = None
+            if self.fd_mode == FD_MODE_FULL and prev is not None and prev.fd_mode == FD_MODE_FULL \
+                    and prev.stat_info['start_time'] == self.stat_info['start_time']:
+                prev_fds = prev.fd_info
+            self.fd_info = self.sys.get_proc_pid_fds(self.proc_id, mode=self.fd_mode, prev_fds=prev_fds)
+            self.fd_count = len(self.fd_info)
+        if self.read_smaps:
+            self._read_smaps()
 
         self.is_init = True
 
+    def _read_smaps(self) -> None:
+        try:
+            if self.smaps_cache is not None:
+                self.smaps_info = self.smaps_cache.get(self.proc_id, int(self.stat_info['start_time']),
+                                                       now=self.curr_timestamp)
+            else:
+                self.smaps_info = self.sys.get_proc_pid_smaps_rollup(self.proc_id)
+        except OSError:
+            # 进程已退出或无权限，PSS各项为None
+            self.smaps_info = {}
+
+    def zero_baseline(self) -> 'ProcessStat':
+        """
+        返回计数器均为0的副本，作为周期内启动的进程的上一次统计，计算得到进程在周期内的全部消耗
+        """
+        if not self.is_init: self.init()
+        baseline = copy.copy(self)
+        baseline.stat_info = dict(self.stat_info, utime=0, stime=0, gtime=0, min_flt=0, maj_flt=0, blkio_ticks=0)
+        baseline.io_info = {key: 0 for key in self.io_info.keys()}
+        baseline.status_info = dict(self.status_info, voluntary_ctxt_switches=0, nonvoluntary_ctxt_switches=0)
+        baseline.schedstat_info = dict(self.schedstat_info, wait_time=0)
+        baseline.delay_info = {key: 0 if value is not None else None for key, value in self.delay_info.items()}
+        baseline._proc_net_traffic = None
+        baseline._proc_net_conn_traffic = None
+        return baseline
+
     def get_whole_memory(self) -> float:
         # 返回：整个主机的内存（KB）
         if not self.is_init: self.init()
+        if self.snapshot is not None:
+            return self.snapshot.get_whole_memory()
         return float(self.sys.get_proc_meminfo()['MemTotal'])
 
     def get_cpu_loads(self, prev: 'ProcessStat' = None, itv: float = 1) -> Dict:
         if not self.is_init: self.init()
         cpu_loads = {'CPU_ID': self.stat_info['task_cpu'], 'threads_num': self.stat_info['num_threads']}
+        # 同一周期的主机常量取自快照
+        clk_tick = self.snapshot.clk_tick if self.snapshot is not None else get_clk_tick()
         if prev is None:
-            clk_tick = get_clk_tick()
             pid_utime_sec: float = float(self.stat_info['utime']) / clk_tick
             pid_stime_sec: float = float(self.stat_info['stime']) / clk_tick
             pid_start_time_sec: float = float(self.stat_info['start_time']) / clk_tick
 
-            sys_uptime_sec = float(self.sys.get_proc_uptime()['sys_run_time_seconds'])
+            if self.snapshot is not None:
+                sys_uptime_sec = self.snapshot.get_uptime_sec()
+            else:
+                sys_uptime_sec = float(self.sys.get_proc_uptime()['sys_run_time_seconds'])
 
             # 公式： pid_usage_sec/elapsed_sec = (utime + stime)/(uptime_sec - pid_start_time)
             proc_usage = (pid_utime_sec + pid_stime_sec) / (sys_uptime_sec - pid_start_time_sec)
             cpu_loads['%CPU'] = proc_usage
         else:
             cpu_loads['%usr'] = SP_VALUE(prev.stat_info['utime'] - prev.stat_info['gtime'],
-                                          self.stat_info['utime'] - self.stat_info['gtime'], get_clk_tick() * itv)
-            cpu_loads['%system'] = SP_VALUE(prev.stat_info['stime'], self.stat_info['stime'], get_clk_tick() * itv)
-            cpu_loads['%guest'] = SP_VALUE(prev.stat_info['gtime'], self.stat_info['gtime'], get_clk_tick() * itv)
-            cpu_loads['%wait'] = SP_VALUE(prev.schedstat_info['wait_time'], self.schedstat_info['wait_time'], get_clk_tick() * itv)
+                                          self.stat_info['utime'] - self.stat_info['gtime'], clk_tick * itv)
+            cpu_loads['%system'] = SP_VALUE(prev.stat_info['stime'], self.stat_info['stime'], clk_tick * itv)
+            cpu_loads['%guest'] = SP_VALUE(prev.stat_info['gtime'], self.stat_info['gtime'], clk_tick * itv)
+            cpu_loads['%wait'] = SP_VALUE(prev.schedstat_info['wait_time'], self.schedstat_info['wait_time'], clk_tick * itv)
             cpu_loads['%CPU'] = SP_VALUE(prev.stat_info['utime'] + prev.stat_info['stime'],
-                                          self.stat_info['utime'] + self.stat_info['stime'], get_clk_tick() * itv)
+                                          self.stat_info['utime'] + self.stat_info['stime'], clk_tick * itv)
+            if self.snapshot is not None and prev.snapshot is not None and self.snapshot is not prev.snapshot:
+                # 进程所在CPU核的使用率，以及相对于主机全部CPU时间的占比
+                host_loads = self.snapshot.get_cpu_loads(prev.snapshot)
+                core_loads = host_loads.get(f"cpu{self.stat_info['task_cpu']}")
+                cpu_loads['%core'] = core_loads['%busy'] if core_loads is not None else None
+                total_jiffies = host_loads['cpu']['total_jiffies']
+                cpu_loads['%CPU_norm'] = SP_VALUE(prev.stat_info['utime'] + prev.stat_info['stime'],
+                                                  self.stat_info['utime'] + self.stat_info['stime'],
+                                                  total_jiffies) if total_jiffies > 0 else None
         return cpu_loads
 
     def get_mem_loads(self, prev: 'ProcessStat' = None, itv: int = 1) -> Dict:
         if not self.is_init: self.init()
         mem_loads = {'vsize': self.stat_info['vsize'], 'rss': self.stat_info['rss'],
-                     'VmPeak(KB)': self.status_info['VmPeak']}
+                     'VmPeak(KB)': self.status_info.get('VmPeak', 0)}
 
         if prev is not None:
             mem_loads['minflt/s'] = S_VALUE(prev.stat_info['min_flt'], self.stat_info['min_flt'], itv)
@@ -98,6 +201,25 @@ class ProcessStat(BaseModel):
 
         return mem_loads
 
+    def get_pss_loads(self, prev: 'ProcessStat' = None, itv: int = 1) -> Dict:
+        """
+        由smaps_rollup计算按共享比例分摊的内存（KB）：PSS、USS（进程独占的页）、换出内存的PSS，
+        以及PSS中匿名页、文件页和共享内存的部分，低版本内核无法获取或进程已退出时相应项为None
+        """
+        if not self.is_init: self.init()
+        if self.smaps_info is None:
+            self._read_smaps()
+
+        smaps_info = self.smaps_info
+        private_keys = [key for key in ('Private_Clean', 'Private_Dirty') if key in smaps_info]
+        return {'PSS': smaps_info.get('Pss'),
+                'USS': sum(smaps_info[key] for key in private_keys) if len(private_keys) > 0 else None,
+                'SwapPss': smaps_info.get('SwapPss'),
+                'Pss_Anon': smaps_info.get('Pss_Anon'),
+                'Pss_File': smaps_info.get('Pss_File'),
+                'Pss_Shmem': smaps_info.get('Pss_Shmem'),
+                '%PSS': SP_VALUE(0, smaps_info['Pss'], self.get_whole_memory()) if 'Pss' in smaps_info else None}
+
     def get_io_loads(self, prev: 'ProcessStat' = None, itv: int = 1) -> Dict:
         if not self.is_init: self.init()
         io_loads = {'iodelay': self.stat_info['blkio_ticks']}
@@ -123,6 +245,39 @@ class ProcessStat(BaseModel):
 
         return ctx_switch_loads
 
+    def get_delay_loads(self, prev: 'ProcessStat' = None, itv: float = 1) -> Dict:
+        """
+        计算进程在周期内等待CPU、块设备IO、换入和内存回收的时间占比，无法获取的项为None
+        """
+        if not self.is_init: self.init()
+        delay_loads = {}
+
+        if prev is not None:
+            for key, name in [('cpu_delay_total', '%cpu_delay'), ('blkio_delay_total', '%blkio_delay'),
+                              ('swapin_delay_total', '%swapin_delay'), ('freepages_delay_total', '%freepages_delay')]:
+                if self.delay_info[key] is None or prev.delay_info[key] is None:
+                    delay_loads[name] = None
+                else:
+                    delay_loads[name] = SP_VALUE(prev.delay_info[key], self.delay_info[key], itv * 1e9)
+
+        return delay_loads
+
+    def get_perf_loads(self, prev: 'ProcessStat' = None, itv: float = 1) -> Optional[Dict]:
+        """
+        由perf软件事件计算精确的task-clock占比，以及每秒上下文切换、CPU迁移和缺页次数
+        """
+        if prev is None or self._perf_counters is None or prev._perf_counters is None:
+            return None
+
+        curr_counters, prev_counters = self._perf_counters, prev._perf_counters
+        return {
+            '%task_clock': SP_VALUE(prev_counters['task_clock'], curr_counters['task_clock'], itv * 1e9),
+            'ctx_switches/s': S_VALUE(prev_counters['context_switches'], curr_counters['context_switches'], itv),
+            'cpu_migrations/s': S_VALUE(prev_counters['cpu_migrations'], curr_counters['cpu_migrations'], itv),
+            'page_faults/s': S_VALUE(prev_counters['minor_faults'] + prev_counters['major_faults'],
+                                     curr_counters['minor_faults'] + curr_counters['major_faults'], itv),
+        }
+
     def get_stack_loads(self, prev: 'ProcessStat' = None, itv: int = 1) -> Dict:
         if not self.is_init: self.init()
         stack_loads = {key: self.status_info[key]
@@ -133,7 +288,13 @@ class ProcessStat(BaseModel):
         return stack_loads
 
     def get_fd_net_count(self) -> int:
-        return len(self.fd_info)
+        return self.fd_count
+
+    def get_fd_socket_count(self) -> Optional[int]:
+        # FD_MODE_COUNT未对fd进行分类，返回None
+        if self.fd_mode == FD_MODE_COUNT:
+            return None
+        return sum(1 for fd_info in self.fd_info.values() if fd_info['type'] == 'socket')
 
     def get_fd_net_info(self) -> int:
         return len(self.fd_info)
@@ -151,28 +312,99 @@ class ProcessStat(BaseModel):
             'recv_packet_cnt/s': S_VALUE(prev._proc_net_traffic[2], self._proc_net_traffic[2], itv),
             'recv_packet_bytes/s': S_VALUE(prev._proc_net_traffic[3], self._proc_net_traffic[3], itv)
         }
+        if self._net_sampled is not None:
+            # 采样时给出95%置信度下的相对误差：按包计数采样时由周期内实际处理的采样包数估算，
+            # 按流采样时由各连接（流）周期内的字节数估算
+            net_loads['estimated'] = True
+            if self._net_sampled == 'flow':
+                net_loads['error%'] = get_flow_sample_error(self._get_conn_deltas(prev))
+            else:
+                net_loads['error%'] = get_sample_error(self._proc_net_traffic[4] - prev._proc_net_traffic[4])
         return net_loads
 
-    def get_net_conn_loads(self, prev: 'ProcessStat' = None, itv: int = 1) -> Optional[Dict]:
+    def _get_conn_deltas(self, prev: 'ProcessStat') -> List[Tuple[int, int, int]]:
+        """
+        返回周期内各连接的(包数, 字节数, 采样包数)增量，连接在两次统计之间被淘汰后重新加入时从0开始计算
+        """
+        if self._proc_net_conn_traffic is None or prev._proc_net_conn_traffic is None:
+            return []
+        conn_deltas = []
+        prev_conn_traffic = prev._proc_net_conn_traffic
+        for conn_key, curr_traffic in self._proc_net_conn_traffic.items():
+            prev_traffic = prev_conn_traffic.get(conn_key)
+            if prev_traffic is None or prev_traffic[5] != curr_traffic[5]:
+                prev_traffic = (0, 0, 0, 0, 0)
+            conn_deltas.append((curr_traffic[0] + curr_traffic[2] - prev_traffic[0] - prev_traffic[2],
+                                curr_traffic[1] + curr_traffic[3] - prev_traffic[1] - prev_traffic[3],
+                                curr_traffic[4] - prev_traffic[4]))
+        return conn_deltas
+
+    def get_net_conn_loads(self, prev: 'ProcessStat' = None, itv: int = 1, top: Optional[int] = None) \
+            -> Optional[Dict]:
+        """
+        计算各连接的流量速率，按收发字节速率之和从大到小排列
+        Args:
+            prev: 上一次的进程统计
+            itv: 时间间隔（秒）
+            top: 仅返回速率最大的top个连接，为None时返回所有连接
+
+        Returns:
+            key为conn_key，value为各项速率；'error'为连接表淘汰带来的字节数误差上界
+        """
         if prev is None:
             return None
 
         if self._proc_net_conn_traffic is None or prev._proc_net_conn_traffic is None:
             return None
 
-        net_conn_loads: Dict[str, Dict[str, float]] = {}
-        for conn_key in self._proc_net_conn_traffic:
-            if conn_key in prev._proc_net_conn_traffic:
-                net_conn_traffic = {
-                    'send_packet_cnt/s': S_VALUE(prev._proc_net_conn_traffic[0], self._proc_net_conn_traffic[0], itv),
-                    'send_packet_bytes/s': S_VALUE(prev._proc_net_conn_traffic[1], self._proc_net_conn_traffic[1], itv),
-                    'recv_packet_cnt/s': S_VALUE(prev._proc_net_conn_traffic[2], self._proc_net_conn_traffic[2], itv),
-                    'recv_packet_bytes/s': S_VALUE(prev._proc_net_conn_traffic[3], self._proc_net_conn_traffic[3], itv)
-                }
-                net_conn_loads[conn_key] = net_conn_traffic
+        # 连接统计为[发送包数, 发送字节数, 接收包数, 接收字节数, 采样包数, 加入序号, 误差上界, 总字节数]，
+        # 加入序号不同说明连接在两次统计之间被淘汰后重新加入，此时从0开始计算
+        zero_traffic = (0, 0, 0, 0)
+        prev_conn_traffic = prev._proc_net_conn_traffic
+        conn_keys, prev_rows, curr_rows, errors = [], [], [], []
+        for conn_key, curr_traffic in self._proc_net_conn_traffic.items():
+            prev_traffic = prev_conn_traffic.get(conn_key)
+            if prev_traffic is None or prev_traffic[5] != curr_traffic[5]:
+                prev_traffic = zero_traffic
+            conn_keys.append(conn_key)
+            prev_rows.append(prev_traffic[0:4])
+            curr_rows.append(curr_traffic[0:4])
+            errors.append(curr_traffic[6])
+
+        # 批量计算各连接的速率，安装了numpy时以(连接数×4)的矩阵一次计算，并只对前top个连接排序
+        if np is not None and len(conn_keys) > 0:
+            rates = (np.array(curr_rows, dtype=np.int64) - np.array(prev_rows, dtype=np.int64)) / float(itv)
+            weights = -(rates[:, 1] + rates[:, 3])
+            if top is not None and top < len(conn_keys):
+                candidates = np.sort(np.argpartition(weights, top - 1)[:top]) if top > 0 else np.arange(0)
+            else:
+                candidates = np.arange(len(conn_keys))
+            order = candidates[np.argsort(weights[candidates], kind='stable')].tolist()
+            rate_rows = rates.tolist()
+        else:
+            rate_rows = [[S_VALUE(p, c, itv) for p, c in zip(prev_row, curr_row)]
+                         for prev_row, curr_row in zip(prev_rows, curr_rows)]
+            order = sorted(range(len(conn_keys)), key=lambda i: -(rate_rows[i][1] + rate_rows[i][3]))
+            if top is not None:
+                order = order[:top]
 
+        net_conn_loads: Dict[str, Dict[str, float]] = {}
+        for i in order:
+            send_cnt, send_bytes, recv_cnt, recv_bytes = rate_rows[i]
+            net_conn_loads[conn_keys[i]] = {
+                'send_packet_cnt/s': send_cnt,
+                'send_packet_bytes/s': send_bytes,
+                'recv_packet_cnt/s': recv_cnt,
+                'recv_packet_bytes/s': recv_bytes,
+                'error': errors[i]
+            }
         return net_conn_loads
 
-    def set_proc_traffic(self, proc_net_traffic: [List[int]], proc_net_conn_traffic: Dict[str, List[int]]):
+    def set_proc_traffic(self, proc_net_traffic: [List[int]], proc_net_conn_traffic: Dict[str, List[int]],
+                         sampled: Optional[str] = None):
         self._proc_net_traffic = proc_net_traffic
         self._proc_net_conn_traffic = proc_net_conn_traffic
+        self._net_sampled = sampled
+
+    def set_perf_counters(self, perf_counters: Optional[Dict[str, int]]):
+        self._perf_counters = perf_counters
@@ -0,0 +1,287 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: scheduler.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 20:00
+"""
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from pypidstat.base.types import BaseModel
+from pypidstat.utils import get_clk_tick
+
+# 判断进程是否空闲时比较的计数器
+_STAT_COUNTERS = ('utime', 'stime')
+_IO_COUNTERS = ('read_bytes', 'write_bytes')
+_STATUS_COUNTERS = ('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')
+
+
+def _cpu_majflt_rates(prev, curr):
+    # 由两次采样的计数器和实际间隔计算%CPU和majflt/s，间隔无效时返回None
+    elapsed = curr.curr_timestamp - prev.curr_timestamp
+    if elapsed <= 0:
+        return None
+    cpu = float(curr.stat_info['utime'] + curr.stat_info['stime']
+                - prev.stat_info['utime'] - prev.stat_info['stime']) / get_clk_tick() / elapsed * 100
+    majflt = float(curr.stat_info['maj_flt'] - prev.stat_info['maj_flt']) / elapsed
+    return cpu, majflt
+
+
+class _PidSchedule(object):
+    __slots__ = ('period', 'next_due', 'burst_left', 'last_sample')
+
+    def __init__(self, period: float, next_due: float):
+        self.period = period
+        self.next_due = next_due
+        self.burst_left = 0
+        self.last_sample = None
+
+
+class AdaptiveScheduler(BaseModel):
+    """
+    按进程调整采样周期：计数器（utime、stime、IO字节数、上下文切换）未变化的进程，采样周期逐次翻倍，最长max_period；
+    %CPU超过burst_cpu或majflt/s超过burst_majflt的进程，在接下来的burst_ticks次采样中以burst_interval高频采样。
+    每个进程保存最近一次的采样，速率按两次采样的实际间隔计算，因此与采样周期无关。
+    """
+
+    def __init__(self, interval: float, max_period: Optional[float] = None, burst_interval: Optional[float] = None,
+                 burst_cpu: float = 80.0, burst_majflt: float = 100.0, burst_ticks: int = 10):
+        self.interval = interval
+        self.max_period = max_period if max_period is not None else interval * 8
+        self.burst_interval = burst_interval if burst_interval is not None else interval / 4
+        self.burst_cpu = burst_cpu
+        self.burst_majflt = burst_majflt
+        self.burst_ticks = burst_ticks
+        self._pids: Dict[int, _PidSchedule] = {}
+        self._sampled = 0
+
+    def due(self, pids: List[int], now: float) -> List[int]:
+        """
+        返回当前需要采样的进程，新出现的进程立即采样，已退出的进程被清理
+        Args:
+            pids: 当前存在的进程列表，为None时仅从已知进程中选择
+            now: 当前时间（秒）
+        """
+        if pids is not None:
+            curr_pids = set(pids)
+            for pid in [pid for pid in self._pids.keys() if pid not in curr_pids]:
+                del self._pids[pid]
+            for pid in pids:
+                if pid not in self._pids:
+                    self._pids[pid] = _PidSchedule(self.interval, now)
+        return [pid for pid, sched in self._pids.items() if sched.next_due <= now]
+
+    def next_wakeup(self, now: float) -> float:
+        # 距离下一个进程需要采样的时间，最长为一个统计周期，以便发现新进程
+        if len(self._pids) == 0:
+            return self.interval
+        return max(0.0, min(self.interval, min(sched.next_due for sched in self._pids.values()) - now))
+
+    def get_last_sample(self, pid: int):
+        sched = self._pids.get(pid)
+        return sched.last_sample if sched is not None else None
+
+    @staticmethod
+    def is_active(prev, curr) -> bool:
+        """
+        比较同一进程两次采样的计数器，任一变化即认为进程活跃
+        """
+        if prev.stat_info['start_time'] != curr.stat_info['start_time']:
+            return True
+        return any(prev.stat_info[key] != curr.stat_info[key] for key in _STAT_COUNTERS) \
+            or any(prev.io_info.get(key) != curr.io_info.get(key) for key in _IO_COUNTERS) \
+            or any(prev.status_info.get(key) != curr.status_info.get(key) for key in _STATUS_COUNTERS)
+
+    def is_hot(self, prev, curr) -> bool:
+        # 直接由计数器和实际间隔计算，与是否展示CPU、内存列无关
+        rates = _cpu_majflt_rates(prev, curr)
+        if rates is None:
+            return False
+        cpu, majflt = rates
+        return cpu > self.burst_cpu or majflt > self.burst_majflt
+
+    def update(self, pid: int, curr, now: float) -> None:
+        """
+        记录进程的本次采样，并根据活跃程度确定下一次采样的时间
+        """
+        sched = self._pids.get(pid)
+        if sched is None:
+            sched = self._pids[pid] = _PidSchedule(self.interval, now)
+        prev = sched.last_sample
+        self._sampled += 1
+
+        if prev is None:
+            sched.period = self.interval
+        elif self.is_hot(prev, curr):
+            sched.burst_left = self.burst_ticks
+            sched.period = self.burst_interval
+        elif sched.burst_left > 0:
+            sched.burst_left -= 1
+            sched.period = self.burst_interval
+        elif self.is_active(prev, curr):
+            sched.period = self.interval
+        else:
+            # 空闲进程逐次延长采样周期
+            sched.period = min(max(sched.period, self.interval) * 2, self.max_period)
+        sched.last_sample = curr
+        sched.next_due = now + sched.period
+
+    def get_stats(self) -> Dict:
+        burst = sum(1 for sched in self._pids.values() if sched.burst_left > 0)
+        idle = sum(1 for sched in self._pids.values() if sched.period > self.interval)
+        stats = {'pids': len(self._pids), 'burst': burst, 'idle': idle, 'sampled': self._sampled}
+        self._sampled = 0
+        return stats
+
+
+class _PidBudget(object):
+    __slots__ = ('first_seen', 'last_sampled', 'hot_left')
+
+    def __init__(self, first_seen: float):
+        self.first_seen = first_seen
+        self.last_sampled = None
+        self.hot_left = 0
+
+
+class BudgetScheduler(BaseModel):
+    """
+    每个统计周期采集进程统计的时间预算。进程按优先级采集：显式观测的进程，最近高负载（%CPU超过hot_cpu）
+    或超过max_age未采样的进程，其余进程；同一优先级中最久未采样的进程优先。
+    采集耗时达到预算后停止，剩余的进程顺延，因为未采样时间最久，下个周期优先采集，不会一直被跳过。
+    主机过载时采集变慢，每个周期采集的进程随之减少，统计周期保持不变，不会因监控加重主机的负载。
+    在刷新进程列表前调用start_tick时，过滤进程和预读taskstats的耗时同样计入本周期的预算。
+    """
+
+    def __init__(self, interval: float, budget: float, watched: Optional[Iterable[int]] = None,
+                 hot_cpu: float = 80.0, hot_ticks: int = 10, max_age: Optional[float] = None):
+        if budget <= 0:
+            raise Exception("budget must be positive")
+        self.interval = interval
+        self.budget = budget
+        self.watched = set(watched) if watched is not None else set()
+        self.hot_cpu = hot_cpu
+        self.hot_ticks = hot_ticks
+        self.max_age = max_age if max_age is not None else interval * 4
+        self._pids: Dict[int, _PidBudget] = {}
+        self._tick_start: Optional[float] = None
+        # start_tick开始、尚未由plan使用的周期
+        self._tick_open = False
+        self.last_tick = {'used': 0.0, 'sampled': 0, 'skipped': 0}
+        self.stats = {'ticks': 0, 'exhausted': 0, 'overruns': 0, 'skipped': 0}
+
+    def evict(self, pids: Iterable[int]) -> None:
+        # 清理已退出的进程
+        alive = set(pids)
+        for pid in [pid for pid in self._pids.keys() if pid not in alive]:
+            del self._pids[pid]
+
+    def _priority(self, pid: int, now: float):
+        entry = self._pids.get(pid)
+        if entry is None:
+            entry = self._pids[pid] = _PidBudget(now)
+        # 从未采集的进程最先采集
+        last_sampled = entry.last_sampled if entry.last_sampled is not None else 0.0
+        if pid in self.watched:
+            level = 0
+        elif entry.hot_left > 0 or (entry.last_sampled is not None and now - last_sampled > self.max_age):
+            level = 1
+        else:
+            level = 2
+        return level, last_sampled
+
+    def start_tick(self) -> float:
+        """
+        开始一个周期，之后的过滤、预读和采集的耗时均计入本周期的预算，由下一次plan结束
+        Returns:
+            返回本周期预算的截止时间（time.monotonic()）
+        """
+        self._tick_start = time.monotonic()
+        self._tick_open = True
+        return self.deadline
+
+    @property
+    def deadline(self) -> float:
+        return self._tick_start + self.budget if self._tick_start is not None else time.monotonic() + self.budget
+
+    def order(self, pids: Iterable[int], now: Optional[float] = None) -> List[int]:
+        # 按采集的优先级排列
+        now = now if now is not None else time.time()
+        return sorted(pids, key=lambda pid: self._priority(pid, now))
+
+    def plan(self, pids: Iterable[int], now: Optional[float] = None,
+             prefetch: Optional[Callable[[List[int]], None]] = None, batch_size: int = 64) -> Iterator[int]:
+        """
+        按优先级依次返回本周期需要采集的进程，耗时达到预算后停止，至少返回一个进程
+        Args:
+            pids: 本周期候选的进程
+            now: 当前时间（秒），用于计算进程未采样的时间
+            prefetch: 批量预读进程信息（如taskstats），每次预读接下来的batch_size个进程，预算用完后不再预读
+        """
+        if not self._tick_open:
+            self._tick_start = time.monotonic()
+        self._tick_open = False
+        deadline = self.deadline
+        now = now if now is not None else time.time()
+        ordered = self.order(pids, now)
+        sampled = 0
+        for pid in ordered:
+            if sampled > 0 and time.monotonic() >= deadline:
+                break
+            if prefetch is not None and sampled % batch_size == 0:
+                prefetch(ordered[sampled:sampled + batch_size])
+            sampled += 1
+            # 进程退出或无权限读取时不会调用record，同样记为已采集，避免一直排在最前
+            self._pids[pid].last_sampled = now
+            yield pid
+        skipped = len(ordered) - sampled
+        self.last_tick = {'used': time.monotonic() - self._tick_start, 'sampled': sampled, 'skipped': skipped}
+        self.stats['ticks'] += 1
+        self.stats['skipped'] += skipped
+        if skipped > 0:
+            self.stats['exhausted'] += 1
+
+    def record(self, pid: int, prev, curr) -> None:
+        """
+        记录进程的本次采样，并根据与上次采样之间的%CPU判断进程是否高负载
+        """
+        entry = self._pids.get(pid)
+        if entry is None:
+            entry = self._pids[pid] = _PidBudget(curr.curr_timestamp)
+        rates = _cpu_majflt_rates(prev, curr) if prev is not None else None
+        if rates is not None and rates[0] > self.hot_cpu:
+            entry.hot_left = self.hot_ticks
+        elif entry.hot_left > 0:
+            entry.hot_left -= 1
+        entry.last_sampled = curr.curr_timestamp
+
+    def next_wakeup(self) -> float:
+        """
+        距离下一个周期开始的时间：周期按固定节拍开始，超时的周期不顺延后续的周期
+        """
+        if self._tick_start is None:
+            return self.interval
+        delay = self._tick_start + self.interval - time.monotonic()
+        if delay < 0:
+            self.stats['overruns'] += 1
+            return 0.0
+        return delay
+
+    def get_max_age(self, now: float) -> float:
+        # 进程最近一次采样距今的最长时间，从未采集的进程从发现时算起
+        ages = [now - (entry.last_sampled if entry.last_sampled is not None else entry.first_seen)
+                for entry in self._pids.values()]
+        return max(ages) if len(ages) > 0 else 0.0
+
+    def get_stats(self, now: Optional[float] = None) -> Dict:
+        now = now if now is not None else time.time()
+        stats = dict(self.stats, budget_ms=round(self.budget * 1000, 1),
+                     used_ms=round(self.last_tick['used'] * 1000, 1),
+                     used_pct=round(self.last_tick['used'] * 100.0 / self.budget, 1),
+                     sampled=self.last_tick['sampled'],
+                     hot=sum(1 for entry in self._pids.values() if entry.hot_left > 0),
+                     max_age=round(self.get_max_age(now), 2))
+        # 计数为上次获取以来的累计值
+        self.stats = {key: 0 for key in self.stats.keys()}
+        return stats
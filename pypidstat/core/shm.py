@@ -0,0 +1,170 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: shm.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 18:10
+"""
+import math
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pypidstat.base.fields import shm_record_fields
+
+SHM_MAGIC = b'PDST'
+SHM_VERSION = 1
+
+# 头部：magic, version, seq, record_size, capacity, count, timestamp, interval
+# seq为seqlock的序号，写入期间为奇数，写入完成后为偶数
+_HEADER = struct.Struct('=4sIQIIIdd')
+_SEQ_OFFSET = 8
+_SEQ = struct.Struct('=Q')
+_RECORD = struct.Struct('=' + ''.join(fmt for fmt, _ in shm_record_fields.values()))
+_RECORD_NAMES = list(shm_record_fields.keys())
+_STR_FIELDS = {name for name, (fmt, _) in shm_record_fields.items() if fmt.endswith('s')}
+_INT_FIELDS = {name for name, (fmt, _) in shm_record_fields.items() if fmt in ('i', 'I')}
+
+
+def _encode_record(row: Dict) -> Tuple:
+    values = []
+    for name in _RECORD_NAMES:
+        value = row.get(name)
+        if name in _STR_FIELDS:
+            values.append(str(value if value is not None else '').encode('utf-8', errors='replace'))
+        elif name in _INT_FIELDS:
+            values.append(int(value) if value is not None else -1)
+        else:
+            values.append(float(value) if value is not None else math.nan)
+    return tuple(values)
+
+
+def _decode_record(values: Tuple) -> Dict:
+    row = {}
+    for name, value in zip(_RECORD_NAMES, values):
+        if name in _STR_FIELDS:
+            # 截断时可能切断多字节字符
+            value = value.split(b'\0', 1)[0].decode('utf-8', errors='ignore')
+        elif name in _INT_FIELDS:
+            value = None if value == -1 else value
+        elif math.isnan(value):
+            value = None
+        row[name] = value
+    return row
+
+
+class ShmPublisher(object):
+    """
+    采集进程将每个周期的进程统计写入共享内存，查看进程通过ShmReader读取，无需访问/proc或root权限。
+    布局为固定大小的头部加capacity条定长记录，使用seqlock保证读取到的是同一个周期的完整数据。
+    """
+
+    def __init__(self, name: str, capacity: int = 4096, interval: float = 1.0):
+        self.capacity = capacity
+        self._interval = interval
+        size = _HEADER.size + capacity * _RECORD.size
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._buf = self._shm.buf
+        self._seq = 0
+        _HEADER.pack_into(self._buf, 0, SHM_MAGIC, SHM_VERSION, self._seq, _RECORD.size, capacity, 0, 0.0, interval)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def publish(self, rows: Iterable[Dict], timestamp: Optional[float] = None) -> int:
+        """
+        写入一个周期的所有进程记录，超过capacity的记录被丢弃
+        Returns:
+            返回写入的记录数
+        """
+        buf = self._buf
+        self._seq += 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self._seq)
+
+        count = 0
+        offset = _HEADER.size
+        for row in rows:
+            if count >= self.capacity:
+                break
+            _RECORD.pack_into(buf, offset, *_encode_record(row))
+            offset += _RECORD.size
+            count += 1
+
+        self._seq += 1
+        _HEADER.pack_into(buf, 0, SHM_MAGIC, SHM_VERSION, self._seq, _RECORD.size, self.capacity, count,
+                          timestamp if timestamp is not None else time.time(), self._interval)
+        return count
+
+    def close(self, unlink: bool = True) -> None:
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
+
+
+class ShmReader(object):
+    """
+    读取ShmPublisher发布的进程统计。直接在共享内存上解析记录，不复制整个数据段；
+    读取过程中发生写入时重试。
+    """
+
+    def __init__(self, name: str):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.13以前的版本会在退出时由resource_tracker删除共享内存，读取方需要取消登记
+            self._shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._buf = self._shm.buf
+        magic, version, _, record_size, capacity, _, _, interval = _HEADER.unpack_from(self._buf, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION or record_size != _RECORD.size:
+            self.close()
+            raise Exception(f"shared memory {name} is not a pypidstat segment or has an incompatible layout")
+        self.capacity = capacity
+        self.interval = interval
+
+    def get_seq(self) -> int:
+        return _SEQ.unpack_from(self._buf, _SEQ_OFFSET)[0]
+
+    def read(self, max_retries: int = 100) -> Tuple[Dict, List[Dict]]:
+        """
+        读取最近一个周期的完整数据
+        Returns:
+            返回(头部信息, 进程记录列表)，头部信息包括seq、count、timestamp、interval
+        """
+        buf = self._buf
+        for _ in range(max_retries):
+            seq = self.get_seq()
+            if seq & 1:
+                time.sleep(0.001)
+                continue
+            _, _, _, _, _, count, timestamp, interval = _HEADER.unpack_from(buf, 0)
+            rows = [_decode_record(values) for values in _RECORD.iter_unpack(
+                buf[_HEADER.size:_HEADER.size + count * _RECORD.size])]
+            if self.get_seq() == seq:
+                return {'seq': seq, 'count': count, 'timestamp': timestamp, 'interval': interval}, rows
+        raise Exception("shared memory is being written continuously, read retries exhausted")
+
+    def wait_next(self, last_seq: int, timeout: float) -> bool:
+        """
+        等待发布新的周期
+        Returns:
+            超时前是否发布了新的周期
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            seq = self.get_seq()
+            if seq != last_seq and not seq & 1:
+                return True
+            time.sleep(min(0.05, self.interval / 10))
+        return False
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
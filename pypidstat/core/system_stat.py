@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Union
+import time
+from pypidstat.base.fields import cpustat_fields
+from pypidstat.base.proc_sys import ProcSys
+from pypidstat.base.types import BaseModel
+from pypidstat.utils import get_clk_tick, get_page_size
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy为可选依赖，未安装时逐行计算
+    np = None
+
+# 计数矩阵的列，guest和guest_nice已计入user和nice，不参与总时间的计算
+CPU_FIELDS = [key for key in cpustat_fields.keys() if key != 'cpu_name']
+_TOTAL_FIELDS = len(CPU_FIELDS) - 2
+_IDLE = CPU_FIELDS.index('idle')
+_IO_WAIT = CPU_FIELDS.index('io_wait')
+
+
+class SystemCpuStat(BaseModel):
+    """
+    主机及每个CPU核的使用率。由/proc/stat构造(核数+1)×字段数的计数矩阵，第0行为所有CPU的汇总，
+    与上一周期的矩阵相减后一次计算出所有核的各项百分比
+    """
+
+    def __init__(self, cpustat: Dict):
+        cores = sorted((name for name in cpustat.keys() if name.startswith('cpu') and name[3:].isdigit()),
+                       key=lambda name: int(name[3:]))
+        self.cpu_names: List[str] = ['cpu'] + cores
+        rows = [[cpustat[name].get(field, 0) for field in CPU_FIELDS] for name in self.cpu_names]
+        self.counters = np.array(rows, dtype=np.int64) if np is not None else rows
+
+    def get_loads(self, prev: 'SystemCpuStat') -> Dict[str, Dict[str, float]]:
+        """
+        计算与上一次统计之间各CPU的使用率
+        Returns:
+            key为cpu（汇总）或cpuN，value包括各字段的百分比（如%user、%io_wait）、%busy以及总时间total_jiffies
+        """
+        # CPU热插拔时仅计算前后均存在的核
+        names = [name for name in self.cpu_names if name in prev.cpu_names]
+        curr_idx = [self.cpu_names.index(name) for name in names]
+        prev_idx = [prev.cpu_names.index(name) for name in names]
+        if np is not None:
+            delta = self.counters[curr_idx] - prev.counters[prev_idx]
+            total = delta[:, :_TOTAL_FIELDS].sum(axis=1)
+            pct = delta * 100.0 / np.where(total > 0, total, 1)[:, None]
+            busy = 100.0 - pct[:, _IDLE] - pct[:, _IO_WAIT]
+            pct, busy, total = pct.tolist(), busy.tolist(), total.tolist()
+        else:
+            delta = [[c - p for c, p in zip(self.counters[i], prev.counters[j])] for i, j in zip(curr_idx, prev_idx)]
+            total = [sum(row[:_TOTAL_FIELDS]) for row in delta]
+            pct = [[v * 100.0 / (t if t > 0 else 1) for v in row] for row, t in zip(delta, total)]
+            busy = [100.0 - row[_IDLE] - row[_IO_WAIT] for row in pct]
+
+        loads = {}
+        for i, name in enumerate(names):
+            load = {f'%{field}': pct[i][j] for j, field in enumerate(CPU_FIELDS)}
+            # 没有经过时间的核（如刚上线）使用率记为0
+            load['%busy'] = busy[i] if total[i] > 0 else 0.0
+            load['total_jiffies'] = total[i]
+            loads[name] = load
+        return loads
+
+
+class SystemSnapshot(BaseModel):
+    """
+    主机级别的信息快照，每个统计周期采集一次，由该周期内所有的ProcessStat共享。
+    包含/proc/meminfo、/proc/uptime、/proc/stat的CPU汇总，以及页大小和时钟频率，
+    避免每个进程重复读取，同时为百分比的计算提供统一的参考点。
+    """
+
+    def __init__(self, sys_proc: Optional[ProcSys] = None):
+        self.sys = sys_proc if sys_proc is not None else ProcSys()
+        self.curr_timestamp: float = None
+
+        self.meminfo: Union[Dict, None] = None
+        self.uptime: Union[Dict, None] = None
+        self.stat: Union[Dict, None] = None
+        self.page_size: int = get_page_size()
+        self.clk_tick: int = get_clk_tick()
+        self.is_init = False
+
+        self._cpu_stat: Optional[SystemCpuStat] = None
+        # 最近一次计算的CPU使用率，(上一个快照的时间, 结果)，同一周期内的所有进程共享
+        self._cpu_loads = None
+
+    def init(self) -> 'SystemSnapshot':
+        self.curr_timestamp = time.time()
+        self.meminfo = self.sys.get_proc_meminfo()
+        self.uptime = self.sys.get_proc_uptime()
+        self.stat = self.sys.get_proc_stat()
+        self.is_init = True
+        return self
+
+    @classmethod
+    def take(cls, sys_proc: Optional[ProcSys] = None) -> 'SystemSnapshot':
+        """
+        采集并返回当前时刻的主机快照
+        """
+        return cls(sys_proc=sys_proc).init()
+
+    def get_whole_memory(self) -> float:
+        # 返回：整个主机的内存（KB）
+        if not self.is_init: self.init()
+        return float(self.meminfo['MemTotal'])
+
+    def get_uptime_sec(self) -> float:
+        # 返回：系统启动后的运行时间（秒）
+        if not self.is_init: self.init()
+        return float(self.uptime['sys_run_time_seconds'])
+
+    def get_cpu_total_jiffies(self) -> int:
+        # 返回：所有CPU累计的总时间（jiffies），guest已计入user中，不重复累加
+        if not self.is_init: self.init()
+        cpu = self.stat['cpu']
+        return sum(cpu[key] for key in ['user', 'nice', 'system', 'idle', 'io_wait', 'irq', 'soft_irq', 'steal'])
+
+    def get_cpu_stat(self) -> SystemCpuStat:
+        if not self.is_init: self.init()
+        if self._cpu_stat is None:
+            self._cpu_stat = SystemCpuStat(self.stat)
+        return self._cpu_stat
+
+    def get_cpu_loads(self, prev: 'SystemSnapshot') -> Dict[str, Dict[str, float]]:
+        """
+        计算与上一个快照之间主机及各CPU核的使用率，见SystemCpuStat.get_loads
+        """
+        if self._cpu_loads is None or self._cpu_loads[0] != prev.curr_timestamp:
+            self._cpu_loads = (prev.curr_timestamp, self.get_cpu_stat().get_loads(prev.get_cpu_stat()))
+        return self._cpu_loads[1]
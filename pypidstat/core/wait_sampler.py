@@ -0,0 +1,251 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: wait_sampler.py
+@Author: thirsd@sina.com
+@Date: 2026/10/20 17:00
+"""
+import os
+import platform
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# x86_64常见的可能阻塞的系统调用，其他的系统调用及其他架构展示调用号
+_X86_64_SYSCALLS = {
+    0: 'read', 1: 'write', 7: 'poll', 17: 'pread64', 18: 'pwrite64', 19: 'readv', 20: 'writev', 23: 'select',
+    34: 'pause', 35: 'nanosleep', 42: 'connect', 43: 'accept', 44: 'sendto', 45: 'recvfrom', 46: 'sendmsg',
+    47: 'recvmsg', 61: 'wait4', 72: 'fcntl', 73: 'flock', 74: 'fsync', 75: 'fdatasync', 128: 'rt_sigtimedwait',
+    130: 'rt_sigsuspend', 202: 'futex', 208: 'io_getevents', 219: 'restart_syscall', 230: 'clock_nanosleep',
+    232: 'epoll_wait', 257: 'openat', 270: 'pselect6', 271: 'ppoll', 281: 'epoll_pwait', 288: 'accept4',
+    295: 'preadv', 296: 'pwritev', 299: 'recvmmsg', 307: 'sendmmsg', 426: 'io_uring_enter', 441: 'epoll_pwait2',
+    449: 'futex_waitv',
+}
+_SYSCALL_NAMES = {'x86_64': _X86_64_SYSCALLS}.get(platform.machine(), {})
+_READ_SIZE = 1024
+
+
+def syscall_name(syscall: str) -> str:
+    """
+    将/proc/$pid/syscall的第一个字段转换为系统调用名：running表示正在用户态运行，-1表示不在系统调用中
+    """
+    if not syscall.lstrip('-').isdigit():
+        return syscall
+    nr = int(syscall)
+    if nr < 0:
+        return '-'
+    return _SYSCALL_NAMES.get(nr, syscall)
+
+
+class _TaskFiles(object):
+    # 一个线程的采样文件，fd保持打开，每次采样各一次pread
+    __slots__ = ('pid', 'tid', 'stat_fd', 'wchan_fd', 'syscall_fd')
+
+    def __init__(self, pid: int, tid: int, task_dir: str, read_syscall: bool):
+        self.pid = pid
+        self.tid = tid
+        self.stat_fd = os.open(os.path.join(task_dir, 'stat'), os.O_RDONLY)
+        self.wchan_fd = self._try_open(os.path.join(task_dir, 'wchan'))
+        # syscall需要ptrace权限，无权限时不采集
+        self.syscall_fd = self._try_open(os.path.join(task_dir, 'syscall')) if read_syscall else None
+
+    @staticmethod
+    def _try_open(path: str) -> Optional[int]:
+        try:
+            return os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+
+    def sample(self) -> Tuple[bytes, bytes, bytes]:
+        stat = os.pread(self.stat_fd, _READ_SIZE, 0)
+        if len(stat) == 0:
+            raise ProcessLookupError(f"task {self.tid} exited")
+        pos = stat.rfind(b')')
+        state = stat[pos + 2:pos + 3]
+        wchan = os.pread(self.wchan_fd, _READ_SIZE, 0) if self.wchan_fd is not None else b'?'
+        if self.syscall_fd is not None:
+            syscall = os.pread(self.syscall_fd, _READ_SIZE, 0)
+            syscall = syscall[:syscall.find(b' ')] if b' ' in syscall else syscall.strip()
+        else:
+            syscall = b'?'
+        return state, wchan, syscall
+
+    def close(self) -> None:
+        for fd in (self.stat_fd, self.wchan_fd, self.syscall_fd):
+            if fd is not None:
+                os.close(fd)
+
+
+class WaitStateSampler(threading.Thread):
+    """
+    高频采样观测进程各线程的状态、wchan（内核中等待的函数）和当前的系统调用，统计(状态, wchan, 系统调用)的分布，
+    用于定位进程在D状态、锁等待等情况下阻塞在何处（简易的off-CPU剖析）。
+    每个线程的stat、wchan、syscall文件在线程存活期间保持打开，采样只需pread；
+    计数保存在预先分配的计数数组中，最多max_keys种组合，超出的样本计入dropped。
+    线程列表每rescan秒重新扫描一次。内核限制kallsyms时wchan为0，无ptrace权限时syscall为?。
+    """
+
+    def __init__(self, pids: Iterable[int] = (), hz: float = 100, read_syscall: bool = True, max_keys: int = 4096,
+                 rescan: float = 1.0, base_dir: str = '/proc/'):
+        super().__init__(daemon=True)
+        self.name = "pidstat_wait_sampler"
+        self.period = 1.0 / hz
+        self.read_syscall = read_syscall
+        self.max_keys = max_keys
+        self.rescan = rescan
+        self._base_dir = base_dir
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pids: List[int] = list(pids)
+        self._pids_changed = True
+        self._tasks: Dict[int, _TaskFiles] = {}
+
+        # key为(tid, state, wchan, syscall)，value为计数数组中的下标
+        self._slots: Dict[Tuple[int, bytes, bytes, bytes], int] = {}
+        self._counts = array('L', bytes(array('L').itemsize * max_keys))
+        # 每个线程的采样次数
+        self._task_samples: Dict[int, int] = {}
+        self._tid_pid: Dict[int, int] = {}
+        self._dropped = 0
+        self._interval_start = time.time()
+        self.stats = {'ticks': 0, 'samples': 0, 'overruns': 0, 'threads': 0, 'sample_us': 0.0}
+
+    def set_pids(self, pids: Iterable[int]) -> None:
+        pids = list(pids)
+        with self._lock:
+            if pids != self._pids:
+                self._pids = pids
+                self._pids_changed = True
+
+    def _scan_tasks(self) -> None:
+        # 为新线程打开文件，关闭已退出或不再观测的线程的文件
+        with self._lock:
+            pids = list(self._pids)
+            self._pids_changed = False
+        alive = set()
+        for pid in pids:
+            task_root = os.path.join(self._base_dir, str(pid), 'task')
+            try:
+                tids = [int(tid) for tid in os.listdir(task_root) if tid.isdigit()]
+            except OSError:
+                continue
+            for tid in tids:
+                alive.add(tid)
+                if tid not in self._tasks:
+                    try:
+                        self._tasks[tid] = _TaskFiles(pid, tid, os.path.join(task_root, str(tid)), self.read_syscall)
+                    except OSError:
+                        alive.discard(tid)
+        for tid in [tid for tid in self._tasks.keys() if tid not in alive]:
+            self._tasks.pop(tid).close()
+        self.stats['threads'] = len(self._tasks)
+
+    def _sample_once(self) -> None:
+        exited = []
+        with self._lock:
+            for tid, task in self._tasks.items():
+                try:
+                    state, wchan, syscall = task.sample()
+                except OSError:
+                    exited.append(tid)
+                    continue
+                key = (tid, state, wchan, syscall)
+                slot = self._slots.get(key)
+                if slot is None:
+                    if len(self._slots) >= self.max_keys:
+                        self._dropped += 1
+                        continue
+                    slot = len(self._slots)
+                    self._slots[key] = slot
+                    self._tid_pid[tid] = task.pid
+                self._counts[slot] += 1
+                self._task_samples[tid] = self._task_samples.get(tid, 0) + 1
+            self.stats['samples'] += len(self._tasks) - len(exited)
+        for tid in exited:
+            self._tasks.pop(tid).close()
+
+    def run(self):
+        next_tick = time.monotonic()
+        next_scan = next_tick
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                if now >= next_scan or self._pids_changed:
+                    self._scan_tasks()
+                    next_scan = now + self.rescan
+                start = time.monotonic()
+                self._sample_once()
+                elapsed = time.monotonic() - start
+                self.stats['ticks'] += 1
+                # 每次采样耗时的指数移动平均
+                self.stats['sample_us'] = self.stats['sample_us'] * 0.9 + elapsed * 1e6 * 0.1
+                next_tick += self.period
+                delay = next_tick - time.monotonic()
+                if delay < 0:
+                    # 采样耗时超过周期，跳过错过的采样点
+                    self.stats['overruns'] += 1
+                    next_tick = time.monotonic()
+                    continue
+                self._stop_event.wait(delay)
+        finally:
+            for task in self._tasks.values():
+                task.close()
+            self._tasks.clear()
+
+    def pop_histogram(self) -> Dict:
+        """
+        返回上次调用以来的分布，并清零计数
+        Returns:
+            返回start、end、dropped，以及entries：每项包括pid、tid、state、wchan、syscall、count、
+            以及pct（占该线程采样次数的百分比），按count降序排列
+        """
+        with self._lock:
+            slots, counts = self._slots, self._counts
+            task_samples, tid_pid, dropped = self._task_samples, self._tid_pid, self._dropped
+            entries = []
+            for (tid, state, wchan, syscall), slot in slots.items():
+                count = counts[slot]
+                entries.append({'pid': tid_pid[tid], 'tid': tid, 'state': state.decode(),
+                                'wchan': wchan.decode(errors='replace').strip(),
+                                'syscall': syscall_name(syscall.decode(errors='replace')),
+                                'count': count, 'pct': count * 100.0 / task_samples[tid]})
+                counts[slot] = 0
+            self._slots = {}
+            self._task_samples = {}
+            self._tid_pid = {}
+            self._dropped = 0
+            start, self._interval_start = self._interval_start, time.time()
+        entries.sort(key=lambda entry: entry['count'], reverse=True)
+        return {'start': start, 'end': self._interval_start, 'dropped': dropped, 'entries': entries}
+
+    @staticmethod
+    def summarize(entries: List[Dict], states: Optional[Iterable[str]] = None) -> Dict[int, List[Dict]]:
+        """
+        按进程汇总分布：合并同一进程各线程相同的(state, wchan, syscall)，pct为占该进程所有线程采样次数的百分比
+        Args:
+            entries: pop_histogram返回的entries
+            states: 只保留的线程状态，如('D', 'S')，None为全部
+        """
+        totals: Dict[int, int] = {}
+        merged: Dict[Tuple[int, str, str, str], int] = {}
+        for entry in entries:
+            totals[entry['pid']] = totals.get(entry['pid'], 0) + entry['count']
+            if states is not None and entry['state'] not in states:
+                continue
+            key = (entry['pid'], entry['state'], entry['wchan'], entry['syscall'])
+            merged[key] = merged.get(key, 0) + entry['count']
+        result: Dict[int, List[Dict]] = {}
+        for (pid, state, wchan, syscall), count in sorted(merged.items(), key=lambda item: -item[1]):
+            result.setdefault(pid, []).append({'state': state, 'wchan': wchan, 'syscall': syscall, 'count': count,
+                                               'pct': count * 100.0 / totals[pid]})
+        return result
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, sample_us=round(self.stats['sample_us'], 1), keys=len(self._slots),
+                        dropped=self._dropped)
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -1,3 +1,5 @@
 
 from .net_cap import ThreadNetCap, NetCapStat, ProcNetStat
+from .sampling import PacketSampler
 from .dev import all_interfaces as get_dev_interface
+from .dev import InterfaceRegistry, get_interfaces, resolve_devs, is_all_devs
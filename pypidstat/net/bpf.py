@@ -0,0 +1,130 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: bpf.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 11:05
+"""
+import ctypes
+import ctypes.util
+import functools
+import socket
+import struct
+from typing import Iterable, Optional, Set, Tuple
+
+# 始终放行SYN报文，保证新建立的连接可以触发按需定位
+BPF_SYN_EXP = 'tcp[tcpflags] & tcp-syn != 0'
+ANY_ADDR = '0.0.0.0'
+
+
+def get_conn_local_endpoint(conn_key: str) -> Tuple[str, int]:
+    """
+    返回conn_key（local_ip:local_port-remote_ip:remote_port）中本地的地址和端口
+    """
+    local_ip, local_port = conn_key.split('-', 1)[0].rsplit(':', 1)
+    return local_ip, int(local_port)
+
+
+def gen_bpf_filter(endpoints: Iterable[Tuple[str, int]], user_filter: Optional[str] = None,
+                   max_terms: int = 64) -> str:
+    """
+    根据观测连接的本地地址和端口生成BPF过滤表达式。条件数量超过max_terms时逐级降级：
+    地址+端口 -> 仅端口 -> 仅地址 -> 仅tcp。生成的表达式与用户指定的过滤表达式取交集
+    Args:
+        endpoints: 本地的(ip, port)集合，包含已建立连接和监听的端口，ip为0.0.0.0表示任意地址
+        user_filter: 用户指定的过滤表达式
+        max_terms: 表达式中最多的条件数量
+
+    Returns:
+        返回BPF过滤表达式
+    """
+    endpoints: Set[Tuple[str, int]] = set(endpoints)
+
+    terms = sorted(f'port {port}' if ip == ANY_ADDR else f'(host {ip} and port {port})' for ip, port in endpoints)
+    if len(terms) > max_terms:
+        terms = sorted(f'port {port}' for port in {port for _, port in endpoints})
+    if len(terms) > max_terms:
+        hosts = {ip for ip, _ in endpoints}
+        terms = sorted(f'host {ip}' for ip in hosts) if ANY_ADDR not in hosts else []
+    if len(terms) > max_terms:
+        terms = []
+
+    if len(endpoints) > 0 and len(terms) == 0:
+        # 无法精确表达时只过滤tcp
+        auto_exp = 'tcp'
+    else:
+        auto_exp = f"tcp and ({' or '.join([BPF_SYN_EXP] + terms)})"
+
+    if user_filter is not None and user_filter.strip() != '':
+        return f'({user_filter}) and ({auto_exp})'
+    return auto_exp
+
+
+# linux/filter.h、asm-generic/socket.h
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+DLT_EN10MB = 1
+PCAP_NETMASK_UNKNOWN = 0xffffffff
+
+
+class _BpfProgram(ctypes.Structure):
+    _fields_ = [('bf_len', ctypes.c_uint), ('bf_insns', ctypes.c_void_p)]
+
+
+@functools.lru_cache(maxsize=1)
+def _load_libpcap() -> ctypes.CDLL:
+    lib_path = ctypes.util.find_library('pcap')
+    if lib_path is None:
+        raise Exception("libpcap is not found, can't compile the BPF filter expression")
+    libpcap = ctypes.CDLL(lib_path)
+    libpcap.pcap_open_dead.restype = ctypes.c_void_p
+    libpcap.pcap_open_dead.argtypes = [ctypes.c_int, ctypes.c_int]
+    libpcap.pcap_compile.argtypes = [ctypes.c_void_p, ctypes.POINTER(_BpfProgram), ctypes.c_char_p, ctypes.c_int,
+                                     ctypes.c_uint]
+    libpcap.pcap_geterr.restype = ctypes.c_char_p
+    libpcap.pcap_geterr.argtypes = [ctypes.c_void_p]
+    libpcap.pcap_freecode.argtypes = [ctypes.POINTER(_BpfProgram)]
+    libpcap.pcap_close.argtypes = [ctypes.c_void_p]
+    return libpcap
+
+
+def compile_bpf(filter_exp: str, snaplen: int = 65535) -> bytes:
+    """
+    使用libpcap将BPF过滤表达式编译为以太网帧的BPF指令
+    Args:
+        filter_exp: BPF过滤表达式
+        snaplen: 抓包长度
+
+    Returns:
+        返回struct sock_filter数组的字节内容，每条指令8个字节
+    """
+    libpcap = _load_libpcap()
+    handle = libpcap.pcap_open_dead(DLT_EN10MB, snaplen)
+    prog = _BpfProgram()
+    try:
+        if libpcap.pcap_compile(handle, ctypes.byref(prog), filter_exp.encode(), 1, PCAP_NETMASK_UNKNOWN) != 0:
+            raise Exception(f"BPF filter expression is invalid: {libpcap.pcap_geterr(handle).decode()}")
+        insns = ctypes.string_at(prog.bf_insns, prog.bf_len * 8)
+        libpcap.pcap_freecode(ctypes.byref(prog))
+        return insns
+    finally:
+        libpcap.pcap_close(handle)
+
+
+def attach_bpf(sock: socket.socket, filter_exp: Optional[str]) -> None:
+    """
+    将BPF过滤表达式设置到套接字上（SO_ATTACH_FILTER），filter_exp为空时清除过滤
+    """
+    if filter_exp is None or filter_exp.strip() == '':
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+        except OSError:
+            # 未设置过滤
+            pass
+        return
+
+    insns = ctypes.create_string_buffer(compile_bpf(filter_exp))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack('HL', len(insns.raw) // 8, ctypes.addressof(insns))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
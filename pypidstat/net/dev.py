@@ -6,12 +6,22 @@
 @Author: thirsd@sina.com
 @Date: 2024/5/3 11:40
 """
+import errno
 import socket
 import fcntl
+import functools
+import os
 import struct
 import array
 import sys
-from typing import Dict
+import threading
+from typing import Dict, List, Optional, Union
+
+# linux/sockios.h
+SIOCGIFCONF = 0x8912
+SIOCGIFNETMASK = 0x891b
+SIOCGIFBRDADDR = 0x8919
+SIOCGIFHWADDR = 0x8927
 
 
 def all_interfaces() -> Dict[str, Dict]:
@@ -19,38 +29,233 @@ def all_interfaces() -> Dict[str, Dict]:
     struct_size = 40 if is_64bits else 32
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     max_possible = 8  # initial value
-    while True:
-        _bytes = max_possible * struct_size
-        names = array.array('B')
-        for i in range(0, _bytes):
-            names.append(0)
-        out_bytes = struct.unpack('iL', fcntl.ioctl(
-            s.fileno(),
-            0x8912,  # SIOCGIFCONF
-            struct.pack('iL', _bytes, names.buffer_info()[0])
-        ))[0]
-        if out_bytes == _bytes:
-            max_possible *= 2
-        else:
-            break
-    name_str = names.tostring()
-    ifaces = {}
-    for i in range(0, out_bytes, struct_size):
-        iface_name = bytes.decode(name_str[i:i + 16]).split('\0', 1)[0]
-        # iface_addr = socket.inet_ntoa(name_str[i + 20:i + 24])
-
-        bytes_iface_name = iface_name.encode()
-
-        ip = socket.inet_ntoa(
-            fcntl.ioctl(s.fileno(), 0x8915, struct.pack('256s', bytes_iface_name))[20:24])  # SIOCGIFADDR
-        netmask = socket.inet_ntoa(
-            fcntl.ioctl(s.fileno(), 0x891b, struct.pack('256s', bytes_iface_name))[20:24])  # SIOCGIFNETMASK
-        broadcast = socket.inet_ntoa(
-            fcntl.ioctl(s.fileno(), 0x8919, struct.pack('256s', bytes_iface_name))[20:24])  # SIOCGIFBRDADDR
-        hwaddr = fcntl.ioctl(s.fileno(), 0x8927, struct.pack('256s', bytes_iface_name))[18:24].hex()
-        hwaddr = ':'.join([hwaddr[i:i + 2] for i in range(0, len(hwaddr), 2)])
-
-        ifaces[iface_name] = {'name': iface_name, 'hwaddr': hwaddr, 'addr': ip, 'netmask': netmask,
-                              'broadcast': broadcast}
+    try:
+        while True:
+            _bytes = max_possible * struct_size
+            names = array.array('B', bytes(_bytes))
+            out_bytes = struct.unpack('iL', fcntl.ioctl(
+                s.fileno(),
+                SIOCGIFCONF,
+                struct.pack('iL', _bytes, names.buffer_info()[0])
+            ))[0]
+            if out_bytes == _bytes:
+                max_possible *= 2
+            else:
+                break
+        name_str = names.tobytes()
+        ifaces = {}
+        for i in range(0, out_bytes, struct_size):
+            iface_name = bytes.decode(name_str[i:i + 16]).split('\0', 1)[0]
+            # SIOCGIFCONF的结果中已包含接口地址，无需再通过SIOCGIFADDR获取
+            ip = socket.inet_ntoa(name_str[i + 20:i + 24])
+
+            ifreq = struct.pack('256s', iface_name.encode())
+            netmask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFNETMASK, ifreq)[20:24])
+            broadcast = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFBRDADDR, ifreq)[20:24])
+            hwaddr = ':'.join(f'{b:02x}' for b in fcntl.ioctl(s.fileno(), SIOCGIFHWADDR, ifreq)[18:24])
+
+            ifaces[iface_name] = {'name': iface_name, 'hwaddr': hwaddr, 'addr': ip, 'netmask': netmask,
+                                  'broadcast': broadcast}
+    finally:
+        s.close()
 
     return ifaces
+
+
+# linux/netlink.h、linux/rtnetlink.h、linux/if_link.h、linux/if_addr.h
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK, RTM_DELLINK, RTM_GETLINK = 16, 17, 18
+RTM_NEWADDR, RTM_DELADDR, RTM_GETADDR = 20, 21, 22
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+IFLA_ADDRESS, IFLA_IFNAME, IFLA_MASTER = 1, 3, 10
+IFA_ADDRESS, IFA_LOCAL = 1, 2
+IFF_UP, IFF_LOOPBACK = 0x1, 0x8
+
+_NLMSG_HDR = struct.Struct('=IHHII')
+_RTATTR_HDR = struct.Struct('=HH')
+# struct ifinfomsg: family, pad, type, index, flags, change
+_IFINFOMSG = struct.Struct('=BBHiII')
+# struct ifaddrmsg: family, prefixlen, flags, scope, index
+_IFADDRMSG = struct.Struct('=BBBBi')
+
+
+def _parse_rtattrs(data: bytes, offset: int, end: int) -> Dict[int, bytes]:
+    attrs = {}
+    while offset + _RTATTR_HDR.size <= end:
+        attr_len, attr_type = _RTATTR_HDR.unpack_from(data, offset)
+        if attr_len < _RTATTR_HDR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR_HDR.size:offset + attr_len]
+        offset += (attr_len + 3) & ~3
+    return attrs
+
+
+class InterfaceRegistry(object):
+    """
+    网卡信息的缓存。初始化时通过NETLINK_ROUTE导出所有链路和地址，之后订阅链路和地址变化的消息增量更新，
+    不再对每块网卡重复调用ioctl。poll_events为非阻塞调用，可在每个统计周期调用一次。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key为接口的index
+        self._links: Dict[int, Dict] = {}
+        self._seq = 0
+        self._dump_sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self._event_sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self._event_sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        self._event_sock.setblocking(False)
+        # 先订阅再导出，导出期间发生的变化会在下一次poll_events时处理
+        self._dump(RTM_GETLINK, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0))
+        self._dump(RTM_GETADDR, _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+
+    def _dump(self, msg_type: int, payload: bytes) -> None:
+        self._seq += 1
+        self._dump_sock.send(_NLMSG_HDR.pack(_NLMSG_HDR.size + len(payload), msg_type, NLM_F_REQUEST | NLM_F_DUMP,
+                                             self._seq, 0) + payload)
+        while True:
+            if self._handle(self._dump_sock.recv(1 << 16)):
+                return
+
+    def _handle(self, data: bytes) -> bool:
+        """
+        处理一批netlink消息
+        Returns:
+            是否收到导出结束的消息
+        """
+        offset = 0
+        while offset + _NLMSG_HDR.size <= len(data):
+            msg_len, msg_type, _, _, _ = _NLMSG_HDR.unpack_from(data, offset)
+            if msg_len < _NLMSG_HDR.size:
+                break
+            body, end = offset + _NLMSG_HDR.size, offset + msg_len
+            if msg_type == NLMSG_DONE:
+                return True
+            if msg_type == NLMSG_ERROR:
+                err = -struct.unpack_from('=i', data, body)[0]
+                raise OSError(err, f"rtnetlink dump failed: {os.strerror(err)}")
+            with self._lock:
+                if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                    self._handle_link(msg_type, data, body, end)
+                elif msg_type in (RTM_NEWADDR, RTM_DELADDR):
+                    self._handle_addr(msg_type, data, body, end)
+            offset += (msg_len + 3) & ~3
+        return False
+
+    def _handle_link(self, msg_type: int, data: bytes, body: int, end: int) -> None:
+        _, _, _, index, flags, _ = _IFINFOMSG.unpack_from(data, body)
+        if msg_type == RTM_DELLINK:
+            self._links.pop(index, None)
+            return
+        attrs = _parse_rtattrs(data, body + _IFINFOMSG.size, end)
+        link = self._links.setdefault(index, {'index': index, 'addrs': []})
+        if IFLA_IFNAME in attrs:
+            link['name'] = attrs[IFLA_IFNAME].split(b'\0', 1)[0].decode()
+        link['hwaddr'] = ':'.join(f'{b:02x}' for b in attrs.get(IFLA_ADDRESS, b''))
+        link['flags'] = flags
+        link['up'] = bool(flags & IFF_UP)
+        link['loopback'] = bool(flags & IFF_LOOPBACK)
+        # bond、bridge的从属接口，其流量在主接口上同样可以抓到
+        link['master'] = struct.unpack('=I', attrs[IFLA_MASTER])[0] if IFLA_MASTER in attrs else None
+
+    def _handle_addr(self, msg_type: int, data: bytes, body: int, end: int) -> None:
+        family, prefix_len, _, _, index = _IFADDRMSG.unpack_from(data, body)
+        link = self._links.get(index)
+        if link is None:
+            return
+        attrs = _parse_rtattrs(data, body + _IFADDRMSG.size, end)
+        raw_addr = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        if raw_addr is None:
+            return
+        addr = (socket.inet_ntop(family, raw_addr), prefix_len)
+        if msg_type == RTM_DELADDR:
+            if addr in link['addrs']:
+                link['addrs'].remove(addr)
+        elif addr not in link['addrs']:
+            link['addrs'].append(addr)
+
+    def poll_events(self) -> bool:
+        """
+        非阻塞地处理已到达的链路和地址变化消息
+        Returns:
+            是否有变化
+        """
+        changed = False
+        while True:
+            try:
+                data = self._event_sock.recv(1 << 16)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # 消息过多导致接收缓冲区溢出，丢失了部分变化，重新导出
+                with self._lock:
+                    self._links.clear()
+                self._dump(RTM_GETLINK, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0))
+                self._dump(RTM_GETADDR, _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+                changed = True
+                continue
+            self._handle(data)
+            changed = True
+
+    def get_interfaces(self) -> Dict[str, Dict]:
+        """
+        返回所有网卡的信息，key为网卡名，value包括index、hwaddr、flags、up、loopback、master、addrs[(地址, 前缀长度)]
+        """
+        self.poll_events()
+        with self._lock:
+            return {link['name']: {**link, 'addrs': list(link['addrs'])}
+                    for link in self._links.values() if 'name' in link}
+
+    def resolve_devs(self, dev_spec: Union[str, List[str], None]) -> List[str]:
+        """
+        解析需要抓包的网卡
+        Args:
+            dev_spec: 以逗号分割的网卡名或网卡名列表；all表示所有已启用且不从属于其他接口的网卡（包括lo）；
+                      None表示第一块已启用的非lo网卡
+
+        Returns:
+            返回网卡名列表
+        """
+        ifaces = self.get_interfaces()
+        if dev_spec is None:
+            devs = [name for name, iface in sorted(ifaces.items(), key=lambda x: x[1]['index'])
+                    if iface['up'] and not iface['loopback']][:1]
+        elif isinstance(dev_spec, str) and dev_spec.strip() == 'all':
+            devs = [name for name, iface in sorted(ifaces.items(), key=lambda x: x[1]['index'])
+                    if iface['up'] and iface['master'] is None]
+        else:
+            names = dev_spec.split(',') if isinstance(dev_spec, str) else dev_spec
+            devs = [name.strip() for name in names if name.strip() != '']
+            unknown = [name for name in devs if name not in ifaces]
+            if len(unknown) > 0:
+                raise Exception(f"network interface is not found: {','.join(unknown)}")
+        return devs
+
+    def close(self) -> None:
+        self._dump_sock.close()
+        self._event_sock.close()
+
+
+@functools.lru_cache(maxsize=1)
+def get_interface_registry() -> InterfaceRegistry:
+    # 进程内共享同一个网卡信息缓存
+    return InterfaceRegistry()
+
+
+def resolve_devs(dev_spec: Union[str, List[str], None]) -> List[str]:
+    return get_interface_registry().resolve_devs(dev_spec)
+
+
+def get_interfaces() -> Dict[str, Dict]:
+    return get_interface_registry().get_interfaces()
+
+
+def is_all_devs(dev_spec: Optional[Union[str, List[str]]]) -> bool:
+    return isinstance(dev_spec, str) and dev_spec.strip() == 'all'
@@ -0,0 +1,206 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: fanout.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 13:10
+"""
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from queue import Queue, Empty
+from typing import Dict, List, Optional
+
+import pcap
+
+from pypidstat.net.flow_cache import FlowNegativeCache, parse_raw_tcp, parse_flow_key
+from pypidstat.net.sampling import PacketSampler
+
+# linux/if_packet.h
+SOL_PACKET = 263
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+
+
+def _accumulate_flow(flows: Dict[bytes, List[int]], cap_raw: bytes, sampler: Optional[PacketSampler] = None) -> None:
+    """
+    将一个以太网帧按流汇总到flows中，value为[包数, 字节数, TCP标志位, 采样包数]，采样时包数和字节数按采样率放大
+    """
+    parsed = parse_raw_tcp(cap_raw)
+    if parsed is None:
+        return
+    flow_key, tcp_len, tcp_flags = parsed
+    scale = 1
+    if sampler is not None:
+        if not sampler.accept(flow_key):
+            return
+        scale = sampler.rate
+    flow = flows.get(flow_key)
+    if flow is None:
+        flows[flow_key] = [scale, tcp_len * scale, tcp_flags, 1]
+    else:
+        flow[0] += scale
+        flow[1] += tcp_len * scale
+        flow[2] |= tcp_flags
+        flow[3] += 1
+
+
+def _fanout_worker(dev: str, filter_exp: Optional[str], fanout_group: int, result_queue: multiprocessing.Queue,
+                   ctrl_queue: multiprocessing.Queue, stop_event, flush_interval: float,
+                   sampler_config: Optional[Dict] = None):
+    """
+    抓包子进程：加入同一网卡的PACKET_FANOUT组（按流哈希，同一个流始终由同一个子进程处理），
+    在本进程内按流汇总包数和字节数，每隔flush_interval秒将增量发送给统计线程
+    Args:
+        dev: 抓包的网卡
+        filter_exp: BPF过滤表达式
+        fanout_group: PACKET_FANOUT的组ID
+        result_queue: 发送流量增量的队列，每项为[(flow_key, pkt_cnt, byte_cnt, tcp_flags, sample_cnt), ...]；
+            启用采样时同时发送('sampling', 子进程名, 采样器统计)，子进程异常退出时发送('error', 异常信息)
+        ctrl_queue: 接收控制指令的队列，目前仅有('filter', filter_exp)
+        stop_event: 退出标志
+        flush_interval: 发送增量的间隔（秒）
+        sampler_config: 报文采样器的参数，为None时处理全部报文；各子进程独立采样
+    """
+    try:
+        _run_fanout_worker(dev, filter_exp, fanout_group, result_queue, ctrl_queue, stop_event, flush_interval,
+                           sampler_config)
+    except Exception as e:
+        result_queue.put(('error', f"{multiprocessing.current_process().name}: {type(e).__name__}: {e}"))
+
+
+def _run_fanout_worker(dev: str, filter_exp: Optional[str], fanout_group: int, result_queue: multiprocessing.Queue,
+                       ctrl_queue: multiprocessing.Queue, stop_event, flush_interval: float,
+                       sampler_config: Optional[Dict]):
+    cap = pcap.pcap(dev, promisc=False, immediate=False, timeout_ms=50)
+    try:
+        if filter_exp is not None:
+            cap.setfilter(filter_exp)
+        # libpcap在Linux下的描述符即为AF_PACKET套接字，直接在其上加入fanout组
+        fanout_sock = socket.fromfd(cap.fileno(), socket.AF_PACKET, socket.SOCK_RAW)
+        fanout_sock.setsockopt(SOL_PACKET, PACKET_FANOUT,
+                               fanout_group | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16))
+
+        sampler = PacketSampler(**sampler_config) if sampler_config is not None else None
+        flows: Dict[bytes, List[int]] = {}
+
+        def on_packet(cap_time, cap_raw):
+            _accumulate_flow(flows, cap_raw, sampler)
+
+        next_flush = time.monotonic() + flush_interval
+        while not stop_event.is_set():
+            cap.dispatch(-1, on_packet)
+
+            now = time.monotonic()
+            if now < next_flush:
+                continue
+            next_flush = now + flush_interval
+            if len(flows) > 0:
+                result_queue.put([tuple([flow_key] + flow) for flow_key, flow in flows.items()])
+                flows.clear()
+            if sampler is not None:
+                result_queue.put(('sampling', multiprocessing.current_process().name, sampler.get_stats()))
+            try:
+                cmd, value = ctrl_queue.get_nowait()
+                if cmd == 'filter':
+                    cap.setfilter(value if value is not None else '')
+            except Empty:
+                pass
+    finally:
+        cap.close()
+
+
+class FanoutNetCap(threading.Thread):
+    """
+    多进程抓包：在同一网卡上启动workers个子进程组成PACKET_FANOUT组，各子进程按流汇总后发送增量，
+    本线程负责接收增量并转换为与ThreadNetCap相同格式的记录放入统计队列。
+    """
+
+    def __init__(self, dev: str, queue: Queue, filter_exp: str = None, name: str = None,
+                 neg_cache: Optional[FlowNegativeCache] = None, workers: int = 2, flush_interval: float = 0.5,
+                 fanout_group: Optional[int] = None, sampler: Optional[PacketSampler] = None):
+        super().__init__()
+        self.daemon = True
+        if name is not None:
+            self.name = name
+
+        if queue is None:
+            raise Exception("FanoutNetCap's args is invalid, queue is None")
+        self._queue = queue
+        self._dev = dev
+        self._filter_exp = filter_exp
+        self._neg_cache = neg_cache
+
+        self.run_flag = True
+        # 子进程异常退出的信息
+        self._errors: List[str] = []
+        # 各子进程采样器最近一次的统计，key为子进程名
+        self._sampling_stats: Dict[str, Dict] = {}
+
+        self._result_queue = multiprocessing.Queue()
+        self._stop_event = multiprocessing.Event()
+        fanout_group = fanout_group if fanout_group is not None else os.getpid() & 0xffff
+        sampler_config = sampler.get_config() if sampler is not None else None
+        self._ctrl_queues = [multiprocessing.Queue() for _ in range(workers)]
+        self._workers = [multiprocessing.Process(target=_fanout_worker, daemon=True,
+                                                 name=f"pidstat_fanout_{i}",
+                                                 args=(dev, filter_exp, fanout_group, self._result_queue,
+                                                       ctrl_queue, self._stop_event, flush_interval, sampler_config))
+                         for i, ctrl_queue in enumerate(self._ctrl_queues)]
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+        super().start()
+
+    def run(self):
+        neg_cache = self._neg_cache
+        while self.run_flag:
+            try:
+                flow_deltas = self._result_queue.get(timeout=1)
+            except Empty:
+                continue
+            if isinstance(flow_deltas, tuple):
+                if flow_deltas[0] == 'sampling':
+                    self._sampling_stats[flow_deltas[1]] = flow_deltas[2]
+                    continue
+                # 子进程异常退出，记录并输出原因，其余子进程继续抓包
+                self._errors.append(flow_deltas[1])
+                print(f"fanout capture on {self._dev} failed, {flow_deltas[1]}", file=sys.stderr)
+                continue
+
+            cap_time = time.time()
+            for flow_key, pkt_cnt, byte_cnt, tcp_flags, sample_cnt in flow_deltas:
+                if neg_cache is not None and neg_cache.contains(flow_key, cap_time):
+                    continue
+                src_ip, src_port, dst_ip, dst_port = parse_flow_key(flow_key)
+                self._queue.put((cap_time, src_ip, src_port, dst_ip, dst_port, byte_cnt, tcp_flags, flow_key,
+                                 pkt_cnt, sample_cnt))
+
+    def set_filter(self, filter_exp: Optional[str]) -> None:
+        for ctrl_queue in self._ctrl_queues:
+            ctrl_queue.put(('filter', filter_exp))
+        self._filter_exp = filter_exp
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = {'workers': sum(1 for worker in self._workers if worker.is_alive()), 'errors': len(self._errors)}
+        if len(self._errors) > 0:
+            stats['last_error'] = self._errors[-1]
+        return stats
+
+    def get_sampling_stats(self) -> List[Dict]:
+        # 各子进程采样器的统计
+        return list(self._sampling_stats.values())
+
+    def stop(self) -> None:
+        self.run_flag = False
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
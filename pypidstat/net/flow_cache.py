@@ -0,0 +1,142 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: flow_cache.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 10:20
+"""
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# 以太网帧中IPv4报文的类型及IP头中TCP的协议号
+_ETH_TYPE_IP = b'\x08\x00'
+_IP_PROTO_TCP = 6
+_ETH_HDR_LEN = 14
+
+
+def get_raw_flow_key(raw: bytes) -> Optional[bytes]:
+    """
+    直接从以太网帧的原始字节中提取流的key，不构造任何解析对象。
+    key为源IP(4字节) + 目的IP(4字节) + 源端口(2字节) + 目的端口(2字节)
+    Args:
+        raw: 抓包得到的以太网帧
+
+    Returns:
+        返回流的key，非以太网IPv4的TCP报文（如带VLAN标签）返回None
+    """
+    if len(raw) < 38 or raw[12:14] != _ETH_TYPE_IP or raw[23] != _IP_PROTO_TCP:
+        return None
+    tcp_offset = _ETH_HDR_LEN + (raw[14] & 0x0f) * 4
+    return raw[26:34] + raw[tcp_offset:tcp_offset + 4]
+
+
+def parse_raw_tcp(raw: bytes) -> Optional[Tuple[bytes, int, int]]:
+    """
+    解析以太网帧中IPv4的TCP报文头，仅读取长度、地址、端口和标志位
+    Args:
+        raw: 抓包得到的以太网帧
+
+    Returns:
+        返回(flow_key, tcp_len, tcp_flags)，tcp_len为TCP头及负载的长度；非以太网IPv4的TCP报文返回None
+    """
+    if len(raw) < 38 or raw[12:14] != _ETH_TYPE_IP or raw[23] != _IP_PROTO_TCP:
+        return None
+    ip_hdr_len = (raw[14] & 0x0f) * 4
+    tcp_offset = _ETH_HDR_LEN + ip_hdr_len
+    if len(raw) < tcp_offset + 14:
+        return None
+    ip_len = (raw[16] << 8) | raw[17]
+    return raw[26:34] + raw[tcp_offset:tcp_offset + 4], ip_len - ip_hdr_len, raw[tcp_offset + 13]
+
+
+def make_flow_key(src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> bytes:
+    return socket.inet_aton(src_ip) + socket.inet_aton(dst_ip) + struct.pack('!HH', src_port, dst_port)
+
+
+def reverse_flow_key(flow_key: bytes) -> bytes:
+    return flow_key[4:8] + flow_key[0:4] + flow_key[10:12] + flow_key[8:10]
+
+
+def parse_flow_key(flow_key: bytes) -> Tuple[str, int, str, int]:
+    """
+    将流的key解析为(src_ip, src_port, dst_ip, dst_port)
+    """
+    src_port, dst_port = struct.unpack_from('!HH', flow_key, 8)
+    return socket.inet_ntoa(flow_key[0:4]), src_port, socket.inet_ntoa(flow_key[4:8]), dst_port
+
+
+def conn_key_to_flow_key(conn_key: str) -> bytes:
+    """
+    将conn_key（src_ip:src_port-dst_ip:dst_port）转换为流的key
+    """
+    local_addr, remote_addr = conn_key.split('-', 1)
+    local_ip, local_port = local_addr.rsplit(':', 1)
+    remote_ip, remote_port = remote_addr.rsplit(':', 1)
+    return make_flow_key(local_ip, int(local_port), remote_ip, int(remote_port))
+
+
+class FlowNegativeCache(object):
+    """
+    不属于观测进程的流的缓存，抓包线程在解析报文前即可丢弃这些流量。
+    缓存项有TTL，超过容量时淘汰最早加入的项。统计线程负责写入和失效，多个抓包线程查询时会删除过期项，
+    因此所有读写都在锁内进行。
+    """
+
+    def __init__(self, maxsize: int = 65536, ttl: float = 5.0):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        # key为流的key，value为过期时间
+        self._flows: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def contains(self, flow_key: bytes, now: float) -> bool:
+        with self._lock:
+            expire_time = self._flows.get(flow_key)
+            if expire_time is None:
+                self.misses += 1
+                return False
+            if expire_time < now:
+                del self._flows[flow_key]
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, flow_key: bytes, now: float) -> None:
+        with self._lock:
+            if flow_key not in self._flows and len(self._flows) >= self._maxsize:
+                self._flows.popitem(last=False)
+                self.evictions += 1
+            self._flows[flow_key] = now + self._ttl
+
+    def invalidate(self, flow_key: bytes) -> None:
+        with self._lock:
+            if self._flows.pop(flow_key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._flows)
+            self._flows.clear()
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return float(self.hits) / total if total > 0 else 0.0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._flows), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
@@ -8,15 +8,29 @@
 """
 import asyncio
 import copy
+import os
+import time
+from collections import OrderedDict
 
 import dpkt
 import pcap
 import socket
+import struct
 import threading
 from queue import Queue, Empty
-from typing import List, Callable, Optional, Dict, Tuple
+from typing import List, Callable, Optional, Dict, Set, Tuple, Union
 
 from pypidstat.core.process_stat import ProcSys
+from pypidstat.base.proc_cache import NetNsCache
+from pypidstat.core.predicate import Predicate
+from pypidstat.net.flow_cache import FlowNegativeCache, get_raw_flow_key, reverse_flow_key, conn_key_to_flow_key
+from pypidstat.net.bpf import gen_bpf_filter, get_conn_local_endpoint
+from pypidstat.net.fanout import FanoutNetCap
+from pypidstat.net.ring import ThreadRingCap
+from pypidstat.net.sampling import PacketSampler, merge_sampler_stats
+from pypidstat.net.top_talkers import TopTalkers
+from pypidstat.net.sock_diag import SockDiagStat
+from pypidstat.net.dev import resolve_devs, is_all_devs, get_interface_registry
 
 
 class ThreadEventLoop(threading.Thread):
@@ -32,7 +46,9 @@ class ThreadEventLoop(threading.Thread):
 
 
 class ThreadNetCap(threading.Thread):
-    def __init__(self, dev: str, queue: Queue, filter_exp: str = None, name: str = None):
+    def __init__(self, dev: str, queue: Queue, filter_exp: str = None, name: str = None,
+                 neg_cache: Optional[FlowNegativeCache] = None, sampler: Optional[PacketSampler] = None,
+                 plain_only: bool = False):
         super().__init__()
         self.setDaemon(True)
         if name is not None:
@@ -43,6 +59,12 @@ class ThreadNetCap(threading.Thread):
         else:
             self._queue = queue
         self._filter_exp = filter_exp
+        # 不属于观测进程的流，在解析报文前直接丢弃
+        self._neg_cache = neg_cache
+        # 报文采样器，为None时处理全部报文
+        self._sampler = sampler
+        # 仅处理未带VLAN标签的IPv4报文。同时在多块网卡上抓包时，VLAN子接口的流量在父接口上以带标签的形式重复出现
+        self._plain_only = plain_only
 
         # 标志线程的运行状态
         self.run_flag = True
@@ -53,8 +75,20 @@ class ThreadNetCap(threading.Thread):
             self._pcap.setfilter(self._filter_exp)
 
     def run(self):
+        neg_cache, sampler, plain_only = self._neg_cache, self._sampler, self._plain_only
+        scale = 1
         for cap_time, cap_raw in self._pcap:
             # time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cap_time))
+            flow_key = get_raw_flow_key(cap_raw)
+            if flow_key is None and plain_only:
+                continue
+            if flow_key is not None and neg_cache is not None and neg_cache.contains(flow_key, cap_time):
+                continue
+            if sampler is not None:
+                if not sampler.accept(flow_key):
+                    continue
+                scale = sampler.rate
+
             eth = dpkt.ethernet.Ethernet(cap_raw)
             # Make sure the Ethernet frame contains an IP packet
             if not isinstance(eth.data, dpkt.ip.IP):
@@ -66,21 +100,45 @@ class ThreadNetCap(threading.Thread):
                 src_ip, dst_ip, src_port, dst_port, tcp_len \
                     = socket.inet_ntoa(ip.src), socket.inet_ntoa(ip.dst), tcp.sport, tcp.dport, len(tcp)
                 # print(f'{src_ip}:{src_port} ==> {dst_ip}:{dst_port}, {cap_time} ')
-                self._queue.put((cap_time, src_ip, src_port, dst_ip, dst_port, tcp_len))
+                if flow_key is None:
+                    flow_key = ip.src + ip.dst + struct.pack('!HH', src_port, dst_port)
+                self._queue.put((cap_time, src_ip, src_port, dst_ip, dst_port, tcp_len * scale, tcp.flags, flow_key,
+                                 scale, 1))
 
             # 如果已经执行stop标识，则退出
             if not self.run_flag:
                 break
 
+    def set_filter(self, filter_exp: Optional[str]) -> None:
+        """
+        重新设置抓包的BPF过滤表达式，可在抓包过程中调用
+        """
+        self._pcap.setfilter(filter_exp if filter_exp is not None else '')
+        self._filter_exp = filter_exp
+
+    def get_stats(self) -> Dict[str, int]:
+        # libpcap的统计：接收的包数、缓冲区不足丢弃的包数、网卡丢弃的包数
+        packets, drops, if_drops = self._pcap.stats()
+        return {'packets': packets, 'drops': drops, 'if_drops': if_drops}
+
+    def get_sampling_stats(self) -> List[Dict]:
+        # 本线程采样器的统计
+        return [self._sampler.get_stats()] if self._sampler is not None else []
+
     def stop(self) -> None:
         self.run_flag = False
         self._pcap.close()
 
 
 class NetCapStat(threading.Thread):
-    def __init__(self, loop: asyncio.AbstractEventLoop, dev: str, pids: Optional[List[int]] = None,
+    def __init__(self, loop: asyncio.AbstractEventLoop, dev: Union[str, List[str]], pids: Optional[List[int]] = None,
                  cmd_regex: str = None, filter_exp: str = None, interval: int = 10,
-                 call_back: Callable[[Dict, Dict], None] = None):
+                 call_back: Callable[[Dict, Dict], None] = None, resolve_interval: float = 0.2,
+                 pending_ttl: float = 2.0, pending_max_flows: int = 4096, neg_cache_size: int = 65536,
+                 neg_cache_ttl: float = 5.0, auto_filter: bool = False, filter_debounce: float = 1.0,
+                 filter_max_terms: int = 64, cap_workers: int = 0, cap_mode: str = 'pcap',
+                 sampler: Optional[PacketSampler] = None, top_conns: Optional[int] = None,
+                 predicate: Optional[Predicate] = None):
         super().__init__()
         self._loop = loop
 
@@ -91,20 +149,132 @@ class NetCapStat(threading.Thread):
         else:
             self._pids = None
             self._cmd_regex = cmd_regex
+        # 进程的过滤表达式，仅观测可能满足表达式的进程
+        self._predicate = predicate
+        # 主循环已按cmd_regex和过滤表达式过滤的观测进程，设置后不再由本线程扫描/proc
+        self._shared_pids: Optional[List[int]] = None
 
         self.setDaemon(True)
         self._sys_proc = ProcSys()
+        # 观测进程按网络命名空间读取连接表，容器中进程的连接同样可以匹配
+        self._netns = NetNsCache(self._sys_proc)
 
         self.run_flag = True
 
         self._call_back = call_back
         self._conn_map: Dict = {}
         self._queue = Queue()
-        self._cap_thread = ThreadNetCap(dev=dev, queue=self._queue, filter_exp=filter_exp, name="pidstat_pcap_thread")
+        # 不属于观测进程的流的缓存，由抓包线程在解析报文前查询
+        self._neg_cache = FlowNegativeCache(maxsize=neg_cache_size, ttl=neg_cache_ttl)
+        # 报文采样器，启用后包数和字节数为按采样率放大的估计值
+        self._sampler = sampler
+        # 抓包方式：cap_mode为ring时使用TPACKET_V3环形缓冲区；
+        # 否则cap_workers大于1时使用多进程PACKET_FANOUT抓包，其余使用libpcap单线程抓包
+        self._cap_mode = cap_mode
+        self._cap_workers = cap_workers
+        # 抓包的网卡：网卡名、逗号分割的网卡名、网卡名列表或all。all时跟随网卡的增删调整抓包线程
+        self._dev_spec = dev
+        devs = resolve_devs(dev) if is_all_devs(dev) else (dev.split(',') if isinstance(dev, str) else list(dev))
+        # 每块网卡一个抓包线程，所有线程的报文放入同一个队列，统计到同一份连接表
+        self._cap_threads: Dict[str, threading.Thread] = {}
+        self._multi_dev = len(devs) > 1 or is_all_devs(dev)
+        for cap_dev in devs:
+            self._cap_threads[cap_dev] = self._new_cap_thread(cap_dev, filter_exp)
 
         self._addr_pid_map: Dict[str, int] = {}
+        # 流量统计为[发送包数, 发送字节数, 接收包数, 接收字节数, 实际处理的采样包数]
         self._traffic_pid_map: Dict[int, List] = {}
-        self._traffic_pid_conn_map: Dict[int, Dict[str, List]] = {}
+        # 每个进程按字节数保留最多top_conns个连接的流量统计，为None时统计所有连接
+        self._top_conns = top_conns
+        self._traffic_pid_conn_map: Dict[int, TopTalkers] = {}
+
+        # 最近一次刷新得到的观测进程列表，用于按需定位未知连接所属的进程
+        self._watched_pids: List[int] = []
+        # 未匹配到进程的流量暂存，key为首个报文方向的conn_key，
+        # value为[首次出现时间, send_key, recv_key, 正向包数, 正向字节数, 反向包数, 反向字节数, flow_key, 采样包数]
+        self._pending_flows: OrderedDict = OrderedDict()
+        # 两个方向的conn_key均指向暂存项的key
+        self._pending_index: Dict[str, str] = {}
+        self._pending_ttl = pending_ttl
+        self._pending_max_flows = pending_max_flows
+        # 按需定位的最小间隔（秒），避免未知流量过多时频繁扫描/proc
+        self._resolve_itv = resolve_interval
+        self._last_resolve_time = 0.0
+        # 定位失败时重新列出观测进程的时间
+        self._last_rescan_time = 0.0
+        self._resolve_requested = False
+
+        # 根据观测的连接表自动生成BPF过滤表达式，连接表变化后按filter_debounce秒去抖重新设置；
+        # 暂存的新流（SYN报文触发）立即加入表达式，仅受resolve_interval限制，避免定位前丢弃其后续报文。
+        # 剩余的窗口为SYN到达至表达式重新设置之间（不超过resolve_interval及抓包线程的队列延迟）
+        self._user_filter = filter_exp
+        self._auto_filter = auto_filter
+        self._filter_debounce = filter_debounce
+        self._filter_max_terms = filter_max_terms
+        self._filter_dirty = auto_filter
+        # 仅新增了暂存流的端口，不需要去抖
+        self._filter_urgent = False
+        self._last_filter_time = 0.0
+        self._curr_filter: Optional[str] = filter_exp
+        # 观测进程监听的本地地址和端口
+        self._listen_endpoints: Set[Tuple[str, int]] = set()
+
+    def _new_cap_thread(self, dev: str, filter_exp: Optional[str]):
+        # 采样器按抓包线程的CPU时间自适应，每个抓包线程使用按传入采样器的参数新建的独立采样器，
+        # 传入的采样器仅作为参数模板，不在抓包线程中使用
+        sampler = PacketSampler(**self._sampler.get_config()) if self._sampler is not None else None
+        if self._cap_mode == 'ring':
+            return ThreadRingCap(dev=dev, queue=self._queue, filter_exp=filter_exp, name=f"pidstat_ring_{dev}",
+                                 neg_cache=self._neg_cache, sampler=sampler, plain_only=self._multi_dev)
+        if self._cap_workers > 1:
+            # 同一个fanout组只能包含同一块网卡上的套接字
+            return FanoutNetCap(dev=dev, queue=self._queue, filter_exp=filter_exp, name=f"pidstat_fanout_{dev}",
+                                neg_cache=self._neg_cache, workers=self._cap_workers, sampler=sampler,
+                                fanout_group=(os.getpid() + socket.if_nametoindex(dev)) & 0xffff)
+        return ThreadNetCap(dev=dev, queue=self._queue, filter_exp=filter_exp, name=f"pidstat_pcap_{dev}",
+                            neg_cache=self._neg_cache, sampler=sampler, plain_only=self._multi_dev)
+
+    def _refresh_devs(self) -> None:
+        """
+        抓包网卡为all时，根据网卡的增删启动或停止对应的抓包线程
+        """
+        registry = get_interface_registry()
+        if not registry.poll_events():
+            return
+        devs = registry.resolve_devs(self._dev_spec)
+        for cap_dev in [cap_dev for cap_dev in self._cap_threads.keys() if cap_dev not in devs]:
+            self._cap_threads.pop(cap_dev).stop()
+        for cap_dev in devs:
+            if cap_dev in self._cap_threads:
+                continue
+            try:
+                cap_thread = self._new_cap_thread(cap_dev, self._curr_filter)
+            except Exception:
+                # 网卡刚创建时可能尚未就绪，下一次变化时重试
+                continue
+            self._cap_threads[cap_dev] = cap_thread
+            cap_thread.start()
+
+    def set_watched_pids(self, pids: List[int]) -> None:
+        # 由主循环在每次刷新进程列表后设置
+        self._shared_pids = list(pids)
+
+    def _get_watched_pids(self, exclude: Optional[Set[int]] = None) -> List[int]:
+        """
+        返回观测的进程：主循环设置了观测进程时直接使用；否则如果指定初始化指定pids，则直接使用指定的pids，
+        否则使用cmd_regex进行匹配，当cmd_regex为None，则获取系统所有进程的pid，再按过滤表达式过滤
+        Args:
+            exclude: 重新扫描/proc，只返回不在其中的进程，仅对这些进程求值过滤表达式
+        """
+        shared_pids = self._shared_pids
+        if shared_pids is not None and exclude is None:
+            return list(shared_pids)
+        pids = self._pids if self._pids is not None else self._sys_proc.get_proc_pid_list(self._cmd_regex)
+        if exclude is not None:
+            pids = [pid for pid in pids if pid not in exclude]
+        if self._predicate is not None:
+            pids = self._predicate.filter_pids(pids, self._sys_proc, record_stats=False)
+        return pids
 
     def _get_conns(self) -> Dict[int, Dict]:
         """
@@ -113,53 +283,92 @@ class NetCapStat(threading.Thread):
             返回进程的网络连接字典。key为进程PID，value为进程的连接字典{conn_key, conn_dict}
         """
         all_conns_dict = {}
-
-        # 如果指定初始化指定pids，则直接使用指定的pids；否则，使用cmd_regex进行匹配，当cmd_regex为None，则获取系统所有进程的pid
-        if self._pids is not None:
-            curr_pids = self._pids
-        else:
-            curr_pids = self._sys_proc.get_proc_pid_list(self._cmd_regex)
-
-        for pid in curr_pids:
-            pid_conn_dict = self._sys_proc.get_proc_pid_net_connections(pid)
+        # 自动生成过滤表达式时，同时收集观测进程的监听端口
+        statuses = ('ESTABLISHED', 'LISTEN') if self._auto_filter else ('ESTABLISHED',)
+        listen_endpoints = set()
+
+        # 同一网络命名空间的进程共享同一份连接表
+        watched_pids = self._get_watched_pids()
+        inode_conns = self._netns.get_tcp_inodes(watched_pids)
+        for pid in watched_pids:
+            try:
+                pid_conn_dict = self._sys_proc.get_proc_pid_net_connections(pid, inode_conns, statuses=statuses)
+            except OSError:
+                # 进程已经退出
+                continue
+            for conn_key in [conn_key for conn_key, conn in pid_conn_dict.items() if conn['status'] == 'LISTEN']:
+                conn = pid_conn_dict.pop(conn_key)
+                listen_endpoints.add((conn['local_ip'], conn['local_port']))
             all_conns_dict[pid] = pid_conn_dict
+
+        if listen_endpoints != self._listen_endpoints:
+            self._listen_endpoints = listen_endpoints
+            self._filter_dirty = self._auto_filter
         return all_conns_dict
 
+    def _add_conn(self, pid: int, conn_key: str) -> None:
+        self._addr_pid_map[conn_key] = pid
+        self._filter_dirty = self._auto_filter
+        # 新的观测连接可能已被缓存为非观测流量，需要失效
+        flow_key = conn_key_to_flow_key(conn_key)
+        self._neg_cache.invalidate(flow_key)
+        self._neg_cache.invalidate(reverse_flow_key(flow_key))
+        if pid not in self._traffic_pid_map:
+            self._traffic_pid_map[pid] = [0, 0, 0, 0, 0]
+            self._traffic_pid_conn_map[pid] = TopTalkers(self._top_conns)
+
+    def _remove_conn(self, conn_key: str) -> None:
+        pid = self._addr_pid_map.pop(conn_key, None)
+        self._filter_dirty = self._auto_filter
+        if pid is not None and pid in self._traffic_pid_conn_map:
+            self._traffic_pid_conn_map[pid].discard(conn_key)
+
+    def _apply_conn_diff(self, all_conns_dict: Dict[int, Dict]) -> None:
+        """
+        将最新的连接表以增删的方式合并到当前连接表，已存在连接的流量统计保持不变
+        Args:
+            all_conns_dict: _get_conns返回的进程连接字典
+        """
+        new_addr_pid_map: Dict[str, int] = {conn_key: pid for pid, conn_list_dict in all_conns_dict.items()
+                                            for conn_key in conn_list_dict.keys()}
+
+        # 删除已经关闭或者归属发生变化的连接
+        for conn_key, pid in list(self._addr_pid_map.items()):
+            if new_addr_pid_map.get(conn_key) != pid:
+                self._remove_conn(conn_key)
+
+        # 删除不再观测的进程，并为新观测的进程初始化流量统计
+        for pid in list(self._traffic_pid_map.keys()):
+            if pid not in all_conns_dict:
+                del self._traffic_pid_map[pid]
+                self._traffic_pid_conn_map.pop(pid, None)
+        for pid in all_conns_dict.keys():
+            if pid not in self._traffic_pid_map:
+                self._traffic_pid_map[pid] = [0, 0, 0, 0, 0]
+                self._traffic_pid_conn_map[pid] = TopTalkers(self._top_conns)
+
+        # 增加新建立的连接
+        for conn_key, pid in new_addr_pid_map.items():
+            if conn_key not in self._addr_pid_map:
+                self._add_conn(pid, conn_key)
+
     async def __refresh_conn(self):
         while self.run_flag:
+            if is_all_devs(self._dev_spec):
+                self._refresh_devs()
             all_conns_dict = self._get_conns()
-
-            new_addr_pid_map: Dict[str, int] = {}
-            new_traffic_pid_map: Dict[int, List] = {}
-            new_traffic_pid_conn_map: Dict[int, Dict[str, List]] = {}
-            for pid, conn_list_dict in all_conns_dict.items():
-                new_traffic_pid_map[pid] = [0, 0, 0, 0]
-                new_traffic_pid_conn_map[pid] = {}
-                for conn_key, conn_dict in conn_list_dict.items():
-                    new_addr_pid_map[conn_key] = pid
-                    new_traffic_pid_conn_map[pid][conn_key] = [0, 0, 0, 0]
-
-            for pid in new_traffic_pid_map.keys():
-                if pid in self._traffic_pid_map:
-                    new_traffic_pid_map[pid] = copy.deepcopy(self._traffic_pid_map[pid])
-
-            for pid in new_traffic_pid_conn_map.keys():
-                if pid in self._traffic_pid_conn_map:
-                    for conn_key in new_traffic_pid_conn_map[pid].keys():
-                        if conn_key in self._traffic_pid_conn_map[pid]:
-                            new_traffic_pid_conn_map[pid][conn_key] = copy.deepcopy(
-                                self._traffic_pid_conn_map[pid][conn_key])
-
-            self._addr_pid_map = new_addr_pid_map
-            self._traffic_pid_conn_map = new_traffic_pid_conn_map
-            self._traffic_pid_map = new_traffic_pid_map
+            self._watched_pids = list(all_conns_dict.keys())
+            self._apply_conn_diff(all_conns_dict)
+            self._maybe_update_filter()
 
             await asyncio.sleep(self._itv)
-            self._call_back(self._traffic_pid_map, self._traffic_pid_conn_map)
+            self._call_back(self._traffic_pid_map,
+                            {pid: talkers.to_dict() for pid, talkers in self._traffic_pid_conn_map.items()})
 
     def run(self):
         asyncio.set_event_loop(self._loop)
-        self._cap_thread.start()
+        for cap_thread in self._cap_threads.values():
+            cap_thread.start()
         # self._loop.create_task(self.__refresh_conn())
         # self._loop.create_task(self._cap_func())
         # print(f' net cap run....')
@@ -178,50 +387,242 @@ class NetCapStat(threading.Thread):
                 await self._handle_packet(packet_tuple)
                 await asyncio.sleep(0)
             except Empty:
+                self._maybe_resolve()
+                self._maybe_update_filter()
                 await asyncio.sleep(1)
 
     async def _handle_packet(self, packet_info: Tuple):
-        cap_time, src_ip, src_port, dst_ip, dst_port, tcp_len = packet_info
+        # 多进程抓包时，一条记录为一个流在一段时间内的汇总，pkt_cnt为包数，tcp_len为字节数之和；
+        # 采样时pkt_cnt和tcp_len为按采样率放大后的值，sample_cnt为实际处理的报文数
+        cap_time, src_ip, src_port, dst_ip, dst_port, tcp_len, tcp_flags, flow_key, pkt_cnt, sample_cnt = packet_info
         send_connect_key = f"{src_ip}:{src_port}-{dst_ip}:{dst_port}"
-        direction, pid, conn_key = None, None, None
-        if send_connect_key in self._addr_pid_map:
-            direction = "send"
-            pid = self._addr_pid_map[send_connect_key]
-            conn_key = send_connect_key
-        else:
-            recv_connect_key = f"{dst_ip}:{dst_port}-{src_ip}:{src_port}"
-            if recv_connect_key in self._addr_pid_map:
-                direction = "recv"
-                pid = self._addr_pid_map[recv_connect_key]
-                conn_key = recv_connect_key
-
-        # 如果同观测的进程不匹配，则直接退出
-        if direction is None:
+        pid = self._addr_pid_map.get(send_connect_key)
+        if pid is not None:
+            self._account(pid, send_connect_key, 'send', pkt_cnt, tcp_len, sample_cnt)
+            return
+
+        recv_connect_key = f"{dst_ip}:{dst_port}-{src_ip}:{src_port}"
+        pid = self._addr_pid_map.get(recv_connect_key)
+        if pid is not None:
+            self._account(pid, recv_connect_key, 'recv', pkt_cnt, tcp_len, sample_cnt)
             return
+
+        # 如果同观测的进程不匹配，则暂存流量；新出现的流或者SYN报文触发按需定位
+        is_new_flow = self._buffer_pending(send_connect_key, recv_connect_key, pkt_cnt, tcp_len, flow_key,
+                                           sample_cnt)
+        if is_new_flow or tcp_flags & dpkt.tcp.TH_SYN:
+            self._resolve_requested = True
+        if is_new_flow and self._auto_filter:
+            self._filter_dirty = True
+            self._filter_urgent = True
+        self._maybe_resolve()
+        self._maybe_update_filter()
+
+    def _account(self, pid: int, conn_key: str, direction: str, pkt_cnt: int, byte_cnt: int,
+                 sample_cnt: int = 0) -> None:
         # print(f'{src_ip}:{src_port} ==> {dst_ip}:{dst_port}, '
         #      f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cap_time))} {tcp_len}')
         proc_traffic = self._traffic_pid_map[pid]
-        conn_traffic = self._traffic_pid_conn_map[pid][conn_key]
         if direction == 'send':
-            proc_traffic[0] += 1
-            proc_traffic[1] += tcp_len
-            conn_traffic[0] += 1
-            conn_traffic[1] += tcp_len
+            proc_traffic[0] += pkt_cnt
+            proc_traffic[1] += byte_cnt
         else:
-            proc_traffic[2] += 1
-            proc_traffic[3] += tcp_len
-            conn_traffic[2] += 1
-            conn_traffic[3] += tcp_len
+            proc_traffic[2] += pkt_cnt
+            proc_traffic[3] += byte_cnt
+        proc_traffic[4] += sample_cnt
+        self._traffic_pid_conn_map[pid].add(conn_key, direction, pkt_cnt, byte_cnt, sample_cnt)
+
+    def _buffer_pending(self, send_key: str, recv_key: str, pkt_cnt: int, tcp_len: int, flow_key: bytes,
+                        sample_cnt: int = 0) -> bool:
+        """
+        暂存未匹配到进程的流量，待定位到所属进程后再补充统计
+        Returns:
+            是否为新出现的流
+        """
+        primary_key = self._pending_index.get(send_key)
+        if primary_key is not None:
+            pending = self._pending_flows[primary_key]
+            if pending[1] == send_key:
+                pending[3] += pkt_cnt
+                pending[4] += tcp_len
+            else:
+                pending[5] += pkt_cnt
+                pending[6] += tcp_len
+            pending[8] += sample_cnt
+            return False
+
+        if len(self._pending_flows) >= self._pending_max_flows:
+            self._drop_pending(next(iter(self._pending_flows)))
+        self._pending_flows[send_key] = [time.monotonic(), send_key, recv_key, pkt_cnt, tcp_len, 0, 0, flow_key,
+                                         sample_cnt]
+        self._pending_index[send_key] = send_key
+        self._pending_index[recv_key] = send_key
+        return True
+
+    def _drop_pending(self, primary_key: str, negative: bool = False) -> List:
+        """
+        删除暂存的流量
+        Args:
+            primary_key: 暂存项的key
+            negative: 是否确认该流不属于观测进程，是则加入非观测流的缓存
+        """
+        pending = self._pending_flows.pop(primary_key)
+        self._pending_index.pop(pending[1], None)
+        self._pending_index.pop(pending[2], None)
+        self._filter_dirty = self._auto_filter
+        if negative:
+            now = time.time()
+            self._neg_cache.add(pending[7], now)
+            self._neg_cache.add(reverse_flow_key(pending[7]), now)
+        return pending
+
+    def _maybe_resolve(self) -> None:
+        # 限制按需定位的频率，间隔期间的定位请求合并到下一次处理
+        if not self._resolve_requested:
+            return
+        now = time.monotonic()
+        if now - self._last_resolve_time < self._resolve_itv:
+            return
+        self._resolve_requested = False
+        self._last_resolve_time = now
+        self._resolve_pending(now)
+        self._maybe_update_filter()
+
+    def _maybe_update_filter(self) -> None:
+        """
+        连接表发生变化后，按去抖间隔重新生成BPF过滤表达式并设置到抓包线程
+        """
+        if not self._filter_dirty:
+            return
+        now = time.monotonic()
+        min_itv = self._resolve_itv if self._filter_urgent else self._filter_debounce
+        if now - self._last_filter_time < min_itv:
+            return
+        self._filter_dirty = False
+        self._filter_urgent = False
+        self._last_filter_time = now
+
+        endpoints = {get_conn_local_endpoint(conn_key) for conn_key in self._addr_pid_map.keys()}
+        endpoints.update(self._listen_endpoints)
+        # 暂存的流在定位前保持放行，避免短连接在定位完成前丢失全部数据
+        endpoints.update(get_conn_local_endpoint(pending[1]) for pending in self._pending_flows.values())
+        filter_exp = gen_bpf_filter(endpoints, user_filter=self._user_filter, max_terms=self._filter_max_terms)
+        if filter_exp == self._curr_filter:
+            return
+        try:
+            for cap_thread in self._cap_threads.values():
+                cap_thread.set_filter(filter_exp)
+        except Exception:
+            # 表达式无法编译时，回退到用户指定的过滤表达式
+            filter_exp = self._user_filter
+            for cap_thread in self._cap_threads.values():
+                cap_thread.set_filter(filter_exp)
+        self._curr_filter = filter_exp
+
+    def _find_pending_owners(self, pids: List[int]) -> Dict[int, str]:
+        """
+        在指定进程所在命名空间的连接表中查找暂存的流，并扫描这些进程的socket，将找到的连接加入连接表
+        Returns:
+            返回连接表中存在、但不属于这些进程的连接，key为inode，value为conn_key
+        """
+        pending_keys = {conn_key for pending in self._pending_flows.values() for conn_key in pending[1:3]
+                        if conn_key not in self._addr_pid_map}
+        wanted_inodes: Dict[int, str] = {}
+        # 不同命名空间中相同四元组的连接都可能是暂存的流，均按inode查找所属的进程
+        for (_, conn_key), conn in self._netns.get_tcp_conns(pids).items():
+            if conn_key in pending_keys and conn['inode'] != 0:
+                wanted_inodes[conn['inode']] = conn_key
+
+        for pid in pids:
+            if len(wanted_inodes) == 0:
+                break
+            try:
+                pid_inodes = self._sys_proc.get_proc_pid_socket_inodes(pid)
+            except OSError:
+                continue
+            for inode in pid_inodes & wanted_inodes.keys():
+                self._add_conn(pid, wanted_inodes.pop(inode))
+        return wanted_inodes
+
+    def _resolve_pending(self, now: float) -> None:
+        """
+        定位暂存流量所属的观测进程，将新连接加入连接表，并补充统计已暂存的流量
+        Args:
+            now: 当前的monotonic时间
+        """
+        # 清理超时仍未定位的流量，视为非观测进程的流量
+        for primary_key in [key for key, pending in self._pending_flows.items()
+                            if now - pending[0] > self._pending_ttl]:
+            self._drop_pending(primary_key, negative=True)
+        if len(self._pending_flows) == 0:
+            return
+
+        wanted_inodes = self._find_pending_owners(self._watched_pids)
+        if any(pending[0] > self._last_rescan_time and pending[1] not in self._addr_pid_map
+               and pending[2] not in self._addr_pid_map for pending in self._pending_flows.values()):
+            # 上次刷新后新启动的进程不在观测列表中，重新列出观测进程，只扫描新增的进程；
+            # 上次重新列出之前出现的流已经查找过，不再重复
+            self._last_rescan_time = now
+            new_pids = self._get_watched_pids(exclude=set(self._watched_pids))
+            if len(new_pids) > 0:
+                self._watched_pids.extend(new_pids)
+                wanted_inodes.update(self._find_pending_owners(new_pids))
+        # 连接存在但不属于任何观测进程
+        unwatched_keys = {conn_key for conn_key in wanted_inodes.values() if conn_key not in self._addr_pid_map}
+
+        # 已定位到进程的流量补充统计
+        for primary_key in list(self._pending_flows.keys()):
+            _, send_key, recv_key, fwd_cnt, fwd_bytes, rev_cnt, rev_bytes, _, sample_cnt \
+                = self._pending_flows[primary_key]
+            if send_key in self._addr_pid_map:
+                conn_key, pid = send_key, self._addr_pid_map[send_key]
+                send_cnt, send_bytes, recv_cnt, recv_bytes = fwd_cnt, fwd_bytes, rev_cnt, rev_bytes
+            elif recv_key in self._addr_pid_map:
+                conn_key, pid = recv_key, self._addr_pid_map[recv_key]
+                send_cnt, send_bytes, recv_cnt, recv_bytes = rev_cnt, rev_bytes, fwd_cnt, fwd_bytes
+            else:
+                if send_key in unwatched_keys or recv_key in unwatched_keys:
+                    self._drop_pending(primary_key, negative=True)
+                continue
+            self._drop_pending(primary_key)
+            self._account(pid, conn_key, 'send', send_cnt, send_bytes)
+            self._account(pid, conn_key, 'recv', recv_cnt, recv_bytes, sample_cnt)
+
+    def _get_sampling_stats(self) -> Optional[Dict]:
+        """
+        汇总各抓包线程采样器的统计，报文由各抓包线程（或多进程抓包的子进程）各自的采样器处理
+        """
+        if self._sampler is None:
+            return None
+        stats_list = [stats for cap_thread in self._cap_threads.values() for stats in cap_thread.get_sampling_stats()]
+        return merge_sampler_stats(stats_list) if len(stats_list) > 0 else self._sampler.get_stats()
+
+    def get_cap_stats(self) -> Dict[str, Dict]:
+        """
+        返回抓包统计相关的信息，neg_cache为非观测流缓存的命中情况，capture为各网卡的抓包统计
+        """
+        return {'neg_cache': self._neg_cache.get_stats(), 'filter': {'filter_exp': self._curr_filter},
+                'capture': {cap_dev: cap_thread.get_stats() for cap_dev, cap_thread in self._cap_threads.items()},
+                'sampling': self._get_sampling_stats(),
+                'netns': self._netns.get_stats()}
 
     def stop(self) -> None:
-        self._cap_thread.stop()
+        for cap_thread in self._cap_threads.values():
+            cap_thread.stop()
         self.run_flag = False
         self._queue.queue.clear()
 
 
 class ProcNetStat(object):
-    def __init__(self, dev, pids: List[int] = None, cmd_regex=None, interval=1, filter_exp=None):
+    def __init__(self, dev, pids: List[int] = None, cmd_regex=None, interval=1, filter_exp=None, auto_filter=False,
+                 cap_workers=0, cap_mode='pcap', sampler: Optional[PacketSampler] = None, top_conns=None,
+                 backend='pcap', predicate: Optional[Predicate] = None):
         self.dev, self.pids, self.cmd_regex, self.interval, self.filter_exp = dev, pids, cmd_regex, interval, filter_exp
+        self.auto_filter, self.cap_workers, self.cap_mode = auto_filter, cap_workers, cap_mode
+        self.sampler, self.top_conns = sampler, top_conns
+        # 统计方式：pcap为抓包统计，sockdiag为读取内核中TCP连接的计数，无需抓包
+        self.backend = backend
+        self.predicate = predicate
         self._traffic_pid_dict: Optional[Dict[int, List[int]]] = None
         self._traffic_pid_conn_dict: Optional[Dict[int, Dict[str, List[int]]]] = None
         self._net_thread = self._activate_stat()
@@ -232,15 +633,22 @@ class ProcNetStat(object):
         Returns:
             内部调用
         """
-        loop = asyncio.new_event_loop()
-
         def handle_call_back(traffic_pid: Dict[int, List[int]], traffic_pid_conn: Dict[int, Dict[str, List[int]]]):
             self._traffic_pid_dict = copy.deepcopy(traffic_pid)
             self._traffic_pid_conn_dict = copy.deepcopy(traffic_pid_conn)
 
+        if self.backend == 'sockdiag':
+            net_stat = SockDiagStat(pids=self.pids, cmd_regex=self.cmd_regex, interval=self.interval,
+                                    call_back=handle_call_back, top_conns=self.top_conns, predicate=self.predicate)
+            net_stat.start()
+            return net_stat
+
+        loop = asyncio.new_event_loop()
         # 启动监听进程
         net_stat = NetCapStat(dev=self.dev, pids=self.pids, loop=loop, cmd_regex=self.cmd_regex, interval=self.interval,
-                              call_back=handle_call_back, filter_exp=self.filter_exp)
+                              call_back=handle_call_back, filter_exp=self.filter_exp, auto_filter=self.auto_filter,
+                              cap_workers=self.cap_workers, cap_mode=self.cap_mode, sampler=self.sampler,
+                              top_conns=self.top_conns, predicate=self.predicate)
         net_stat.start()
         return net_stat
 
@@ -251,7 +659,7 @@ class ProcNetStat(object):
         self._net_thread.stop()
 
     def get_pid_net_traffic(self, pid: int) -> Optional[List[int]]:
-        if pid in self._traffic_pid_dict:
+        if self._traffic_pid_dict is not None and pid in self._traffic_pid_dict:
             return copy.deepcopy(self._traffic_pid_dict[pid])
         return None
 
@@ -261,6 +669,20 @@ class ProcNetStat(object):
             return {conn_key: copy.deepcopy(conn_traffic) for conn_key, conn_traffic in pid_conn_traffic.items()}
         return None
 
+    def get_cap_stats(self) -> Dict[str, Dict]:
+        return self._net_thread.get_cap_stats()
+
+    def set_watched_pids(self, pids: List[int]) -> None:
+        """
+        设置主循环已过滤的观测进程，统计线程不再各自扫描/proc和求值过滤表达式
+        """
+        self._net_thread.set_watched_pids(pids)
+
+    @property
+    def sampled(self) -> Optional[str]:
+        # 启用报文采样时返回采样方法，此时流量为估计值；未启用时返回None
+        return self.sampler.method if self.sampler is not None else None
+
     @property
     def all_pid_traffic(self):
         return self._traffic_pid_dict
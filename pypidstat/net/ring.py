@@ -0,0 +1,188 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: ring.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 14:20
+"""
+import mmap
+import select
+import socket
+import struct
+import threading
+from queue import Queue
+from typing import Dict, List, Optional
+
+from pypidstat.net.bpf import attach_bpf
+from pypidstat.net.flow_cache import FlowNegativeCache
+from pypidstat.net.sampling import PacketSampler
+
+# linux/if_ether.h、linux/if_packet.h
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+# 报文的VLAN标签已由内核剥离，保存在tp_vlan_tci中
+TP_STATUS_VLAN_VALID = 1 << 4
+_ETH_HDR_LEN = 14
+
+# struct tpacket_block_desc中block_status、num_pkts、offset_to_first_pkt的偏移
+_BLOCK_STATUS_OFFSET = 8
+_BLOCK_HDR_FMT = '=II'
+_BLOCK_HDR_OFFSET = 12
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+_PKT_HDR_FMT = '=IIIIIIHH'
+_IP_PROTO_TCP = 6
+# tpacket3_hdr之后为struct sockaddr_ll，sll_pkttype位于其中第10个字节
+_SLL_PKTTYPE_OFFSET = 48 + 10
+PACKET_OUTGOING = 4
+
+
+def _walk_block(ring: memoryview, block_offset: int, queue: Queue, neg_cache: Optional[FlowNegativeCache] = None,
+                sampler: Optional[PacketSampler] = None, skip_outgoing: bool = False,
+                plain_only: bool = False) -> None:
+    """
+    遍历环形缓冲区中的一个块，将其中IPv4的TCP报文转换为统计记录放入queue
+    Args:
+        ring: 环形缓冲区
+        block_offset: 块在环形缓冲区中的偏移
+        queue: 统计队列
+        neg_cache: 非观测流的缓存，命中的报文直接丢弃
+        sampler: 报文采样器，为None时处理全部报文
+        skip_outgoing: 是否丢弃发送方向的报文
+        plain_only: 是否仅处理未带VLAN标签的报文（标签在帧中或已由内核剥离到tp_vlan_tci）
+    """
+    num_pkts, first_pkt_offset = struct.unpack_from(_BLOCK_HDR_FMT, ring, block_offset + _BLOCK_HDR_OFFSET)
+    pkt_offset = block_offset + first_pkt_offset
+    for _ in range(num_pkts):
+        next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net \
+            = struct.unpack_from(_PKT_HDR_FMT, ring, pkt_offset)
+        ip_offset = pkt_offset + tp_net
+        if skip_outgoing and ring[pkt_offset + _SLL_PKTTYPE_OFFSET] == PACKET_OUTGOING:
+            pkt_offset += next_offset
+            continue
+        if plain_only and (tp_status & TP_STATUS_VLAN_VALID or tp_net - tp_mac != _ETH_HDR_LEN):
+            pkt_offset += next_offset
+            continue
+        # 仅处理IPv4的TCP报文，tp_net之前的两个字节为以太网类型
+        if ring[ip_offset - 2] == 0x08 and ring[ip_offset - 1] == 0x00 and ring[ip_offset] >> 4 == 4 \
+                and ring[ip_offset + 9] == _IP_PROTO_TCP:
+            ip_hdr_len = (ring[ip_offset] & 0x0f) * 4
+            tcp_offset = ip_offset + ip_hdr_len
+            flow_key = bytes(ring[ip_offset + 12:ip_offset + 20]) + bytes(ring[tcp_offset:tcp_offset + 4])
+            cap_time = tp_sec + tp_nsec / 1e9
+            if (neg_cache is None or not neg_cache.contains(flow_key, cap_time)) \
+                    and (sampler is None or sampler.accept(flow_key)):
+                scale = sampler.rate if sampler is not None else 1
+                ip_len = struct.unpack_from('!H', ring, ip_offset + 2)[0]
+                src_port, dst_port = struct.unpack_from('!HH', flow_key, 8)
+                queue.put((cap_time, socket.inet_ntoa(flow_key[0:4]), src_port, socket.inet_ntoa(flow_key[4:8]),
+                           dst_port, (ip_len - ip_hdr_len) * scale, ring[tcp_offset + 13], flow_key, scale, 1))
+        pkt_offset += next_offset
+
+
+class ThreadRingCap(threading.Thread):
+    """
+    基于AF_PACKET套接字TPACKET_V3内存映射环形缓冲区的抓包线程，可替代ThreadNetCap。
+    按块遍历环形缓冲区，通过memoryview只读取需要的报文头（长度、地址、端口、标志位），不复制报文负载。
+    """
+
+    def __init__(self, dev: str, queue: Queue, filter_exp: str = None, name: str = None,
+                 neg_cache: Optional[FlowNegativeCache] = None, block_size: int = 1 << 20, block_nr: int = 64,
+                 frame_size: int = 2048, retire_blk_tov: int = 50, sampler: Optional[PacketSampler] = None,
+                 plain_only: bool = False):
+        super().__init__()
+        self.daemon = True
+        if name is not None:
+            self.name = name
+
+        if queue is None:
+            raise Exception("ThreadRingCap's args is invalid, queue is None")
+        self._queue = queue
+        self._filter_exp = filter_exp
+        self._neg_cache = neg_cache
+        self._sampler = sampler
+
+        # 标志线程的运行状态
+        self.run_flag = True
+
+        self._block_size, self._block_nr = block_size, block_nr
+        # lo上每个报文会以发送和接收两个方向各出现一次，只保留接收方向
+        self._skip_outgoing = dev == 'lo'
+        # 同时在多块网卡上抓包时，VLAN子接口的流量在父接口上以带标签的形式重复出现，与ThreadNetCap相同只处理未带标签的报文
+        self._plain_only = plain_only
+        # PACKET_STATISTICS读取后内核计数清零，此处累计
+        self._stats = {'packets': 0, 'drops': 0, 'freeze_q_cnt': 0}
+        self._stats_lock = threading.Lock()
+
+        self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self._sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # struct tpacket_req3: block_size, block_nr, frame_size, frame_nr, retire_blk_tov, sizeof_priv, feature_req_word
+        req = struct.pack('=IIIIIII', block_size, block_nr, frame_size, block_size * block_nr // frame_size,
+                          retire_blk_tov, 0, 0)
+        self._sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self._ring = mmap.mmap(self._sock.fileno(), block_size * block_nr, mmap.MAP_SHARED,
+                               mmap.PROT_READ | mmap.PROT_WRITE)
+        if self._filter_exp is not None:
+            attach_bpf(self._sock, self._filter_exp)
+        self._sock.bind((dev, ETH_P_ALL))
+
+    def run(self):
+        ring = memoryview(self._ring)
+        poller = select.poll()
+        poller.register(self._sock.fileno(), select.POLLIN | select.POLLERR)
+        block_idx = 0
+        try:
+            while self.run_flag:
+                block_offset = block_idx * self._block_size
+                block_status = struct.unpack_from('=I', ring, block_offset + _BLOCK_STATUS_OFFSET)[0]
+                if not block_status & TP_STATUS_USER:
+                    poller.poll(100)
+                    continue
+
+                _walk_block(ring, block_offset, self._queue, self._neg_cache, self._sampler, self._skip_outgoing,
+                            self._plain_only)
+                # 将块归还内核
+                struct.pack_into('=I', ring, block_offset + _BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+                block_idx = (block_idx + 1) % self._block_nr
+        finally:
+            # 映射区和套接字由stop在线程退出后关闭
+            ring.release()
+
+    def set_filter(self, filter_exp: Optional[str]) -> None:
+        attach_bpf(self._sock, filter_exp)
+        self._filter_exp = filter_exp
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        读取PACKET_STATISTICS，返回累计的packets、drops和freeze_q_cnt。
+        drops或freeze_q_cnt持续增长说明环形缓冲区过小或处理不及时
+        """
+        with self._stats_lock:
+            if self.run_flag:
+                tp_packets, tp_drops, tp_freeze_q_cnt = struct.unpack(
+                    '=III', self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+                self._stats['packets'] += tp_packets
+                self._stats['drops'] += tp_drops
+                self._stats['freeze_q_cnt'] += tp_freeze_q_cnt
+            return dict(self._stats)
+
+    def get_sampling_stats(self) -> List[Dict]:
+        # 本线程采样器的统计
+        return [self._sampler.get_stats()] if self._sampler is not None else []
+
+    def stop(self) -> None:
+        """
+        停止抓包线程，等待线程退出、不再访问映射区后再解除映射并关闭套接字
+        """
+        self.run_flag = False
+        if self.is_alive():
+            self.join()
+        with self._stats_lock:
+            self._ring.close()
+            self._sock.close()
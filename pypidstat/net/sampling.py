@@ -0,0 +1,105 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: sampling.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 15:30
+"""
+import math
+import time
+import zlib
+from typing import Dict, List, Optional
+
+SAMPLE_METHOD_COUNT = 'count'
+SAMPLE_METHOD_FLOW = 'flow'
+
+
+class PacketSampler(object):
+    """
+    报文采样器，抓包线程对每个报文调用accept，仅处理被采样的报文，并将包数和字节数乘以rate作为估计值。
+    method为count时每rate个报文取一个；为flow时按流的key哈希，同一个流的报文要么全部处理要么全部丢弃。
+    rate为0时根据报文速率和抓包线程的CPU预算自适应调整：rate = ceil(报文速率 * 单个采样报文的CPU耗时 / cpu_budget)
+    """
+
+    def __init__(self, rate: int = 0, method: str = SAMPLE_METHOD_COUNT, cpu_budget: float = 0.05,
+                 max_rate: int = 1024, adjust_interval: float = 1.0):
+        if method not in (SAMPLE_METHOD_COUNT, SAMPLE_METHOD_FLOW):
+            raise Exception(f"PacketSampler's args is invalid, method is {method}")
+        self.adaptive = rate <= 0
+        self.rate = 1 if self.adaptive else rate
+        self.method = method
+        self.cpu_budget = cpu_budget
+        self.max_rate = max_rate
+        self._adjust_itv = adjust_interval
+
+        self._counter = 0
+        # 累计经过采样器的报文数及被采样的报文数
+        self.seen = 0
+        self.sampled = 0
+        self.cpu_usage = 0.0
+        # 上一次调整时的时间、线程CPU时间及计数，需在抓包线程中初始化
+        self._last_adjust: Optional[tuple] = None
+
+    def get_config(self) -> Dict:
+        return {'rate': 0 if self.adaptive else self.rate, 'method': self.method, 'cpu_budget': self.cpu_budget,
+                'max_rate': self.max_rate, 'adjust_interval': self._adjust_itv}
+
+    def accept(self, flow_key: Optional[bytes]) -> bool:
+        """
+        判断报文是否被采样，只能在抓包线程中调用
+        """
+        self.seen += 1
+        if self.adaptive and self.seen & 0x3ff == 0:
+            self._adjust()
+
+        if self.rate == 1:
+            self.sampled += 1
+            return True
+        if self.method == SAMPLE_METHOD_FLOW and flow_key is not None:
+            # 两个方向的报文使用同一个哈希，保证同一条连接的收发被同时采样
+            hit = (zlib.crc32(flow_key[0:4]) ^ zlib.crc32(flow_key[4:8])
+                   ^ zlib.crc32(flow_key[8:10]) ^ zlib.crc32(flow_key[10:12])) % self.rate == 0
+        else:
+            self._counter += 1
+            hit = self._counter >= self.rate
+            if hit:
+                self._counter = 0
+        if hit:
+            self.sampled += 1
+        return hit
+
+    def _adjust(self) -> None:
+        now, cpu_time = time.monotonic(), time.thread_time()
+        if self._last_adjust is None:
+            self._last_adjust = (now, cpu_time, self.seen, self.sampled)
+            return
+        last_now, last_cpu_time, last_seen, last_sampled = self._last_adjust
+        elapsed = now - last_now
+        if elapsed < self._adjust_itv:
+            return
+        self._last_adjust = (now, cpu_time, self.seen, self.sampled)
+
+        self.cpu_usage = (cpu_time - last_cpu_time) / elapsed
+        sampled = self.sampled - last_sampled
+        if sampled <= 0:
+            return
+        pkt_rate = (self.seen - last_seen) / elapsed
+        cost_per_sample = (cpu_time - last_cpu_time) / sampled
+        self.rate = max(1, min(self.max_rate, math.ceil(pkt_rate * cost_per_sample / self.cpu_budget)))
+
+    def get_stats(self) -> Dict:
+        return {'rate': self.rate, 'method': self.method, 'adaptive': self.adaptive, 'seen': self.seen,
+                'sampled': self.sampled, 'cpu': self.cpu_usage}
+
+
+def merge_sampler_stats(stats_list: List[Dict]) -> Optional[Dict]:
+    """
+    汇总各抓包线程（子进程）采样器的统计：seen、sampled及CPU占用累加，rate取其中最大的采样率
+    """
+    if len(stats_list) == 0:
+        return None
+    return {'rate': max(stats['rate'] for stats in stats_list), 'method': stats_list[0]['method'],
+            'adaptive': stats_list[0]['adaptive'], 'seen': sum(stats['seen'] for stats in stats_list),
+            'sampled': sum(stats['sampled'] for stats in stats_list),
+            'cpu': sum(stats['cpu'] for stats in stats_list)}
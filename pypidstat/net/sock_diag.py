@@ -0,0 +1,252 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: sock_diag.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 17:00
+"""
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pypidstat.core.process_stat import ProcSys
+from pypidstat.core.predicate import Predicate
+from pypidstat.net.top_talkers import TopTalkers
+
+# linux/netlink.h、linux/sock_diag.h、linux/inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+INET_DIAG_INFO = 2
+TCP_LISTEN = 10
+
+_NLMSG_HDR = struct.Struct('=IHHII')
+# struct inet_diag_req_v2: family, protocol, ext, pad, states, inet_diag_sockid
+_INET_DIAG_REQ_V2 = struct.Struct('=BBBBI48s')
+# struct inet_diag_msg: family, state, timer, retrans, sport, dport, src[16], dst[16], if, cookie[2],
+# expires, rqueue, wqueue, uid, inode
+_INET_DIAG_MSG = struct.Struct('=BBBB2s2s16s16sI8sIIIII')
+_RTATTR_HDR = struct.Struct('=HH')
+
+# struct tcp_info中使用的字段偏移
+_TCPI_BYTES_ACKED = 120
+_TCPI_BYTES_RECEIVED = 128
+_TCPI_SEGS_OUT = 136
+_TCPI_SEGS_IN = 140
+
+
+def _align4(length: int) -> int:
+    return (length + 3) & ~3
+
+
+class SockDiagClient(object):
+    """
+    通过NETLINK_SOCK_DIAG一次性导出主机上所有TCP连接及其内核计数（INET_DIAG_INFO中的tcp_info）
+    """
+
+    def __init__(self, recv_size: int = 1 << 20):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+        self._recv_size = recv_size
+        self._seq = 0
+
+    def dump_tcp(self, family: int = socket.AF_INET) -> Dict[int, Tuple[str, List[int]]]:
+        """
+        导出指定协议族中除LISTEN以外所有状态的TCP连接
+        Args:
+            family: socket.AF_INET或socket.AF_INET6
+
+        Returns:
+            key为socket的inode，value为(conn_key, [segs_out, bytes_acked, segs_in, bytes_received])
+        """
+        self._seq += 1
+        states = 0xfff & ~(1 << TCP_LISTEN)
+        req = _INET_DIAG_REQ_V2.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), 0, states, b'')
+        self._sock.send(_NLMSG_HDR.pack(_NLMSG_HDR.size + len(req), SOCK_DIAG_BY_FAMILY,
+                                        NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0) + req)
+
+        addr_len = 4 if family == socket.AF_INET else 16
+        sockets: Dict[int, Tuple[str, List[int]]] = {}
+        while True:
+            data = self._sock.recv(self._recv_size)
+            offset = 0
+            while offset + _NLMSG_HDR.size <= len(data):
+                msg_len, msg_type, _, _, _ = _NLMSG_HDR.unpack_from(data, offset)
+                if msg_type == NLMSG_DONE:
+                    return sockets
+                if msg_type == NLMSG_ERROR:
+                    errno = -struct.unpack_from('=i', data, offset + _NLMSG_HDR.size)[0]
+                    raise OSError(errno, f"sock_diag dump failed: {os.strerror(errno)}")
+                self._parse_msg(data, offset + _NLMSG_HDR.size, offset + msg_len, family, addr_len, sockets)
+                offset += _align4(msg_len)
+
+    @staticmethod
+    def _parse_msg(data: bytes, start: int, end: int, family: int, addr_len: int,
+                   sockets: Dict[int, Tuple[str, List[int]]]) -> None:
+        _, _, _, _, sport, dport, src, dst, _, _, _, _, _, _, inode = _INET_DIAG_MSG.unpack_from(data, start)
+        if inode == 0:
+            # TIME_WAIT等已经不属于任何进程的连接
+            return
+        counters = None
+        offset = start + _INET_DIAG_MSG.size
+        while offset + _RTATTR_HDR.size <= end:
+            attr_len, attr_type = _RTATTR_HDR.unpack_from(data, offset)
+            if attr_len < _RTATTR_HDR.size:
+                break
+            if attr_type == INET_DIAG_INFO and attr_len - _RTATTR_HDR.size >= _TCPI_SEGS_IN + 4:
+                info = offset + _RTATTR_HDR.size
+                bytes_acked, bytes_received = struct.unpack_from('=QQ', data, info + _TCPI_BYTES_ACKED)
+                segs_out, segs_in = struct.unpack_from('=II', data, info + _TCPI_SEGS_OUT)
+                counters = [segs_out, bytes_acked, segs_in, bytes_received]
+            offset += _align4(attr_len)
+        if counters is None:
+            return
+
+        local_ip = socket.inet_ntop(family, src[:addr_len])
+        remote_ip = socket.inet_ntop(family, dst[:addr_len])
+        conn_key = f"{local_ip}:{struct.unpack('!H', sport)[0]}-{remote_ip}:{struct.unpack('!H', dport)[0]}"
+        sockets[inode] = (conn_key, counters)
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class SockDiagStat(threading.Thread):
+    """
+    不抓包的进程流量统计：每个周期通过sock_diag读取所有TCP连接的内核计数（已确认的发送字节数、接收字节数、收发报文段数），
+    经由socket的inode关联到观测进程，累计得到进程和连接的流量。
+    每个周期的开销与连接数成正比，与报文数无关，并且覆盖所有网卡（包括lo）。
+    回调参数的格式与NetCapStat相同。
+    """
+
+    def __init__(self, pids: Optional[List[int]] = None, cmd_regex: str = None, interval: float = 1,
+                 call_back: Callable[[Dict, Dict], None] = None, top_conns: Optional[int] = None,
+                 predicate: Optional[Predicate] = None):
+        super().__init__()
+        self.daemon = True
+        self.name = "pidstat_sock_diag_thread"
+
+        self._itv = interval
+        if pids is not None and isinstance(pids, List):
+            self._pids = pids
+            self._cmd_regex = None
+        else:
+            self._pids = None
+            self._cmd_regex = cmd_regex
+        # 进程的过滤表达式，仅观测可能满足表达式的进程
+        self._predicate = predicate
+        # 主循环已按cmd_regex和过滤表达式过滤的观测进程，设置后不再由本线程扫描/proc
+        self._shared_pids: Optional[List[int]] = None
+        self._call_back = call_back
+        self._top_conns = top_conns
+
+        self.run_flag = True
+        self._sys_proc = ProcSys()
+        self._client = SockDiagClient()
+
+        # 上一次读取的各socket的计数，key为inode，value为[pid, conn_key, counters]
+        self._sock_last: Dict[int, List] = {}
+        # 上一次读取到的所有socket（包括不属于观测进程的）的inode，为None表示尚未读取。
+        # 此前已存在的socket只作为基线，不计入流量，避免将其整个生命周期的流量计入一个周期
+        self._prev_inodes: Optional[Set[int]] = None
+        self._traffic_pid_map: Dict[int, List[int]] = {}
+        self._traffic_pid_conn_map: Dict[int, TopTalkers] = {}
+
+        self._stats = {'sockets': 0, 'watched_sockets': 0, 'poll_ms': 0.0}
+
+    def set_watched_pids(self, pids: List[int]) -> None:
+        # 由主循环在每次刷新进程列表后设置
+        self._shared_pids = list(pids)
+
+    def _get_watched_pids(self) -> List[int]:
+        shared_pids = self._shared_pids
+        if shared_pids is not None:
+            return shared_pids
+        pids = self._pids if self._pids is not None else self._sys_proc.get_proc_pid_list(self._cmd_regex)
+        if self._predicate is not None:
+            pids = self._predicate.filter_pids(pids, self._sys_proc, record_stats=False)
+        return pids
+
+    def _poll(self) -> None:
+        start = time.monotonic()
+        sockets = self._client.dump_tcp(socket.AF_INET)
+        sockets.update(self._client.dump_tcp(socket.AF_INET6))
+
+        inode_pid: Dict[int, int] = {}
+        watched_pids: Set[int] = set()
+        for pid in self._get_watched_pids():
+            try:
+                pid_inodes = self._sys_proc.get_proc_pid_socket_inodes(pid)
+            except OSError:
+                # 进程已经退出
+                continue
+            watched_pids.add(pid)
+            for inode in pid_inodes & sockets.keys():
+                inode_pid[inode] = pid
+
+        # 删除不再观测的进程
+        for pid in list(self._traffic_pid_map.keys()):
+            if pid not in watched_pids:
+                del self._traffic_pid_map[pid]
+                self._traffic_pid_conn_map.pop(pid, None)
+        for pid in watched_pids:
+            if pid not in self._traffic_pid_map:
+                self._traffic_pid_map[pid] = [0, 0, 0, 0, 0]
+                self._traffic_pid_conn_map[pid] = TopTalkers(self._top_conns)
+
+        # 已经关闭的连接，最后一次读取之后的流量无法得到
+        for inode in self._sock_last.keys() - inode_pid.keys():
+            pid, conn_key, _ = self._sock_last.pop(inode)
+            if pid in self._traffic_pid_conn_map:
+                self._traffic_pid_conn_map[pid].discard(conn_key)
+
+        for inode, pid in inode_pid.items():
+            conn_key, counters = sockets[inode]
+            last = self._sock_last.get(inode)
+            if last is not None:
+                prev_counters = last[2]
+            elif self._prev_inodes is None or inode in self._prev_inodes:
+                # 已存在的连接（首次读取时，或此前属于未观测的进程）以当前值为基线
+                prev_counters = counters
+            else:
+                # 上次读取之后新建立的连接从0开始计算
+                prev_counters = [0, 0, 0, 0]
+            self._sock_last[inode] = [pid, conn_key, counters]
+
+            send_cnt, send_bytes, recv_cnt, recv_bytes = (curr - prev for curr, prev in zip(counters, prev_counters))
+            if send_cnt == 0 and recv_cnt == 0:
+                continue
+            proc_traffic = self._traffic_pid_map[pid]
+            proc_traffic[0] += send_cnt
+            proc_traffic[1] += send_bytes
+            proc_traffic[2] += recv_cnt
+            proc_traffic[3] += recv_bytes
+            talkers = self._traffic_pid_conn_map[pid]
+            talkers.add(conn_key, 'send', send_cnt, send_bytes)
+            talkers.add(conn_key, 'recv', recv_cnt, recv_bytes)
+
+        self._prev_inodes = set(sockets.keys())
+        self._stats = {'sockets': len(sockets), 'watched_sockets': len(inode_pid),
+                       'poll_ms': (time.monotonic() - start) * 1000}
+
+    def run(self):
+        try:
+            while self.run_flag:
+                self._poll()
+                self._call_back(self._traffic_pid_map,
+                                {pid: talkers.to_dict() for pid, talkers in self._traffic_pid_conn_map.items()})
+                time.sleep(self._itv)
+        finally:
+            self._client.close()
+
+    def get_cap_stats(self) -> Dict[str, Dict]:
+        return {'sock_diag': dict(self._stats)}
+
+    def stop(self) -> None:
+        self.run_flag = False
@@ -0,0 +1,96 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: top_talkers.py
+@Author: thirsd@sina.com
+@Date: 2026/10/19 16:10
+"""
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+# 连接统计项的下标：[发送包数, 发送字节数, 接收包数, 接收字节数, 采样包数, 加入序号, 误差上界, 总字节数]
+CONN_SEND_CNT, CONN_SEND_BYTES, CONN_RECV_CNT, CONN_RECV_BYTES, CONN_SAMPLES, CONN_SEQ, CONN_ERROR, CONN_WEIGHT \
+    = range(8)
+
+
+class TopTalkers(object):
+    """
+    按字节数统计单个进程流量最大的连接（Space-Saving算法），最多保留capacity个连接，内存固定。
+    连接表已满时，新连接替换当前字节数最小的连接，并继承其字节数作为误差上界。
+    最小值通过惰性删除的小顶堆查找：堆中记录的字节数不大于实际值，弹出时与实际值不一致则以实际值重新入堆。
+    capacity为None时不淘汰，等同于精确统计所有连接。
+    """
+
+    # 加入序号全局递增，连接被淘汰后重新加入时序号不同，计算速率时不与之前的统计值相减
+    _seq = itertools.count(1)
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self._entries: Dict[str, List[int]] = {}
+        self._heap: List[Tuple[int, str]] = []
+        self.evictions = 0
+
+    def add(self, conn_key: str, direction: str, pkt_cnt: int, byte_cnt: int, sample_cnt: int = 0) -> None:
+        entry = self._entries.get(conn_key)
+        if entry is None:
+            entry = self._admit(conn_key)
+        if direction == 'send':
+            entry[CONN_SEND_CNT] += pkt_cnt
+            entry[CONN_SEND_BYTES] += byte_cnt
+        else:
+            entry[CONN_RECV_CNT] += pkt_cnt
+            entry[CONN_RECV_BYTES] += byte_cnt
+        entry[CONN_SAMPLES] += sample_cnt
+        entry[CONN_WEIGHT] += byte_cnt
+
+    def _admit(self, conn_key: str) -> List[int]:
+        min_weight = 0
+        if self.capacity is not None and len(self._entries) >= self.capacity:
+            min_key, min_weight = self._pop_min()
+            del self._entries[min_key]
+            self.evictions += 1
+        entry = [0, 0, 0, 0, 0, next(self._seq), min_weight, min_weight]
+        self._entries[conn_key] = entry
+        if self.capacity is not None:
+            heapq.heappush(self._heap, (min_weight, conn_key))
+            # 堆中的过期项过多时重建
+            if len(self._heap) > 2 * self.capacity + 64:
+                self._heap = [(entry[CONN_WEIGHT], key) for key, entry in self._entries.items()]
+                heapq.heapify(self._heap)
+        return entry
+
+    def _pop_min(self) -> Tuple[str, int]:
+        while True:
+            weight, conn_key = heapq.heappop(self._heap)
+            entry = self._entries.get(conn_key)
+            if entry is None:
+                # 连接已经关闭
+                continue
+            if entry[CONN_WEIGHT] != weight:
+                heapq.heappush(self._heap, (entry[CONN_WEIGHT], conn_key))
+                continue
+            return conn_key, weight
+
+    def discard(self, conn_key: str) -> None:
+        # 连接关闭后删除，堆中对应的项在弹出时跳过
+        self._entries.pop(conn_key, None)
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[str, List[int]]]:
+        """
+        返回字节数最大的k个连接，按字节数从大到小排列
+        """
+        items = self._entries.items()
+        if k is None:
+            return sorted(((key, list(entry)) for key, entry in items), key=lambda x: -x[1][CONN_WEIGHT])
+        return [(key, list(entry)) for key, entry in heapq.nlargest(k, items, key=lambda x: x[1][CONN_WEIGHT])]
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        return {conn_key: list(entry) for conn_key, entry in self._entries.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conn_key: str) -> bool:
+        return conn_key in self._entries
@@ -1,12 +1,19 @@
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 import time
 import sys
 import os
 import signal
+import atexit
+import math
 sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(os.path.dirname(__file__)))))
 
-from pypidstat.core import ProcessStat, ProcSys
-from pypidstat.net import ProcNetStat
+from pypidstat.core import ProcessStat, ProcSys, ProcAttrCache, SystemSnapshot, ShmPublisher, ShmReader, \
+    AdaptiveScheduler, BudgetScheduler, ProcEventMonitor, SmapsRollupCache, Predicate, ParquetSink, WaitStateSampler, \
+    HistoryStore
+from pypidstat.base.proc_sys import FD_MODE_COUNT
+from pypidstat.base.taskstats import create_proc_sys
+from pypidstat.base.perf_event import PerfEventCollector
+from pypidstat.net import ProcNetStat, PacketSampler, resolve_devs, is_all_devs
 from pypidstat.utils import format_float_str
 
 self_pid = os.getpid()
@@ -15,69 +22,507 @@ self_pid = os.getpid()
 def print_header(args):
     header_str = f"{'Time':<20} {'PID':<6} {'User':<8}"
     if args.cpu:
-        header_str += f"{'%usr':<6} {'%sys':<6} {'%guest':<6} {'%wait':<6} {'%CPU':<6} {'CPU_ID':<8}"
+        # 归一化时%CPU为相对于主机全部CPU时间的占比
+        cpu_title = '%CPU/h' if args.cpu_norm else '%CPU'
+        header_str += f"{'%usr':<6} {'%sys':<6} {'%guest':<6} {'%wait':<6} {cpu_title:<6} {'CPU_ID':<8}{'%core':<6} "
     if args.memory:
         header_str += f"{'minflt/s':<8} {'majflt/s':<8} {'VSZ':<8} {'RSS':<8} {'VmPeak(KB)':<12} {'%MEM':<6}"
+        if args.pss:
+            header_str += f" {'PSS':<8} {'USS':<8} {'SwapPss':<8} {'PssAnon':<8} {'PssFile':<8} {'%PSS':<6}"
     if args.disk:
         header_str += f"{'kB_rd/s':<8} {'kB_wr/s':<8} {'kB_cwr/s':<8} {'iodelay':^10}"
     if args.switch:
         header_str += f"{'cswch/s':<8} {'nvcswch/s':<10}"
+    if args.taskstats:
+        header_str += f"{'%cpu_dly':<8} {'%blk_dly':<8} {'%swp_dly':<8}"
+    if args.perf:
+        header_str += f"{'%tclk':<7} {'ctxsw/s':<8} {'migr/s':<7} {'flt/s':<8}"
     if args.network:
-        header_str += f"{'s_cnt/s':<8} {'s_byte/s':<10} {'r_cnt/s':<8} {'r_byte/s':<10}"
+        if args.sample is not None and args.net_backend == 'pcap':
+            # 采样得到的流量为估计值，列名以~标识，并增加误差列
+            header_str += f"{'~s_cnt/s':<8} {'~s_byte/s':<10} {'~r_cnt/s':<8} {'~r_byte/s':<10} {'±err%':<7}"
+        else:
+            header_str += f"{'s_cnt/s':<8} {'s_byte/s':<10} {'r_cnt/s':<8} {'r_byte/s':<10}"
 
     header_str += f"{'Command':<50}"
     return header_str
 
 
-def print_row(prev: ProcessStat, curr: ProcessStat, args, itv):
-    row_str = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(curr.curr_timestamp)):<20} {curr.proc_id:<6} " \
-              f"{curr.attrs['owner']:<8}"
+def collect_row(prev: ProcessStat, curr: ProcessStat, args, itv) -> Dict:
+    """
+    计算进程在本周期的各项负载，返回以字段名为key的字典，字段名与base.fields.shm_record_fields一致
+    """
+    # 以0为基准时采样时间相同，时间跨度为统计周期
+    age = curr.curr_timestamp - prev.curr_timestamp
+    row = {'timestamp': curr.curr_timestamp, 'age': age if age > 0 else itv, 'pid': curr.proc_id,
+           'user': curr.attrs['owner'], 'comm': curr.attrs['comm'], 'cmdline': curr.attrs['cmdline']}
     if args.cpu:
-        c_cpu_loads = curr.get_cpu_loads(prev, itv=itv)
-        row_str += f"{format_float_str(c_cpu_loads['%usr'], 6, 2):^6} " \
-                   f"{format_float_str(c_cpu_loads['%system'], 6, 2):^6} " \
-                   f"{format_float_str(c_cpu_loads['%guest'], 6, 2):^6} " \
-                   f"{format_float_str(c_cpu_loads['%wait'], 6, 2):^6} " \
-                   f"{format_float_str(c_cpu_loads['%CPU'], 6, 2):^6} {c_cpu_loads['CPU_ID']:^8}"
+        row.update(curr.get_cpu_loads(prev, itv=itv))
     if args.memory:
-        c_memory_loads = curr.get_mem_loads(prev, itv=itv)
-        row_str += f"{format_float_str(c_memory_loads['minflt/s'], 8, 1):^8} " \
-                   f"{format_float_str(c_memory_loads['majflt/s'], 8, 1):^8} " \
-                   f"{format_float_str(c_memory_loads['vsize'], 8, 1):^8} " \
-                   f"{format_float_str(c_memory_loads['rss'], 8, 1):^8} " \
-                   f"{format_float_str(c_memory_loads['VmPeak(KB)'], 12, 1):^12} " \
-                   f"{format_float_str(c_memory_loads['%MEM'], 6, 2):^6}"
+        row.update(curr.get_mem_loads(prev, itv=itv))
+        if args.pss:
+            row.update(curr.get_pss_loads(prev, itv=itv))
     if args.disk:
-        c_disk_loads = curr.get_io_loads(prev, itv=itv)
-        row_str += f"{format_float_str(c_disk_loads['kB_rd/s'], 8, 1):^8} " \
-                   f"{format_float_str(c_disk_loads['kB_wr/s'], 8, 1):^8} " \
-                   f"{format_float_str(c_disk_loads['kB_cwr/s'], 8, 0):^8} " \
-                   f"{format_float_str(c_disk_loads['iodelay'], 8, 0):^10}"
+        row.update(curr.get_io_loads(prev, itv=itv))
     if args.switch:
-        c_switch_loads = curr.get_ctx_switch_loads(prev, itv=itv)
-        row_str += f"{format_float_str(c_switch_loads['cswch/s'], 8, 0):^8} " \
-                   f"{format_float_str(c_switch_loads['nvcswch/s'], 10, 0):^10} "
+        row.update(curr.get_ctx_switch_loads(prev, itv=itv))
+    if args.taskstats:
+        row.update(curr.get_delay_loads(prev, itv=itv))
+    if args.perf:
+        perf_loads = curr.get_perf_loads(prev, itv=itv)
+        if perf_loads is not None:
+            row.update(perf_loads)
     if args.network:
         c_network_loads = curr.get_net_loads(prev, itv=itv)
-        row_str += f"{format_float_str(c_network_loads['send_packet_cnt/s'], 8, 0):<8} " \
-                   f"{format_float_str(c_network_loads['send_packet_bytes/s'], 10, 0):<10} " \
-                   f"{format_float_str(c_network_loads['recv_packet_cnt/s'], 8, 0):<8} " \
-                   f"{format_float_str(c_network_loads['recv_packet_bytes/s'], 10, 0):<10} "
+        if c_network_loads is not None:
+            row.update(c_network_loads)
+    return row
+
+
+def needs_status(args, predicate: Optional[Predicate] = None) -> bool:
+    """
+    是否需要读取完整的/proc/pid/status：内存负载（VmPeak）及过滤表达式中的status字段需要，
+    上下文切换次数可以单独获取
+    """
+    return args.memory or (predicate is not None and 'status' in predicate.stages)
+
+
+def _format_value(value: Optional[float], width: int, precision: int) -> str:
+    # 缺失的值展示为-
+    return format_float_str(value, width, precision) if value is not None else '-'
+
+
+def format_row(row: Dict, args) -> str:
+    row_str = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['timestamp'])):<20} {row['pid']:<6} " \
+              f"{row['user']:<8}"
+    if args.cpu:
+        row_str += f"{_format_value(row.get('%usr'), 6, 2):^6} " \
+                   f"{_format_value(row.get('%system'), 6, 2):^6} " \
+                   f"{_format_value(row.get('%guest'), 6, 2):^6} " \
+                   f"{_format_value(row.get('%wait'), 6, 2):^6} " \
+                   f"{_format_value(row.get('%CPU_norm' if args.cpu_norm else '%CPU'), 6, 2):^6} " \
+                   f"{row.get('CPU_ID', '-'):^8}{_format_value(row.get('%core'), 6, 1):^6} "
+    if args.memory:
+        row_str += f"{_format_value(row.get('minflt/s'), 8, 1):^8} " \
+                   f"{_format_value(row.get('majflt/s'), 8, 1):^8} " \
+                   f"{_format_value(row.get('vsize'), 8, 1):^8} " \
+                   f"{_format_value(row.get('rss'), 8, 1):^8} " \
+                   f"{_format_value(row.get('VmPeak(KB)'), 12, 1):^12} " \
+                   f"{_format_value(row.get('%MEM'), 6, 2):^6}"
+        if args.pss:
+            row_str += f" {_format_value(row.get('PSS'), 8, 1):^8} " \
+                       f"{_format_value(row.get('USS'), 8, 1):^8} " \
+                       f"{_format_value(row.get('SwapPss'), 8, 1):^8} " \
+                       f"{_format_value(row.get('Pss_Anon'), 8, 1):^8} " \
+                       f"{_format_value(row.get('Pss_File'), 8, 1):^8} " \
+                       f"{_format_value(row.get('%PSS'), 6, 2):^6}"
+    if args.disk:
+        row_str += f"{_format_value(row.get('kB_rd/s'), 8, 1):^8} " \
+                   f"{_format_value(row.get('kB_wr/s'), 8, 1):^8} " \
+                   f"{_format_value(row.get('kB_cwr/s'), 8, 0):^8} " \
+                   f"{_format_value(row.get('iodelay'), 8, 0):^10}"
+    if args.switch:
+        row_str += f"{_format_value(row.get('cswch/s'), 8, 0):^8} " \
+                   f"{_format_value(row.get('nvcswch/s'), 10, 0):^10} "
+    if args.taskstats:
+        row_str += f"{_format_value(row.get('%cpu_delay'), 8, 2):^8} " \
+                   f"{_format_value(row.get('%blkio_delay'), 8, 2):^8} " \
+                   f"{_format_value(row.get('%swapin_delay'), 8, 2):^8} "
+    if args.perf:
+        row_str += f"{_format_value(row.get('%task_clock'), 7, 2):^7} " \
+                   f"{_format_value(row.get('ctx_switches/s'), 8, 0):^8} " \
+                   f"{_format_value(row.get('cpu_migrations/s'), 7, 0):^7} " \
+                   f"{_format_value(row.get('page_faults/s'), 8, 0):^8} "
+    if args.network:
+        row_str += f"{_format_value(row.get('send_packet_cnt/s'), 8, 0):<8} " \
+                   f"{_format_value(row.get('send_packet_bytes/s'), 10, 0):<10} " \
+                   f"{_format_value(row.get('recv_packet_cnt/s'), 8, 0):<8} " \
+                   f"{_format_value(row.get('recv_packet_bytes/s'), 10, 0):<10} "
+        if args.sample is not None and args.net_backend == 'pcap':
+            row_str += f"{_format_value(row.get('error%'), 7, 1):<7} "
     if args.long:
-        row_str += f"{curr.attrs['cmdline']:<50}"
+        row_str += f"{row['cmdline']:<50}"
     else:
-        row_str += f"{curr.attrs['comm']:<50}"
+        row_str += f"{row['comm']:<50}"
     return row_str
 
 
+def print_row(prev: ProcessStat, curr: ProcessStat, args, itv):
+    return format_row(collect_row(prev, curr, args, itv), args)
+
+
+def print_top_conns(prev: ProcessStat, curr: ProcessStat, args, itv) -> List[str]:
+    # 输出进程流量最大的连接，每个连接一行
+    conn_loads = curr.get_net_conn_loads(prev, itv=itv, top=args.top_conns)
+    if conn_loads is None:
+        return []
+    return [f"{'':<20} {'':<6} {'':<8}{conn_key:<44} "
+            f"s_byte/s={format_float_str(loads['send_packet_bytes/s'], 10, 0):<10} "
+            f"r_byte/s={format_float_str(loads['recv_packet_bytes/s'], 10, 0):<10} "
+            f"s_cnt/s={format_float_str(loads['send_packet_cnt/s'], 8, 0):<8} "
+            f"r_cnt/s={format_float_str(loads['recv_packet_cnt/s'], 8, 0):<8}"
+            + (f" err<={loads['error']}B" if loads['error'] > 0 else "")
+            for conn_key, loads in conn_loads.items()]
+
+
+def print_cpu_stats(curr: SystemSnapshot, prev: SystemSnapshot):
+    # 输出主机的CPU使用率及各核的繁忙程度
+    cpu_loads = curr.get_cpu_loads(prev)
+    host = cpu_loads['cpu']
+    print(f"# cpu: busy={host['%busy']:.1f}% usr={host['%user']:.1f}% sys={host['%system']:.1f}% "
+          f"iowait={host['%io_wait']:.1f}% irq={host['%irq'] + host['%soft_irq']:.1f}% steal={host['%steal']:.1f}%")
+    cores = [f"{name}={load['%busy']:.1f}%" for name, load in cpu_loads.items() if name != 'cpu']
+    print(f"# cores: {' '.join(cores)}")
+
+
+def print_cap_stats(cap_stats: Dict[str, Dict]):
+    if 'sock_diag' in cap_stats:
+        print(f"# sock_diag: {' '.join(f'{k}={v}' for k, v in cap_stats['sock_diag'].items())}")
+        return
+    neg_cache = cap_stats['neg_cache']
+    print(f"# neg_cache: size={neg_cache['size']} hits={neg_cache['hits']} misses={neg_cache['misses']} "
+          f"hit_rate={neg_cache['hit_rate'] * 100:.1f}% evictions={neg_cache['evictions']} "
+          f"invalidations={neg_cache['invalidations']}")
+    print(f"# filter: {cap_stats['filter']['filter_exp']}")
+    print(f"# netns: {' '.join(f'{k}={v}' for k, v in cap_stats['netns'].items())}")
+    for dev, dev_stats in cap_stats['capture'].items():
+        print(f"# capture[{dev}]: {' '.join(f'{k}={v}' for k, v in dev_stats.items())}")
+    if cap_stats['sampling'] is not None:
+        sampling = cap_stats['sampling']
+        print(f"# sampling(estimated): rate=1/{sampling['rate']} method={sampling['method']} "
+              f"adaptive={sampling['adaptive']} seen={sampling['seen']} sampled={sampling['sampled']} "
+              f"cpu={sampling['cpu'] * 100:.1f}%")
+
+
+def print_wait_stats(wait_sampler: WaitStateSampler, args):
+    """
+    展示周期内各进程阻塞最多的(状态, wchan, 系统调用)，不展示运行状态的采样
+    """
+    histogram = wait_sampler.pop_histogram()
+    summary = WaitStateSampler.summarize(histogram['entries'], states=args.wait_states.split(','))
+    for pid, entries in summary.items():
+        for entry in entries[:args.wait_top]:
+            print(f"# wait: pid={pid} state={entry['state']} wchan={entry['wchan']} syscall={entry['syscall']} "
+                  f"samples={entry['count']} pct={entry['pct']:.1f}%")
+    if args.verbose:
+        print(f"# wait_sampler: {' '.join(f'{k}={v}' for k, v in wait_sampler.get_stats().items())} "
+              f"interval_dropped={histogram['dropped']}")
+
+
+def print_history(history: HistoryStore):
+    """
+    输出各进程最近一小时各指标的min/avg/max，按分钟汇总计算；不足一分钟的进程使用原始采样
+    """
+    now = time.time()
+    print("# history (min/avg/max of the last hour):")
+    for pid in sorted(history.pids()):
+        items = []
+        for metric in history.metrics:
+            minutes = [m for m in history.query(pid, metric, start=now - 3600, resolution='1m')
+                       if not math.isnan(m[2])]
+            if len(minutes) > 0:
+                v_min, v_avg, v_max = min(m[1] for m in minutes), sum(m[2] for m in minutes) / len(minutes), \
+                    max(m[3] for m in minutes)
+            else:
+                values = [v for _, v in history.query(pid, metric, resolution='raw') if not math.isnan(v)]
+                if len(values) == 0:
+                    # 未采集的指标
+                    continue
+                v_min, v_avg, v_max = min(values), sum(values) / len(values), max(values)
+            items.append(f"{metric}={v_min:.2f}/{v_avg:.2f}/{v_max:.2f}")
+        print(f"# {pid}: {' '.join(items)}")
+
+
+def get_wait_pids(args, pids: List[int]) -> List[int]:
+    """
+    等待状态采样的进程：--wait_pids指定的进程，否则为-p或--where选出的进程，最多--wait_max_pids个
+    """
+    wait_pids = parse_pids(args.wait_pids)
+    return (wait_pids if wait_pids is not None else pids)[:args.wait_max_pids]
+
+
+def collect_exited_rows(exited: List[Dict], baselines: List[Dict[int, ProcessStat]], args, itv,
+                        predicate: Optional[Predicate] = None) -> List[Dict]:
+    """
+    计算退出进程在本周期的负载：以进程最近一次的统计为基准，没有统计的进程（两次统计之间启动并退出）以0为基准，
+    速率按统计周期计算，即进程在本周期内的消耗；基准早于一个统计周期时（自适应采样或预算顺延），
+    速率按基准到最终计数器的实际间隔计算。无法读取最终计数器的进程不输出
+    """
+    rows = []
+    for record in exited:
+        final: Optional[ProcessStat] = record['stat']
+        if final is None:
+            continue
+        baseline = None
+        for stats in baselines:
+            candidate = stats.get(record['pid'])
+            if candidate is not None and candidate.stat_info['start_time'] == final.stat_info['start_time']:
+                baseline = candidate
+                break
+        row_itv = itv
+        if baseline is None:
+            baseline = final.zero_baseline()
+        else:
+            row_itv = max(itv, final.curr_timestamp - baseline.curr_timestamp)
+        row = collect_row(baseline, final, args, itv=row_itv)
+        if predicate is not None and not predicate.accept(final, row):
+            continue
+        rows.append(row)
+    return rows
+
+
+def print_exited(exited: List[Dict], snapshot: SystemSnapshot):
+    # 输出退出进程的汇总：退出码、存活时间、CPU时间、读写字节数
+    for record in exited:
+        final: Optional[ProcessStat] = record['stat']
+        line = f"# exited: pid={record['pid']} exit_code={record['exit_code']} signal={record['term_signal']}"
+        if final is None:
+            print(f"{line} counters=unavailable")
+            continue
+        uptime_at_exit = snapshot.get_uptime_sec() - (snapshot.curr_timestamp - record['exit_time'])
+        lifetime = uptime_at_exit - float(final.stat_info['start_time']) / snapshot.clk_tick
+        cpu_time = float(final.stat_info['utime'] + final.stat_info['stime']) / snapshot.clk_tick
+        print(f"{line} comm={final.attrs['comm']} lifetime={lifetime:.2f}s cpu={cpu_time:.2f}s "
+              f"rd={final.io_info.get('read_bytes', 0) // 1024}KB wr={final.io_info.get('write_bytes', 0) // 1024}KB "
+              f"cmdline={final.attrs['cmdline']}")
+
+
+def accept_exited(record: Dict, watch_pids: Optional[List[int]], args, predicate: Optional[Predicate] = None) -> bool:
+    # 退出的进程同样按PID列表、命令行正则、--where和--ignore过滤，--where中依赖输出行的字段在计算负载后判断
+    import re
+    if watch_pids is not None and record['pid'] not in watch_pids:
+        return False
+    if args.ignore and record['pid'] == self_pid:
+        return False
+    if predicate is not None and (record['stat'] is None or predicate.match(record['stat']) is False):
+        return False
+    if args.comm_regex is not None:
+        return record['stat'] is not None and re.match(args.comm_regex, record['stat'].attrs['cmdline']) is not None
+    return True
+
+
+def parse_pids(pids_str: str) -> Optional[List[int]]:
+    # 解析以逗号分割的进程PID列表
+    if pids_str is None or str(pids_str).strip() == "":
+        return None
+    return [int(pid.strip()) for pid in str(pids_str).split(',') if pid.strip().isdigit()]
+
+
+def attach_main(args):
+    """
+    查看模式：读取采集进程发布到共享内存的统计并输出，不访问/proc
+    """
+    import re
+    watch_pids = parse_pids(args.pids)
+    comm_pattern = re.compile(args.comm_regex) if args.comm_regex is not None else None
+    # 共享内存的记录中没有进程状态等字段，这些字段为未知，不满足表达式
+    predicate = Predicate(args.where) if args.where is not None else None
+    reader = ShmReader(args.attach)
+    cnt = args.count if args.count is not None else -1
+
+    print(print_header(args))
+    last_seq = -1
+    try:
+        while True:
+            if not reader.wait_next(last_seq, timeout=max(args.itv, reader.interval) * 3):
+                print(f"# no update from {args.attach}")
+                continue
+            header, rows = reader.read()
+            last_seq = header['seq']
+            for row in rows:
+                if watch_pids is not None and row['pid'] not in watch_pids:
+                    continue
+                if comm_pattern is not None and comm_pattern.match(row['cmdline']) is None:
+                    continue
+                if predicate is not None and not predicate.accept(row=row):
+                    continue
+                print(format_row(row, args))
+
+            if cnt > 0:
+                cnt -= 1
+            elif cnt == 0:
+                break
+            time.sleep(args.itv)
+    finally:
+        reader.close()
+
+
+def adaptive_loop(args, get_refresh_pids, attr_cache: ProcAttrCache, proc_sys: ProcSys, global_proc_net_traffic,
+                  publisher: Optional[ShmPublisher], cnt: int, itv: float, get_exited=None,
+                  perf_collector: Optional[PerfEventCollector] = None,
+                  smaps_cache: Optional[SmapsRollupCache] = None, predicate: Optional[Predicate] = None,
+                  sink: Optional[ParquetSink] = None, wait_sampler: Optional[WaitStateSampler] = None,
+                  budget: Optional[BudgetScheduler] = None, history: Optional[HistoryStore] = None):
+    """
+    自适应采样：每个进程按各自的周期采样，空闲进程降低采样频率，高负载进程短时间内高频采样。
+    速率按进程两次采样的实际间隔计算；进程列表每个统计周期刷新一次，cnt按统计周期计数。
+    """
+    scheduler = AdaptiveScheduler(interval=itv, max_period=args.max_period, burst_interval=args.burst_itv,
+                                  burst_cpu=args.burst_cpu, burst_majflt=args.burst_majflt,
+                                  burst_ticks=args.burst_ticks)
+    # 采集模式下每个周期发布所有进程最近一次的统计
+    last_rows: Dict[int, Dict] = {}
+    read_status = needs_status(args, predicate)
+    next_refresh = time.time()
+    while True:
+        now = time.time()
+        refresh = now >= next_refresh
+        pids = None
+        if refresh:
+            if budget is not None:
+                # 刷新进程列表和过滤进程的耗时计入本周期的预算
+                budget.start_tick()
+            pids = get_refresh_pids(args=args)
+            attr_cache.evict(pids)
+            if smaps_cache is not None:
+                smaps_cache.evict(pids)
+            if perf_collector is not None:
+                perf_collector.attach(pids)
+            if wait_sampler is not None:
+                wait_sampler.set_pids(get_wait_pids(args, pids))
+            if budget is not None:
+                budget.evict(pids)
+            pid_set = set(pids)
+            for pid in [pid for pid in last_rows.keys() if pid not in pid_set]:
+                del last_rows[pid]
+            next_refresh = now + itv
+
+        due_pids = scheduler.due(pids, now)
+        snapshot = SystemSnapshot.take() if len(due_pids) > 0 else None
+        if budget is None:
+            proc_sys.prefetch(due_pids)
+        # 超出预算未采集的进程仍然到期，在下次唤醒时采集；有预算时只预读计划采集的进程
+        for pid in (budget.plan(due_pids, now, prefetch=proc_sys.prefetch) if budget is not None else due_pids):
+            ps_stat = ProcessStat(proc_id=pid, attr_cache=attr_cache, snapshot=snapshot, fd_mode=FD_MODE_COUNT,
+                                  proc_sys=proc_sys, smaps_cache=smaps_cache, read_status=read_status,
+                                  read_smaps=args.pss)
+            try:
+                # 过滤进程时读取的数据源只在刷新进程列表的这次唤醒中复用
+                ps_stat.init(sources=predicate.pop_sources(pid) if predicate is not None and refresh else None)
+            except OSError:
+                # 进程已经退出或者无权限读取
+                continue
+            if perf_collector is not None:
+                ps_stat.set_perf_counters(perf_collector.read(pid))
+            if args.network:
+                ps_stat.set_proc_traffic(
+                    proc_net_traffic=global_proc_net_traffic.get_pid_net_traffic(pid),
+                    proc_net_conn_traffic=global_proc_net_traffic.get_pid_conn_net_traffic(pid),
+                    sampled=global_proc_net_traffic.sampled
+                )
+            prev_pid_stat: Optional[ProcessStat] = scheduler.get_last_sample(pid)
+            scheduler.update(pid, ps_stat, now)
+            if budget is not None:
+                budget.record(pid, prev_pid_stat, ps_stat)
+            if prev_pid_stat is None or prev_pid_stat.stat_info['start_time'] != ps_stat.stat_info['start_time']:
+                continue
+
+            elapsed = ps_stat.curr_timestamp - prev_pid_stat.curr_timestamp
+            row = collect_row(prev_pid_stat, ps_stat, args, itv=elapsed)
+            if predicate is not None and not predicate.accept(ps_stat, row):
+                last_rows.pop(pid, None)
+                continue
+            if sink is not None:
+                sink.append(row)
+            if history is not None:
+                history.add(pid, row['timestamp'], row)
+            if publisher is not None:
+                last_rows[pid] = row
+                continue
+            print(format_row(row, args))
+            if args.network and args.top_conns is not None:
+                for conn_row in print_top_conns(prev_pid_stat, ps_stat, args, itv=elapsed):
+                    print(conn_row)
+
+        if refresh and get_exited is not None:
+            # 退出的进程以最近一次的采样为基准
+            exited = get_exited()
+            last_samples = {record['pid']: scheduler.get_last_sample(record['pid']) for record in exited}
+            exited_rows = collect_exited_rows(exited, [{pid: stat for pid, stat in last_samples.items()
+                                                        if stat is not None}], args, itv=itv, predicate=predicate)
+            if sink is not None:
+                sink.extend(exited_rows)
+            if history is not None:
+                history.add_rows(exited_rows)
+            if publisher is not None:
+                for row in exited_rows:
+                    last_rows.pop(row['pid'], None)
+            else:
+                for row in exited_rows:
+                    print(format_row(dict(row, comm=f"{row['comm']}(exited)"), args))
+                print_exited(exited, SystemSnapshot.take())
+
+        if refresh:
+            if publisher is not None:
+                publisher.publish(list(last_rows.values()), timestamp=now)
+            elif args.verbose:
+                print(f"# scheduler: {' '.join(f'{k}={v}' for k, v in scheduler.get_stats().items())}")
+                if budget is not None:
+                    print(f"# budget: {' '.join(f'{k}={v}' for k, v in budget.get_stats().items())}")
+                if predicate is not None:
+                    print(f"# where: {' '.join(f'{k}={v}' for k, v in predicate.get_stats().items())}")
+                if args.network:
+                    print_cap_stats(global_proc_net_traffic.get_cap_stats())
+            if wait_sampler is not None and publisher is None:
+                print_wait_stats(wait_sampler, args)
+
+            if cnt > 0:
+                cnt -= 1
+            elif cnt == 0:
+                break
+        delay = min(scheduler.next_wakeup(time.time()), max(0.0, next_refresh - time.time()))
+        if budget is not None and budget.last_tick['skipped'] > 0:
+            # 预算用完时顺延的进程仍然到期，等到下个周期再采集，避免反复唤醒
+            delay = max(delay, budget.next_wakeup())
+        time.sleep(delay)
+
+
 def main(args):
+    if args.pss:
+        args.memory = True
+    if args.attach is not None:
+        return attach_main(args)
+
+    watch_pids = parse_pids(args.pids)
+    # 过滤表达式编译一次，读取/proc时按数据源的代价分阶段过滤进程
+    predicate = Predicate(args.where) if args.where is not None else None
+    publisher = None
+    if args.daemon is not None:
+        # 采集模式计算所有的统计项，由查看进程选择展示的列
+        args.cpu = args.memory = args.disk = args.switch = True
+        publisher = ShmPublisher(args.daemon, capacity=args.shm_capacity, interval=args.itv)
+        # 退出时删除共享内存
+        atexit.register(publisher.close)
+    # 导出Parquet，退出时写入缓冲的行并关闭文件
+    sink = None
+    if args.parquet is not None:
+        sink = ParquetSink(args.parquet, row_group_size=args.row_group, rotate_rows=args.rotate_rows)
+        atexit.register(sink.close)
+    # 在内存中保存进程的多级历史，采集模式下供嵌入采集循环的调用方查询，否则退出时输出汇总
+    history = None
+    if args.history is not None:
+        history = HistoryStore(max_pids=args.history)
+        if publisher is None:
+            atexit.register(print_history, history)
+
+    # 通过proc connector的进程事件维护进程列表，不可用时每个周期扫描/proc
+    proc_monitor = None
+    if args.proc_events:
+        try:
+            proc_monitor = ProcEventMonitor(cmd_regex=args.comm_regex)
+            proc_monitor.start()
+        except OSError as e:
+            print(f"# proc connector is not available, scan /proc instead: {e}")
+
     def get_refresh_pids(args):
-        all_pids = ProcSys().get_proc_pid_list()
-        if args.pids is not None and str(args.pids).strip() != "":
-            curr_pids = [int(pid.strip()) for pid in str(args.pids).strip(',') if
-                         pid.isdigit() and int(pid.strip()) in all_pids]
+        all_pids = proc_monitor.get_pids() if proc_monitor is not None else ProcSys().get_proc_pid_list()
+        if watch_pids is not None:
+            alive_pids = set(all_pids)
+            curr_pids = [pid for pid in watch_pids if pid in alive_pids]
         elif args.comm_regex is not None:
-            curr_pids = ProcSys().get_proc_pid_list(args.comm_regex)
+            # 进程事件可用时按缓存的命令行过滤，否则扫描/proc
+            curr_pids = proc_monitor.get_matched_pids() if proc_monitor is not None \
+                else ProcSys().get_proc_pid_list(args.comm_regex)
         elif args.pids is None and args.comm_regex is None:
             curr_pids = all_pids
         else:
@@ -85,26 +530,48 @@ def main(args):
 
         if args.ignore:
             curr_pids = [pid for pid in curr_pids if pid != self_pid]
+        if predicate is not None and budget is not None:
+            # 按采集的优先级求值，预算用完后未求值的进程保留，由accept在采集后判断
+            curr_pids = predicate.filter_pids(budget.order(curr_pids), proc_sys, attr_cache, keep_sources=True,
+                                              deadline=budget.deadline)
+        elif predicate is not None:
+            # 保留通过的进程已读取的stat、status等，采集时不再重复读取
+            curr_pids = predicate.filter_pids(curr_pids, proc_sys, attr_cache, keep_sources=True)
+        if global_proc_net_traffic is not None:
+            # 网络统计线程直接使用已过滤的进程，不再各自扫描/proc
+            global_proc_net_traffic.set_watched_pids(curr_pids)
 
         return curr_pids
 
     if args.network:
-        # 如果未设置网卡，则默认去第一块网卡
-        if args.dev is not None:
+        # 如果未设置网卡，则默认取第一块已启用的非lo网卡；all时保持原样，由统计线程跟随网卡的增删；sockdiag不抓包，无需网卡
+        if args.net_backend == 'sockdiag' or is_all_devs(args.dev):
             dev = args.dev
         else:
-            from pypidstat.net import get_dev_interface
-            dev = [dev_name for dev_name, dev_dict in get_dev_interface().items() if dev_name != 'lo'][0]
+            dev = resolve_devs(args.dev)
+        # 设置采样率时启用报文采样，0表示根据CPU预算自适应采样率
+        sampler = PacketSampler(rate=args.sample, method=args.sample_method, cpu_budget=args.cpu_budget) \
+            if args.sample is not None and args.net_backend == 'pcap' else None
         # 启动进程网卡的统计线程
-        global_proc_net_traffic = ProcNetStat(dev=dev, pids=args.pids, cmd_regex=args.comm_regex, interval=1)
+        global_proc_net_traffic = ProcNetStat(dev=dev, pids=watch_pids, cmd_regex=args.comm_regex, interval=1,
+                                              filter_exp=args.filter, auto_filter=args.auto_filter,
+                                              cap_workers=args.cap_workers, cap_mode=args.cap_mode, sampler=sampler,
+                                              top_conns=args.top_conns, backend=args.net_backend, predicate=predicate)
     else:
         global_proc_net_traffic = None
 
     cnt = args.count if args.count is not None else -1
     itv = args.itv if args.itv is not None else 2
 
+    def get_exited():
+        return [record for record in proc_monitor.pop_exited() if accept_exited(record, watch_pids, args, predicate)]
+
     def signal_handler(sign, frame):
         print('Caught Ctrl+C / SIGINT signal')
+        if proc_monitor is not None:
+            proc_monitor.stop()
+        if wait_sampler is not None:
+            wait_sampler.stop()
         if global_proc_net_traffic is not None:
             global_proc_net_traffic.stop()
             time.sleep(0.5)
@@ -117,11 +584,47 @@ def main(args):
         signal.signal(sig, signal_handler)
     # signal.signal(signal.SIGINT, signal_handler)
 
-    print(print_header(args))
+    # 进程静态属性缓存，跨周期共享，进程退出后清理
+    attr_cache = ProcAttrCache()
+    # 进程信息的读取方式，taskstats不可用时回退到/proc
+    proc_sys = create_proc_sys(taskstats=args.taskstats)
+    # smaps_rollup读取代价较高，每个进程按--pss_refresh的周期读取
+    smaps_cache = SmapsRollupCache(proc_sys, refresh=args.pss_refresh) if args.pss else None
+    # perf软件事件计数，不可用时不展示相关列
+    perf_collector = None
+    if args.perf:
+        try:
+            perf_collector = PerfEventCollector(max_pids=args.perf_max_pids)
+        except OSError as e:
+            print(f"# perf_event_open is not available: {e}")
+            args.perf = False
+    # 高频采样观测进程各线程的等待状态，每个周期展示阻塞的分布
+    wait_sampler = None
+    if args.wait_sampler and args.wait_pids is None and args.pids is None and args.where is None:
+        # 不指定进程时观测的进程为任意的前wait_max_pids个，采样结果没有意义
+        print("# wait sampler requires --wait_pids, -p or --where, disabled")
+    elif args.wait_sampler:
+        wait_sampler = WaitStateSampler(hz=args.wait_hz)
+        wait_sampler.start()
+    # 每个周期采集的时间预算，按优先级采集进程，超出预算的进程顺延到下个周期
+    budget = None
+    if args.budget is not None:
+        budget = BudgetScheduler(interval=itv, budget=args.budget, watched=watch_pids, hot_cpu=args.burst_cpu,
+                                 hot_ticks=args.burst_ticks)
+
+    if publisher is None:
+        print(print_header(args))
     time.sleep(2)
+    if args.adaptive:
+        return adaptive_loop(args, get_refresh_pids, attr_cache, proc_sys, global_proc_net_traffic, publisher, cnt,
+                             itv, get_exited=get_exited if proc_monitor is not None else None,
+                             perf_collector=perf_collector, smaps_cache=smaps_cache, predicate=predicate,
+                             sink=sink, wait_sampler=wait_sampler, budget=budget, history=history)
+    read_status = needs_status(args, predicate)
     stat_keep: List[Union[Dict[int, ProcessStat], None]] = [{}, {}]
     prev = 0
     curr = 1
+    prev_snapshot: Optional[SystemSnapshot] = None
     while True:
         # 上一个和当前项转换
         curr, prev = 1 - curr, 1 - prev
@@ -129,32 +632,119 @@ def main(args):
         if stat_keep[curr] is not None:
             stat_keep[curr].clear()
 
-        # 获取当前进程的最新负载值
+        # 获取当前进程的最新负载值，刷新进程列表和过滤进程的耗时计入本周期的预算
+        if budget is not None:
+            budget.start_tick()
         pids = get_refresh_pids(args=args)
-        for pid in pids:
-            ps_stat = ProcessStat(proc_id=pid)
-            ps_stat.init()
+        attr_cache.evict(pids)
+        if smaps_cache is not None:
+            smaps_cache.evict(pids)
+        if perf_collector is not None:
+            perf_collector.attach(pids)
+        if wait_sampler is not None:
+            wait_sampler.set_pids(get_wait_pids(args, pids))
+        if budget is not None:
+            budget.evict(pids)
+        # 主机快照每个周期采集一次，由本周期的所有进程共享
+        snapshot = SystemSnapshot.take()
+        # taskstats时批量查询本周期所有进程；有预算时只预读计划采集的进程
+        if budget is None:
+            proc_sys.prefetch(pids)
+        for pid in (budget.plan(pids, snapshot.curr_timestamp, prefetch=proc_sys.prefetch)
+                    if budget is not None else pids):
+            # 输出中不展示fd明细，仅统计数量
+            ps_stat = ProcessStat(proc_id=pid, attr_cache=attr_cache, snapshot=snapshot, fd_mode=FD_MODE_COUNT,
+                                  proc_sys=proc_sys, smaps_cache=smaps_cache, read_status=read_status,
+                                  read_smaps=args.pss)
+            try:
+                ps_stat.init(sources=predicate.pop_sources(pid) if predicate is not None else None)
+            except OSError:
+                # 进程已经退出或者无权限读取
+                continue
+            if perf_collector is not None:
+                ps_stat.set_perf_counters(perf_collector.read(pid))
             if args.network:
                 ps_stat.set_proc_traffic(
                     proc_net_traffic=global_proc_net_traffic.get_pid_net_traffic(pid),
-                    proc_net_conn_traffic=global_proc_net_traffic.get_pid_conn_net_traffic(pid)
+                    proc_net_conn_traffic=global_proc_net_traffic.get_pid_conn_net_traffic(pid),
+                    sampled=global_proc_net_traffic.sampled
                 )
+            if budget is not None:
+                budget.record(pid, stat_keep[prev].get(pid), ps_stat)
             stat_keep[curr][pid] = ps_stat
+        if budget is not None:
+            # 超出预算未采集的进程保留上一次的采样作为基准，下个周期按实际间隔计算
+            for pid in pids:
+                if pid not in stat_keep[curr] and pid in stat_keep[prev]:
+                    stat_keep[curr][pid] = stat_keep[prev][pid]
+
+        if args.verbose and args.cpu and prev_snapshot is not None and publisher is None:
+            print_cpu_stats(snapshot, prev_snapshot)
+        prev_snapshot = snapshot
+        if args.verbose and args.network and publisher is None:
+            print_cap_stats(global_proc_net_traffic.get_cap_stats())
+        if args.verbose and perf_collector is not None and publisher is None:
+            print(f"# perf: {' '.join(f'{k}={v}' for k, v in perf_collector.get_stats().items())}")
+        if args.verbose and predicate is not None and publisher is None:
+            print(f"# where: {' '.join(f'{k}={v}' for k, v in predicate.get_stats().items())}")
+        if args.verbose and proc_monitor is not None and publisher is None:
+            print(f"# proc_events: {' '.join(f'{k}={v}' for k, v in proc_monitor.get_stats().items())}")
+        if args.verbose and budget is not None and publisher is None:
+            print(f"# budget: {' '.join(f'{k}={v}' for k, v in budget.get_stats().items())}")
 
         # 如果上一个记录非空，则可以进行打印负载
         if stat_keep[prev] is not None:
+            rows = []
             for pid in stat_keep[curr].keys():
                 # 进程ID在Prev保存记录，可以进行打印
                 if pid in stat_keep[prev]:
                     curr_pid_stat: ProcessStat = stat_keep[curr][pid]
                     prev_pid_stat: ProcessStat = stat_keep[prev][pid]
-                    print(print_row(prev_pid_stat, curr_pid_stat, args, itv=itv))
+                    if curr_pid_stat is prev_pid_stat:
+                        # 本周期未采集
+                        continue
+                    # 有预算时基准可能是更早周期的采样，速率按实际间隔计算
+                    pid_itv = curr_pid_stat.curr_timestamp - prev_pid_stat.curr_timestamp if budget is not None else itv
+                    row = collect_row(prev_pid_stat, curr_pid_stat, args, itv=pid_itv)
+                    if predicate is not None and not predicate.accept(curr_pid_stat, row):
+                        continue
+                    if sink is not None:
+                        sink.append(row)
+                    if history is not None:
+                        history.add(pid, row['timestamp'], row)
+                    if publisher is not None:
+                        rows.append(row)
+                        continue
+                    print(format_row(row, args))
+                    if args.network and args.top_conns is not None:
+                        for conn_row in print_top_conns(prev_pid_stat, curr_pid_stat, args, itv=pid_itv):
+                            print(conn_row)
+            if proc_monitor is not None:
+                # 周期内退出的进程，以本周期或上一周期的统计为基准计入本周期
+                exited = get_exited()
+                for row in collect_exited_rows(exited, [stat_keep[curr], stat_keep[prev]], args, itv=itv,
+                                               predicate=predicate):
+                    if sink is not None:
+                        sink.append(row)
+                    if history is not None:
+                        history.add(row['pid'], row['timestamp'], row)
+                    if publisher is not None:
+                        rows.append(row)
+                    else:
+                        print(format_row(dict(row, comm=f"{row['comm']}(exited)"), args))
+                if publisher is None:
+                    print_exited(exited, snapshot)
+            if publisher is not None:
+                publisher.publish(rows, timestamp=snapshot.curr_timestamp)
+            elif wait_sampler is not None:
+                print_wait_stats(wait_sampler, args)
 
         if cnt > 0:
             cnt -= 1
         elif cnt == 0:
             break
-        time.sleep(itv)
+        # 有预算时按固定节拍开始下个周期
+        time.sleep(budget.next_wakeup() if budget is not None else itv)
 
 
 if __name__ == "__main__":
@@ -171,14 +761,75 @@ if __name__ == "__main__":
     parser.add_argument("-v", "--verbose", action="store_true", help="increase output verbosity")
     parser.add_argument('-u', "--cpu", action="store_true", help="显示各个进程的cpu使用统计", default=False)
     parser.add_argument('-r', "--memory", action="store_true", help="显示各个进程的内存使用统计", default=False)
+    parser.add_argument("--pss", action="store_true", default=False,
+                        help="读取/proc/$pid/smaps_rollup，在内存统计中增加PSS、USS、SwapPss及匿名页和文件页的PSS，隐含-r")
+    parser.add_argument("--pss_refresh", type=float, default=10.0, help="每个进程重新读取smaps_rollup的最短间隔（秒）")
     parser.add_argument('-w', "--switch", action="store_true", help="显示每个进程的上下文切换情况", default=False)
     parser.add_argument('-d', "--disk", action="store_true", help="显示各个进程的IO使用情况", default=False)
     parser.add_argument('-n', "--network", action="store_true", help="显示各进程的网络情况", default=False)
     parser.add_argument('-l', "--long", action="store_true", help="显示命令名和所有参数", default=False)
     parser.add_argument('-p', "--pids", type=str, help="设置进程PID列表，以逗号分割", default=None)
     parser.add_argument("--comm_regex", type=str, help="命令行过滤正则表达式")
-    parser.add_argument("--dev", type=str, help="设置网络监听的网卡。如果未设置，则默认设置第一块网卡")
+    parser.add_argument("--where", type=str, default=None,
+                        help="进程过滤表达式，如\"user=postgres and state in (R,D) and rss>1G and %%CPU>5\"，"
+                             "支持and/or/not、括号、=、!=、>、<、~（正则）、in (...)；先按stat等低代价的字段过滤")
+    parser.add_argument("--dev", type=str,
+                        help="设置网络监听的网卡，多块网卡以逗号分割，all表示所有网卡。如果未设置，则默认设置第一块网卡")
     parser.add_argument("--ignore", action="store_true", help="过滤自身程序")
+    parser.add_argument("--net_backend", type=str, choices=['pcap', 'sockdiag'], default='pcap',
+                        help="网络统计方式：pcap为抓包统计，sockdiag读取内核中TCP连接的计数（无需抓包，覆盖所有网卡）")
+    parser.add_argument("--filter", type=str, help="设置抓包的BPF过滤表达式", default=None)
+    parser.add_argument("--auto_filter", action="store_true", help="根据观测进程的连接自动生成BPF过滤表达式", default=False)
+    parser.add_argument("--cap_mode", type=str, choices=['pcap', 'ring'], default='pcap',
+                        help="抓包方式：pcap使用libpcap，ring使用AF_PACKET的TPACKET_V3环形缓冲区")
+    parser.add_argument("--cap_workers", type=int, help="抓包子进程数量，大于1时使用PACKET_FANOUT多进程抓包", default=0)
+    parser.add_argument("--top_conns", type=int, default=None,
+                        help="每个进程仅保留字节数最多的K个连接的流量统计，并在进程行下方展示")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="报文采样率N，每N个报文处理1个并按N放大作为估计值；0表示根据--cpu_budget自适应")
+    parser.add_argument("--sample_method", type=str, choices=['count', 'flow'], default='count',
+                        help="采样方式：count按报文计数采样，flow按流哈希采样")
+    parser.add_argument("--cpu_budget", type=float, default=0.05, help="自适应采样时抓包线程的CPU预算（单核占比）")
+    parser.add_argument("--daemon", type=str, default=None,
+                        help="采集模式：每个周期将所有进程的统计发布到指定名称的共享内存，不输出")
+    parser.add_argument("--attach", type=str, default=None,
+                        help="查看模式：读取采集进程发布到指定名称共享内存的统计，无需访问/proc和root权限")
+    parser.add_argument("--cpu_norm", action="store_true", default=False,
+                        help="%%CPU按主机全部CPU时间归一化（所有核满载为100%%），而非单核的百分比")
+    parser.add_argument("--taskstats", action="store_true", default=False,
+                        help="通过netlink taskstats批量获取进程的调度和延迟统计，并展示CPU、块设备IO、换入的等待时间占比；"
+                             "不可用时回退到/proc")
+    parser.add_argument("--perf", action="store_true", default=False,
+                        help="通过perf_event_open软件事件精确统计task-clock、上下文切换、CPU迁移和缺页次数")
+    parser.add_argument("--perf_max_pids", type=int, default=256, help="perf事件最多同时观测的进程数")
+    parser.add_argument("--wait_sampler", action="store_true", default=False,
+                        help="高频采样观测进程各线程的状态、wchan和系统调用，每个周期展示阻塞最多的等待点（off-CPU分布）")
+    parser.add_argument("--wait_hz", type=float, default=100, help="等待状态的采样频率（Hz）")
+    parser.add_argument("--wait_pids", type=str, default=None,
+                        help="等待状态采样的进程PID列表，以逗号分割，默认为-p或--where选出的进程")
+    parser.add_argument("--wait_max_pids", type=int, default=32, help="等待状态最多同时采样的进程数")
+    parser.add_argument("--wait_top", type=int, default=5, help="每个进程展示的等待点数量")
+    parser.add_argument("--wait_states", type=str, default="D",
+                        help="展示的线程状态，以逗号分割，默认为不可中断睡眠D；空闲的线程大多处于可中断睡眠S，需要时指定D,S")
+    parser.add_argument("--proc_events", action="store_true", default=False,
+                        help="通过netlink proc connector的进程事件维护进程列表，并统计两次统计之间启动并退出的进程")
+    parser.add_argument("--adaptive", action="store_true", default=False,
+                        help="自适应采样：空闲进程逐次延长采样周期，高负载进程短时间内高频采样")
+    parser.add_argument("--max_period", type=float, default=None, help="空闲进程的最长采样周期（秒），默认为8个统计周期")
+    parser.add_argument("--burst_itv", type=float, default=None, help="高负载进程的采样周期（秒），默认为统计周期的1/4")
+    parser.add_argument("--burst_cpu", type=float, default=80.0, help="%%CPU超过该值时进入高频采样")
+    parser.add_argument("--burst_majflt", type=float, default=100.0, help="majflt/s超过该值时进入高频采样")
+    parser.add_argument("--burst_ticks", type=int, default=10, help="进入高频采样后持续的采样次数")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="每个周期采集进程统计的时间预算（秒）：按显式观测、最近高负载（%%CPU超过--burst_cpu）、其余的顺序采集，"
+                             "超出预算的进程顺延到下个周期优先采集，速率按实际间隔计算")
+    parser.add_argument("--parquet", type=str, default=None,
+                        help="将每个周期的统计按列导出为Parquet文件，参数为文件名前缀（需要pyarrow）")
+    parser.add_argument("--row_group", type=int, default=65536, help="Parquet每个row group的行数，即缓冲的最大行数")
+    parser.add_argument("--rotate_rows", type=int, default=10000000, help="每个Parquet文件的最大行数，写满后切换文件")
+    parser.add_argument("--history", type=int, default=None,
+                        help="在内存中保存最多N个进程的多级历史（原始采样、按分钟和按小时汇总），退出时输出各进程最近一小时的汇总")
+    parser.add_argument("--shm_capacity", type=int, default=4096, help="共享内存中最多保存的进程记录数")
 
     i_args = parser.parse_args()
 
@@ -1,9 +1,14 @@
 import functools
 import os
 import pwd
-from typing import Union
+from typing import Dict, Iterable, Optional, Tuple, Union
 import math
 
+# /etc/passwd的修改时间及对应的uid->用户信息映射，仅在文件变化时重建
+_PASSWD_PATH = '/etc/passwd'
+_uid_user_mtime = None
+_uid_user_map: Dict[int, Dict] = {}
+
 
 @functools.lru_cache(maxsize=2)
 def get_all_users():
@@ -11,6 +16,27 @@ def get_all_users():
     return user_list
 
 
+def get_uid_user_map() -> Dict[int, Dict]:
+    """
+    返回uid到用户信息的映射字典。仅当/etc/passwd的mtime发生变化时重新加载
+    Returns:
+        key为uid，value为用户信息{'name', 'uid', 'gid'}
+    """
+    global _uid_user_mtime, _uid_user_map
+    try:
+        mtime = os.stat(_PASSWD_PATH).st_mtime_ns
+    except OSError:
+        mtime = -1
+
+    if mtime != _uid_user_mtime:
+        uid_user_map = {}
+        for user in pwd.getpwall():
+            # 同一uid存在多个用户名时，保留/etc/passwd中的第一个
+            uid_user_map.setdefault(user.pw_uid, {'name': user.pw_name, 'uid': user.pw_uid, 'gid': user.pw_gid})
+        _uid_user_map, _uid_user_mtime = uid_user_map, mtime
+    return _uid_user_map
+
+
 @functools.lru_cache(maxsize=2)
 def get_page_size() -> int:
     return int(os.sysconf("SC_PAGE_SIZE"))
@@ -54,3 +80,42 @@ def format_float_str(f: float, width: int = 6, precision: int = 1):
         return f"{f:<.{precision}f}"
     else:
         return f"{f:<.{precision}E}"
+
+
+def get_sample_error(sample_cnt: int, z: float = 1.96) -> Optional[float]:
+    """
+    返回按包计数采样（每rate个报文取一个）估算流量时95%置信度下的相对误差（百分比），近似为z/sqrt(n)
+    Args:
+        sample_cnt: 周期内实际处理的采样包数
+        z: 置信度对应的正态分布分位数
+
+    Returns:
+        返回相对误差的百分比，没有采样包时返回None
+    """
+    if sample_cnt <= 0:
+        return None
+    return z / math.sqrt(sample_cnt) * 100
+
+
+def get_flow_sample_error(flow_deltas: Iterable[Tuple[int, int, int]], z: float = 1.96) -> Optional[float]:
+    """
+    返回按流采样估算字节数时95%置信度下的相对误差（百分比）。
+    每个流以1/rate的概率被整体采样，估计值为被采样流的字节数之和乘以rate，其方差为Σ(rate-1)/rate*B²
+    （B为流放大后的字节数），误差由被采样的流决定而不是报文数；各流大小相同时近似为z*sqrt((1-1/rate)/被采样的流数)
+    Args:
+        flow_deltas: 周期内各流的(放大后的包数, 放大后的字节数, 实际处理的包数)，流的采样率由前两者之比得到
+        z: 置信度对应的正态分布分位数
+
+    Returns:
+        返回相对误差的百分比，周期内没有被采样的流时返回None
+    """
+    total_bytes, variance = 0, 0.0
+    for pkt_cnt, byte_cnt, sample_cnt in flow_deltas:
+        if sample_cnt <= 0 or byte_cnt <= 0:
+            continue
+        rate = max(1.0, pkt_cnt / sample_cnt)
+        total_bytes += byte_cnt
+        variance += (rate - 1) / rate * byte_cnt * byte_cnt
+    if total_bytes <= 0:
+        return None
+    return z * math.sqrt(variance) / total_bytes * 100
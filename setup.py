@@ -23,6 +23,8 @@ setuptools.setup(
     url="https://gitee.com/thirsd/pypidstat",
     packages=setuptools.find_packages(),
     install_requires=['dpkt>=1.9.8', 'libpcap>=1.11.0b2', 'pypcap>=1.3.0'],
+    # numpy用于向量化计算各CPU核的使用率，未安装时逐行计算；pyarrow用于导出Parquet
+    extras_require={'numpy': ['numpy'], 'parquet': ['pyarrow']},
     entry_points={
         'console_scripts': [
             'pypidstat=pypidstat:main'
@@ -0,0 +1,30 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_bpf
+@Author: thirsd@sina.com
+@Date: 2026/10/19 11:30
+"""
+
+from pypidstat.net.bpf import gen_bpf_filter, get_conn_local_endpoint, BPF_SYN_EXP
+
+
+def test_gen_bpf_filter():
+    assert get_conn_local_endpoint('10.0.0.1:7000-10.0.0.2:51234') == ('10.0.0.1', 7000)
+
+    endpoints = {('10.0.0.1', 7000), ('0.0.0.0', 8080)}
+    filter_exp = gen_bpf_filter(endpoints, user_filter='not port 22')
+    print(filter_exp)
+    assert filter_exp == f'(not port 22) and (tcp and ({BPF_SYN_EXP} or (host 10.0.0.1 and port 7000) or port 8080))'
+
+    # 条件过多时降级为仅端口、仅地址
+    endpoints = {('10.0.0.1', port) for port in range(100)}
+    assert gen_bpf_filter(endpoints, max_terms=200).count('host') == 100
+    assert gen_bpf_filter({('10.0.0.1', 80), ('10.0.0.2', 80)}, max_terms=1) == f'tcp and ({BPF_SYN_EXP} or port 80)'
+    assert gen_bpf_filter(endpoints, max_terms=10) == f'tcp and ({BPF_SYN_EXP} or host 10.0.0.1)'
+    assert gen_bpf_filter(endpoints | {('0.0.0.0', 22)}, max_terms=10) == 'tcp'
+
+
+if __name__ == "__main__":
+    test_gen_bpf_filter()
@@ -0,0 +1,68 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_export
+@Author: thirsd@sina.com
+@Date: 2026/10/20 14:30
+"""
+import glob
+import os
+import tempfile
+
+from pypidstat.core import ParquetSink
+from pypidstat.core.export import pa, pq
+
+
+def test_parquet_sink():
+    if pa is None:
+        print("pyarrow is not installed")
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = os.path.join(tmp_dir, 'pidstat')
+        sink = ParquetSink(prefix, row_group_size=10, rotate_rows=25)
+        for i in range(57):
+            row = {'timestamp': 1700000000.123456 + i, 'pid': 100 + i % 3, 'user': 'root', 'comm': f'proc{i % 3}',
+                   'cmdline': '', '%CPU': i / 3.0, 'CPU_ID': i % 4 if i % 5 else None}
+            if i % 7 == 0:
+                row['%CPU'] = None
+            sink.append(row)
+            # 缓冲的行数不超过row_group_size
+            assert sink.get_stats()['pending'] < 10
+        # 写入中的文件不可见
+        assert len(glob.glob(f'{prefix}-*.inprogress')) == 1
+        sink.close()
+
+        files = sorted(glob.glob(f'{prefix}-*.parquet'))
+        # 文件按row group写入，行数达到rotate_rows后切换
+        assert files == sorted(sink.files) and len(files) == 2
+        assert [pq.ParquetFile(f).metadata.num_rows for f in files] == [30, 27]
+        assert pq.ParquetFile(files[0]).num_row_groups == 3
+        assert sink.get_stats() == {'rows': 57, 'row_groups': 6, 'files': 2, 'pending': 0}
+
+        table = pa.concat_tables([pq.read_table(f) for f in files])
+        data = table.to_pydict()
+        # 数值保留原始精度，缺失的值为null
+        assert data['%CPU'][1] == 1 / 3.0 and data['%CPU'][0] is None and data['%CPU'][7] is None
+        assert data['CPU_ID'][0] is None and data['CPU_ID'][1] == 1
+        assert data['pid'][:3] == [100, 101, 102] and data['comm'][2] == 'proc2'
+        assert table.column('timestamp')[0].value == 1700000000123456
+        assert data['rss'][0] is None
+
+
+def test_parquet_sink_columns():
+    if pa is None:
+        print("pyarrow is not installed")
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sink = ParquetSink(os.path.join(tmp_dir, 'pidstat'), columns=['timestamp', 'pid', '%CPU', '%core'])
+        sink.extend([{'timestamp': 1.0, 'pid': 1, '%CPU': 5.0, '%core': 50.0, 'comm': 'a'}])
+        sink.close()
+        table = pq.read_table(sink.files[0])
+        assert table.column_names == ['timestamp', 'pid', '%CPU', '%core']
+        assert table.column('%core').to_pylist() == [50.0]
+
+
+if __name__ == "__main__":
+    test_parquet_sink()
+    test_parquet_sink_columns()
@@ -0,0 +1,67 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_fanout
+@Author: thirsd@sina.com
+@Date: 2026/10/21 11:40
+"""
+import multiprocessing
+import time
+from queue import Queue
+
+from test_flow_cache import make_tcp_frame
+
+from pypidstat.net.flow_cache import make_flow_key
+from pypidstat.net.sampling import PacketSampler
+
+
+def test_accumulate_flow():
+    try:
+        from pypidstat.net.fanout import _accumulate_flow
+    except ImportError as e:
+        print(f"pcap is not available: {e}")
+        return
+    flow_key = make_flow_key('10.0.0.1', 1234, '10.0.0.2', 80)
+    flows = {}
+    _accumulate_flow(flows, make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100, tcp_flags=0x02))
+    _accumulate_flow(flows, make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=30, tcp_flags=0x10))
+    _accumulate_flow(flows, make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, proto=17))
+    assert flows == {flow_key: [2, 170, 0x12, 2]}
+
+    # 采样时按采样率放大包数和字节数
+    sampler = PacketSampler(rate=4, method='flow')
+    flows = {}
+    for port in range(1000):
+        _accumulate_flow(flows, make_tcp_frame('10.0.0.1', port, '10.0.0.2', 80, payload_len=80), sampler)
+    assert 0 < len(flows) < 1000 and all(flow == [4, 400, 0x18, 1] for flow in flows.values())
+
+
+def test_worker_error():
+    try:
+        from pypidstat.net.fanout import FanoutNetCap, _fanout_worker
+    except ImportError as e:
+        print(f"pcap is not available: {e}")
+        return
+    # 子进程的异常通过结果队列发送给统计线程
+    result_queue = multiprocessing.Queue()
+    _fanout_worker('pidstat_no_such_dev', None, 1, result_queue, multiprocessing.Queue(), multiprocessing.Event(), 0.1)
+    cmd, message = result_queue.get(timeout=5)
+    assert cmd == 'error' and 'Error' in message
+
+    cap = FanoutNetCap('pidstat_no_such_dev', Queue(), workers=2)
+    cap.start()
+    try:
+        deadline = time.monotonic() + 10
+        while cap.get_stats()['errors'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        stats = cap.get_stats()
+        print(stats)
+        assert stats['errors'] == 2 and 'last_error' in stats
+    finally:
+        cap.stop()
+
+
+if __name__ == "__main__":
+    test_accumulate_flow()
+    test_worker_error()
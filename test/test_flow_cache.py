@@ -0,0 +1,100 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_flow_cache
+@Author: thirsd@sina.com
+@Date: 2026/10/19 10:45
+"""
+import socket
+import struct
+import threading
+
+from pypidstat.net.flow_cache import FlowNegativeCache, make_flow_key, reverse_flow_key, parse_flow_key, \
+    conn_key_to_flow_key, get_raw_flow_key, parse_raw_tcp
+
+
+def make_tcp_frame(src_ip: str, src_port: int, dst_ip: str, dst_port: int, payload_len: int = 0,
+                   tcp_flags: int = 0x18, ip_opt_len: int = 0, eth_type: bytes = b'\x08\x00', proto: int = 6) -> bytes:
+    """
+    构造以太网IPv4的TCP报文，ip_opt_len为IP头选项的长度（4的倍数）
+    """
+    ip_hdr_len = 20 + ip_opt_len
+    tcp_hdr = struct.pack('!HHIIBBHHH', src_port, dst_port, 0, 0, 5 << 4, tcp_flags, 65535, 0, 0)
+    ip_hdr = struct.pack('!BBHHHBBH4s4s', 0x40 | (ip_hdr_len // 4), 0, ip_hdr_len + len(tcp_hdr) + payload_len,
+                         0, 0, 64, proto, 0, socket.inet_aton(src_ip), socket.inet_aton(dst_ip))
+    return b'\x00' * 12 + eth_type + ip_hdr + b'\x01' * ip_opt_len + tcp_hdr + b'x' * payload_len
+
+
+def test_flow_key():
+    flow_key = make_flow_key('10.0.0.1', 1234, '10.0.0.2', 80)
+    assert parse_flow_key(flow_key) == ('10.0.0.1', 1234, '10.0.0.2', 80)
+    assert parse_flow_key(reverse_flow_key(flow_key)) == ('10.0.0.2', 80, '10.0.0.1', 1234)
+    assert conn_key_to_flow_key('10.0.0.1:1234-10.0.0.2:80') == flow_key
+
+
+def test_parse_raw_tcp():
+    flow_key = make_flow_key('10.0.0.1', 1234, '10.0.0.2', 80)
+    frame = make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100, tcp_flags=0x11)
+    assert get_raw_flow_key(frame) == flow_key
+    assert parse_raw_tcp(frame) == (flow_key, 120, 0x11)
+    # 带IP选项时按IP头长度定位TCP头
+    frame = make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=10, ip_opt_len=8)
+    assert get_raw_flow_key(frame) == flow_key
+    assert parse_raw_tcp(frame) == (flow_key, 30, 0x18)
+    # 仅抓取了报文头时，长度取IP头中的总长度
+    assert parse_raw_tcp(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=1000)[:54])[1] == 1020
+
+    # 非IPv4、非TCP及被截断的报文
+    assert parse_raw_tcp(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, eth_type=b'\x86\xdd')) is None
+    assert parse_raw_tcp(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, proto=17)) is None
+    assert get_raw_flow_key(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, proto=17)) is None
+    assert parse_raw_tcp(frame[:37]) is None
+    assert parse_raw_tcp(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, ip_opt_len=8)[:50]) is None
+
+
+def test_neg_cache():
+    cache = FlowNegativeCache(maxsize=2, ttl=5)
+    keys = [make_flow_key('10.0.0.1', port, '10.0.0.2', 80) for port in range(3)]
+    for key in keys:
+        cache.add(key, now=0)
+    print(cache.get_stats())
+    assert len(cache) == 2 and cache.evictions == 1
+    assert not cache.contains(keys[0], now=1)
+    assert cache.contains(keys[2], now=1)
+    assert not cache.contains(keys[2], now=10)
+    cache.invalidate(keys[1])
+    assert not cache.contains(keys[1], now=1)
+
+
+def test_neg_cache_threads():
+    # 多个抓包线程查询（删除过期项）的同时，统计线程写入和失效
+    cache = FlowNegativeCache(maxsize=64, ttl=1)
+    keys = [make_flow_key('10.0.0.1', port, '10.0.0.2', 80) for port in range(256)]
+    errors = []
+
+    def _lookup():
+        try:
+            for i in range(20000):
+                cache.contains(keys[i % len(keys)], now=i % 3)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_lookup) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(20000):
+        cache.add(keys[i % len(keys)], now=i % 3)
+        cache.invalidate(keys[(i * 7) % len(keys)])
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 0 and len(cache) <= 64
+    stats = cache.get_stats()
+    assert stats['hits'] + stats['misses'] == 4 * 20000
+
+
+if __name__ == "__main__":
+    test_flow_key()
+    test_parse_raw_tcp()
+    test_neg_cache()
+    test_neg_cache_threads()
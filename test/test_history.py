@@ -0,0 +1,55 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_history
+@Author: thirsd@sina.com
+@Date: 2026/10/19 19:30
+"""
+
+from pypidstat.core import HistoryStore
+
+
+def test_history_rollup():
+    store = HistoryStore(metrics=['%CPU'], max_pids=2, raw_size=30, minute_size=10, hour_size=4)
+    nbytes = store.nbytes
+    # 3小时，每秒一个采样，%CPU为秒数对100取模
+    for ts in range(0, 3 * 3600 + 1):
+        store.add(100, ts, {'%CPU': ts % 100})
+
+    raw = store.query(100, '%CPU', resolution='raw')
+    assert len(raw) == 30 and raw[-1] == (3 * 3600, 3 * 3600 % 100)
+
+    minutes = store.query(100, '%CPU', resolution='1m')
+    assert len(minutes) == 10
+    ts, v_min, v_avg, v_max, v_p95 = minutes[-1]
+    assert ts == 3 * 3600 - 60
+    values = [t % 100 for t in range(int(ts), int(ts) + 60)]
+    assert v_min == min(values) and v_max == max(values) and abs(v_avg - sum(values) / 60) < 1e-9
+    assert v_p95 == sorted(values)[56]
+
+    hours = store.query(100, '%CPU', resolution='1h')
+    # 最后一个小时的最后一分钟尚未结束汇总
+    assert [h[0] for h in hours] == [0, 3600]
+    assert hours[0][1] == 0 and hours[0][3] == 99 and abs(hours[0][2] - 49.5) < 1e-9
+
+    assert store.query(100, '%CPU', start=3 * 3600 - 10)[0][0] == 3 * 3600 - 10
+    assert store.query(100, '%CPU', start=3600, end=3600, resolution='1h') == [hours[-1]]
+    # 内存占用固定
+    assert store.nbytes == nbytes
+
+
+def test_history_eviction():
+    store = HistoryStore(metrics=['%CPU', 'rss'], max_pids=2, raw_size=4, minute_size=2, hour_size=2)
+    store.add_rows([{'pid': 1, 'timestamp': 0, '%CPU': 1.0}, {'pid': 2, 'timestamp': 0, '%CPU': 2.0}])
+    store.add_rows([{'pid': 2, 'timestamp': 1, '%CPU': 2.0}, {'pid': 3, 'timestamp': 1, '%CPU': 3.0}])
+    assert sorted(store.pids()) == [2, 3] and store.evictions == 1
+    assert store.query(1, '%CPU') == []
+    assert store.query(3, '%CPU', resolution='raw') == [(1, 3.0)]
+    store.discard(2)
+    assert store.pids() == [3]
+
+
+if __name__ == "__main__":
+    test_history_rollup()
+    test_history_eviction()
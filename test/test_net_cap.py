@@ -0,0 +1,188 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_net_cap
+@Author: thirsd@sina.com
+@Date: 2026/10/21 11:00
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import dpkt
+
+from pypidstat.base.proc_cache import NetNsCache
+from pypidstat.core import ProcSys
+from pypidstat.net import NetCapStat
+from pypidstat.net.flow_cache import make_flow_key
+from pypidstat.net.sampling import PacketSampler
+
+_TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+# 本地127.0.0.1:8080/8081/8082与对端50000~50003的连接，及其socket的inode
+_CONNS = {'A': ('1F90', 'C350', 1001), 'B': ('1F90', 'C351', 1002), 'C': ('1F91', 'C352', 2001),
+          'D': ('1F92', 'C353', 3001)}
+
+
+def _conn_key(name: str) -> str:
+    local_port, remote_port, _ = _CONNS[name]
+    return f"127.0.0.1:{int(local_port, 16)}-127.0.0.1:{int(remote_port, 16)}"
+
+
+def _write_tcp(base_dir: str, names) -> None:
+    with open(os.path.join(base_dir, 'net', 'tcp'), 'w') as f:
+        f.write(_TCP_HEADER)
+        for sl, name in enumerate(names):
+            local_port, remote_port, inode = _CONNS[name]
+            f.write(f"   {sl}: 0100007F:{local_port} 0100007F:{remote_port} 01 00000000:00000000 00:00000000 "
+                    f"00000000     0        0 {inode} 1 0 20 4 30 10 -1\n")
+
+
+def _add_pid(base_dir: str, pid: int, names) -> None:
+    os.makedirs(os.path.join(base_dir, str(pid), 'fd'), exist_ok=True)
+    os.makedirs(os.path.join(base_dir, str(pid), 'ns'), exist_ok=True)
+    if not os.path.lexists(os.path.join(base_dir, str(pid), 'ns', 'net')):
+        os.symlink('net:[100]', os.path.join(base_dir, str(pid), 'ns', 'net'))
+    with open(os.path.join(base_dir, str(pid), 'cmdline'), 'w') as f:
+        f.write(f'server{pid}\0')
+    for fd, name in enumerate(names, start=3):
+        path = os.path.join(base_dir, str(pid), 'fd', str(fd))
+        if not os.path.lexists(path):
+            os.symlink(f'socket:[{_CONNS[name][2]}]', path)
+
+
+def _packet(name: str, tcp_len: int = 100):
+    # 由本地端口发出的报文
+    local_port, remote_port, _ = _CONNS[name]
+    src_port, dst_port = int(local_port, 16), int(remote_port, 16)
+    return (0.0, '127.0.0.1', src_port, '127.0.0.1', dst_port, tcp_len, 0,
+            make_flow_key('127.0.0.1', src_port, '127.0.0.1', dst_port), 1, 0)
+
+
+def _new_stat(base_dir: str) -> NetCapStat:
+    stat = NetCapStat(loop=None, dev=[], resolve_interval=0)
+    stat._sys_proc = ProcSys(base_dir)
+    stat._netns = NetNsCache(stat._sys_proc)
+    return stat
+
+
+def _refresh(stat: NetCapStat) -> None:
+    all_conns_dict = stat._get_conns()
+    stat._watched_pids = list(all_conns_dict.keys())
+    stat._apply_conn_diff(all_conns_dict)
+
+
+def test_incremental_conn_table():
+    with tempfile.TemporaryDirectory() as base_dir:
+        os.makedirs(os.path.join(base_dir, 'self', 'ns'))
+        os.symlink('net:[100]', os.path.join(base_dir, 'self', 'ns', 'net'))
+        os.makedirs(os.path.join(base_dir, 'net'))
+        _write_tcp(base_dir, ['A', 'D'])
+        _add_pid(base_dir, 10, ['A'])
+        stat = _new_stat(base_dir)
+        _refresh(stat)
+        assert stat._addr_pid_map == {_conn_key('A'): 10}
+
+        asyncio.run(stat._handle_packet(_packet('A')))
+        assert stat._traffic_pid_map[10][:2] == [1, 100]
+
+        # 刷新后已有连接的统计保持不变，新连接加入
+        _write_tcp(base_dir, ['A', 'B', 'D'])
+        _add_pid(base_dir, 10, ['A', 'B'])
+        _refresh(stat)
+        asyncio.run(stat._handle_packet(_packet('B', 50)))
+        assert stat._traffic_pid_map[10][:2] == [2, 150]
+        assert stat._addr_pid_map == {_conn_key('A'): 10, _conn_key('B'): 10}
+
+        # 刷新后新启动的进程的连接：观测进程中找不到时重新列出进程
+        _write_tcp(base_dir, ['A', 'B', 'C', 'D'])
+        _add_pid(base_dir, 20, ['C'])
+        asyncio.run(stat._handle_packet(_packet('C', 70)))
+        assert stat._addr_pid_map[_conn_key('C')] == 20
+        assert stat._traffic_pid_map[20][:2] == [1, 70] and 20 in stat._watched_pids
+
+        # 连接存在但不属于观测进程的流加入非观测流的缓存
+        asyncio.run(stat._handle_packet(_packet('D')))
+        assert len(stat._pending_flows) == 0 and _conn_key('D') not in stat._addr_pid_map
+        assert stat._neg_cache.contains(_packet('D')[7], now=1)
+
+        # 连接关闭后从连接表删除
+        _write_tcp(base_dir, ['B', 'C'])
+        _refresh(stat)
+        assert set(stat._addr_pid_map.keys()) == {_conn_key('B'), _conn_key('C')}
+
+
+def test_sampler_per_thread():
+    sampler = PacketSampler(rate=8, method='flow')
+    stat = NetCapStat(loop=None, dev=[], sampler=sampler)
+    try:
+        cap_threads = [stat._new_cap_thread('lo', None) for _ in range(2)]
+    except OSError as e:
+        print(f"pcap is not available: {e}")
+        return
+    # 每个抓包线程（包括第一个）都使用独立的采样器，传入的采样器不在抓包线程中使用
+    samplers = [cap_thread._sampler for cap_thread in cap_threads]
+    assert samplers[0] is not sampler and samplers[1] is not sampler and samplers[0] is not samplers[1]
+    assert all(s.get_config() == sampler.get_config() for s in samplers)
+    for cap_thread in cap_threads:
+        cap_thread.stop()
+
+
+def test_shared_watched_pids():
+    with tempfile.TemporaryDirectory() as base_dir:
+        _add_pid(base_dir, 10, [])
+        _add_pid(base_dir, 20, [])
+        stat = _new_stat(base_dir)
+        assert sorted(stat._get_watched_pids()) == [10, 20]
+        # 主循环设置观测进程后不再扫描/proc，重新扫描时只返回新增的进程
+        stat.set_watched_pids([10])
+        assert stat._get_watched_pids() == [10]
+        assert stat._get_watched_pids(exclude={10}) == [20]
+
+
+class _FilterRecorder:
+    def __init__(self):
+        self.filters = []
+
+    def set_filter(self, filter_exp):
+        self.filters.append(filter_exp)
+
+
+def test_pending_flow_filter():
+    with tempfile.TemporaryDirectory() as base_dir:
+        os.makedirs(os.path.join(base_dir, 'self', 'ns'))
+        os.symlink('net:[100]', os.path.join(base_dir, 'self', 'ns', 'net'))
+        os.makedirs(os.path.join(base_dir, 'net'))
+        _write_tcp(base_dir, ['A'])
+        _add_pid(base_dir, 10, ['A'])
+        stat = NetCapStat(loop=None, dev=[], resolve_interval=0.5, auto_filter=True, filter_debounce=60)
+        stat._sys_proc = ProcSys(base_dir)
+        stat._netns = NetNsCache(stat._sys_proc)
+        recorder = _FilterRecorder()
+        stat._cap_threads['lo'] = recorder
+        _refresh(stat)
+        stat._maybe_update_filter()
+        assert recorder.filters[-1] == 'tcp and (tcp[tcpflags] & tcp-syn != 0 or (host 127.0.0.1 and port 8080))'
+
+        # 定位被限频时，新流的SYN报文使其本地端口立即加入过滤表达式，不等待去抖
+        stat._last_resolve_time = time.monotonic()
+        stat._last_filter_time = 0.0
+        packet = list(_packet('C'))
+        packet[6] = dpkt.tcp.TH_SYN
+        asyncio.run(stat._handle_packet(tuple(packet)))
+        assert _conn_key('C') in stat._pending_flows
+        assert '(host 127.0.0.1 and port 8081)' in recorder.filters[-1]
+
+        # 暂存的流删除后，在去抖间隔之后才从过滤表达式中删除
+        stat._drop_pending(_conn_key('C'))
+        filter_cnt = len(recorder.filters)
+        stat._maybe_update_filter()
+        assert len(recorder.filters) == filter_cnt and stat._filter_dirty
+
+
+if __name__ == "__main__":
+    test_incremental_conn_table()
+    test_sampler_per_thread()
+    test_shared_watched_pids()
+    test_pending_flow_filter()
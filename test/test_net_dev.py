@@ -7,7 +7,7 @@
 @Date: 2024/5/3 11:44
 """
 
-from pypidstat.net import get_dev_interface
+from pypidstat.net import get_dev_interface, get_interfaces, resolve_devs
 
 
 def test_net_dev():
@@ -15,5 +15,15 @@ def test_net_dev():
     pprint(get_dev_interface())
 
 
+def test_interface_registry():
+    from pprint import pprint
+    ifaces = get_interfaces()
+    pprint(ifaces)
+    assert 'lo' in ifaces and ifaces['lo']['loopback']
+    assert 'lo' in resolve_devs('all')
+    assert resolve_devs('lo') == ['lo']
+
+
 if __name__ == "__main__":
     test_net_dev()
+    test_interface_registry()
@@ -0,0 +1,103 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_netns
+@Author: thirsd@sina.com
+@Date: 2026/10/20 16:00
+"""
+import os
+import tempfile
+
+from pypidstat.base.proc_cache import NetNsCache
+from pypidstat.core import ProcSys
+
+_TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+
+def _tcp_line(sl: int, local: str, remote: str, inode: int) -> str:
+    # 状态01为ESTABLISHED
+    return f"   {sl}: {local} {remote} 01 00000000:00000000 00:00000000 00000000     0        0 {inode} 1 0 20 4 30 10 -1\n"
+
+
+class _CountingProcSys(ProcSys):
+    def __init__(self, base_dir):
+        super().__init__(base_dir)
+        self.tcp_reads = []
+
+    def get_proc_net_tcp(self, pid=None):
+        self.tcp_reads.append(pid)
+        return super().get_proc_net_tcp(pid)
+
+
+def _make_proc(base_dir: str) -> None:
+    # 本进程与进程1位于命名空间100，进程2、3位于容器的命名空间200，进程4的命名空间无法读取
+    os.makedirs(os.path.join(base_dir, 'self', 'ns'))
+    os.symlink('net:[100]', os.path.join(base_dir, 'self', 'ns', 'net'))
+    os.makedirs(os.path.join(base_dir, 'net'))
+    with open(os.path.join(base_dir, 'net', 'tcp'), 'w') as f:
+        f.write(_TCP_HEADER + _tcp_line(0, '0100007F:1F90', '0100007F:C350', 1001))
+    for pid, netns in [(1, 100), (2, 200), (3, 200), (4, None)]:
+        os.makedirs(os.path.join(base_dir, str(pid), 'ns'))
+        os.makedirs(os.path.join(base_dir, str(pid), 'net'))
+        if netns is not None:
+            os.symlink(f'net:[{netns}]', os.path.join(base_dir, str(pid), 'ns', 'net'))
+        with open(os.path.join(base_dir, str(pid), 'net', 'tcp'), 'w') as f:
+            if netns == 200:
+                f.write(_TCP_HEADER + _tcp_line(0, '020011AC:1F90', '030011AC:C350', 2001))
+            else:
+                f.write(_TCP_HEADER + _tcp_line(0, '0100007F:1F90', '0100007F:C350', 1001))
+
+
+def test_netns_group():
+    with tempfile.TemporaryDirectory() as base_dir:
+        _make_proc(base_dir)
+        proc_sys = _CountingProcSys(base_dir)
+        assert proc_sys.get_proc_pid_netns(2) == 200
+        cache = NetNsCache(proc_sys)
+        assert cache.own_netns == 100
+        # 与本进程相同或无法读取命名空间的进程使用/proc/net/tcp
+        assert cache.group([1, 2, 3, 4]) == {None: [1, 4], 200: [2, 3]}
+
+        inode_conns = cache.get_tcp_inodes([1, 2, 3, 4])
+        # 每个命名空间只读取一次连接表
+        assert sorted(proc_sys.tcp_reads, key=str) == [2, None]
+        assert inode_conns[2001]['connect_key'] == '172.17.0.2:8080-172.17.0.3:50000'
+        assert inode_conns[2001]['netns'] == 200 and inode_conns[1001]['netns'] == 100
+        assert cache.get_stats() == {'namespaces': 2, 'table_reads': 2}
+
+        # 容器中进程的连接可以通过合并的连接表匹配
+        os.makedirs(os.path.join(base_dir, '3', 'fd'))
+        os.symlink('socket:[2001]', os.path.join(base_dir, '3', 'fd', '5'))
+        conns = proc_sys.get_proc_pid_net_connections(3, inode_conns)
+        assert list(conns.keys()) == ['172.17.0.2:8080-172.17.0.3:50000']
+
+        # 代表进程退出时由同一命名空间的其他进程读取
+        os.remove(os.path.join(base_dir, '2', 'net', 'tcp'))
+        proc_sys.tcp_reads.clear()
+        assert (200, '172.17.0.2:8080-172.17.0.3:50000') in cache.get_tcp_conns([2, 3])
+        assert proc_sys.tcp_reads == [2, 3]
+
+
+def test_netns_conns():
+    with tempfile.TemporaryDirectory() as base_dir:
+        _make_proc(base_dir)
+        # 容器命名空间中存在与主机命名空间相同的四元组
+        with open(os.path.join(base_dir, '2', 'net', 'tcp'), 'a') as f:
+            f.write(_tcp_line(1, '0100007F:1F90', '0100007F:C350', 2002))
+        proc_sys = ProcSys(base_dir)
+        cache = NetNsCache(proc_sys)
+        conns = cache.get_tcp_conns([1, 2])
+        assert conns[(100, '127.0.0.1:8080-127.0.0.1:50000')]['inode'] == 1001
+        assert conns[(200, '127.0.0.1:8080-127.0.0.1:50000')]['inode'] == 2002
+
+        # PID被复用后读取到新进程的命名空间
+        assert cache.get_netns(2) == 200
+        os.remove(os.path.join(base_dir, '2', 'ns', 'net'))
+        os.symlink('net:[300]', os.path.join(base_dir, '2', 'ns', 'net'))
+        assert cache.get_netns(2) == 300
+
+
+if __name__ == "__main__":
+    test_netns_group()
+    test_netns_conns()
@@ -0,0 +1,118 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_perf_event
+@Author: thirsd@sina.com
+@Date: 2026/10/19 23:45
+"""
+import os
+import resource
+import threading
+
+from pypidstat.base.perf_event import PERF_SW_EVENTS, PerfEventCollector, PerfProcessCounters
+from pypidstat.core import ProcessStat
+
+
+def _busy():
+    sum(i * i for i in range(10 ** 6))
+
+
+def test_perf_process_counters():
+    try:
+        collector = PerfEventCollector()
+    except OSError as e:
+        print(f"perf_event_open is not available: {e}")
+        return
+    collector.close()
+    counters = PerfProcessCounters(os.getpid())
+    try:
+        prev = counters.read()
+        assert set(prev.keys()) == set(PERF_SW_EVENTS.keys())
+        _busy()
+        # 新线程在下一次读取时被观测，退出后其计数仍计入进程
+        thread = threading.Thread(target=_busy)
+        counters.read()
+        thread.start()
+        thread.join()
+        curr = counters.read()
+        assert curr['task_clock'] > prev['task_clock']
+        assert curr['minor_faults'] >= prev['minor_faults']
+    finally:
+        counters.close()
+
+
+def test_perf_collector():
+    try:
+        collector = PerfEventCollector(max_pids=1)
+    except OSError as e:
+        print(f"perf_event_open is not available: {e}")
+        return
+    try:
+        pid = os.getpid()
+        collector.attach([pid, 1])
+        # 超出max_pids的进程不观测
+        assert collector.read(1) is None
+        assert collector.get_stats()['pids'] == 1 and collector.skipped == 1
+
+        prev = ProcessStat(pid)
+        prev.init()
+        prev.set_perf_counters(collector.read(pid))
+        _busy()
+        curr = ProcessStat(pid)
+        curr.init()
+        curr.set_perf_counters(collector.read(pid))
+        perf_loads = curr.get_perf_loads(prev, itv=curr.curr_timestamp - prev.curr_timestamp)
+        assert set(perf_loads.keys()) == {'%task_clock', 'ctx_switches/s', 'cpu_migrations/s', 'page_faults/s'}
+        assert perf_loads['%task_clock'] > 0
+
+        # 进程不在列表中时关闭其事件
+        collector.attach([])
+        assert collector.read(pid) is None
+    finally:
+        collector.close()
+
+
+def test_perf_fd_budget():
+    try:
+        collector = PerfEventCollector(max_fds=len(PERF_SW_EVENTS))
+    except OSError as e:
+        print(f"perf_event_open is not available: {e}")
+        return
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        # 多线程进程超出fd预算时不观测，已打开的事件组被关闭
+        before = len(os.listdir('/proc/self/fd'))
+        collector.attach([os.getpid()])
+        assert collector.read(os.getpid()) is None and collector.skipped == 1
+        assert collector.get_stats()['fds'] == 0 and len(os.listdir('/proc/self/fd')) == before
+        try:
+            PerfProcessCounters(os.getpid(), max_groups=1)
+            assert False
+        except OSError:
+            pass
+        assert len(os.listdir('/proc/self/fd')) == before
+
+        # 打开部分事件组后遇到EMFILE时关闭已打开的事件组
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (before + len(PERF_SW_EVENTS) + 2, hard_limit))
+        try:
+            PerfProcessCounters(os.getpid())
+            assert False
+        except OSError:
+            pass
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+        assert len(os.listdir('/proc/self/fd')) == before
+    finally:
+        stop.set()
+        thread.join()
+        collector.close()
+
+
+if __name__ == "__main__":
+    test_perf_process_counters()
+    test_perf_collector()
+    test_perf_fd_budget()
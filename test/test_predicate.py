@@ -0,0 +1,155 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_predicate
+@Author: thirsd@sina.com
+@Date: 2026/10/20 11:00
+"""
+import os
+import time
+
+from pypidstat.core import Predicate, ProcessStat, ProcSys
+
+
+class _CountingProcSys(object):
+    """
+    记录各数据源读取次数的ProcSys
+    """
+
+    def __init__(self, stats):
+        self._stats = stats
+        self.reads = []
+
+    def get_proc_pid_stat(self, pid):
+        self.reads.append(('stat', pid))
+        return self._stats[pid]['stat']
+
+    def get_proc_pid_status(self, pid):
+        self.reads.append(('status', pid))
+        return self._stats[pid]['status']
+
+    def get_proc_pid_io(self, pid):
+        self.reads.append(('io', pid))
+        if self._stats[pid].get('io') is None:
+            raise PermissionError(13, 'Permission denied')
+        return self._stats[pid]['io']
+
+    def get_proc_pid_fd_count(self, pid):
+        self.reads.append(('fd', pid))
+        return self._stats[pid]['fds']
+
+
+_STATS = {
+    1: {'stat': {'pid': 1, 'tcomm': 'postgres', 'state': 'R', 'rss': 2 * 1024 * 1024, 'start_time': 10},
+        'status': {'VmSwap': '0'}, 'io': {'read_bytes': 1 << 30}, 'fds': 100},
+    2: {'stat': {'pid': 2, 'tcomm': 'postgres', 'state': 'S', 'rss': 2 * 1024 * 1024, 'start_time': 10},
+        'status': {'VmSwap': '0'}, 'io': {'read_bytes': 0}, 'fds': 10},
+    3: {'stat': {'pid': 3, 'tcomm': 'nginx', 'state': 'D', 'rss': 1024, 'start_time': 10},
+        'status': {'VmSwap': '2048'}, 'io': None, 'fds': 10},
+}
+
+
+def test_parse_and_evaluate():
+    values = {'state': 'D', 'rss': 3 * 1024 * 1024, '%CPU': 7.5, 'tcomm': 'postgres'}
+    assert Predicate('state in (R,D) and rss>1G and %CPU>5').evaluate(values.get) is True
+    assert Predicate('state not in (R, D) or rss<=1g').evaluate(values.get) is False
+    assert Predicate("not (state='D') or %CPU>=7.5").evaluate(values.get) is True
+    # 缺失的字段为未知，不影响已确定的结果
+    assert Predicate('rss>1G and user=postgres').evaluate(values.get) is None
+    assert Predicate('rss<1G and user=postgres').evaluate(values.get) is False
+    assert Predicate('rss>1G or user=postgres').evaluate(values.get) is True
+    assert Predicate('not user=postgres').evaluate(values.get) is None
+
+    predicate = Predicate('%CPU>5 and user=postgres and state=R and fds>10')
+    assert predicate.stages == ['stat', 'attrs', 'fd', 'row'] and predicate.needs_row
+    for bad in ['', 'rss >', 'unknown=1', 'rss>abc', 'state in (R', 'state=R and', 'comm~"("']:
+        try:
+            Predicate(bad)
+        except Exception:
+            continue
+        assert False, bad
+
+
+def test_staged_filter():
+    proc_sys = _CountingProcSys(_STATS)
+    predicate = Predicate('comm=postgres and state in (R,D) and read_bytes>1M')
+    assert predicate.filter_pids([1, 2, 3], proc_sys) == [1]
+    # 不满足stat阶段的进程不再读取io
+    assert proc_sys.reads == [('stat', 1), ('io', 1), ('stat', 2), ('stat', 3)]
+    stats = predicate.get_stats()
+    assert stats['checked'] == 3 and stats['passed'] == 1 and stats['stat_dropped'] == 2 and stats['io_reads'] == 1
+
+    # 无权限读取io时字段为未知，最终结果为未知的进程不输出
+    proc_sys = _CountingProcSys(_STATS)
+    assert Predicate('state=D and read_bytes>=0').filter_pids([3], proc_sys) == []
+    assert Predicate('state=D or read_bytes>=0').filter_pids([3], proc_sys) == [3]
+
+    # 依赖输出行的字段在采集后判断，读取/proc阶段保留不确定的进程
+    proc_sys = _CountingProcSys(_STATS)
+    predicate = Predicate('swap>1M or %CPU>50')
+    assert predicate.filter_pids([1, 3], proc_sys) == [1, 3]
+    assert predicate.prefilter(3, proc_sys) is True
+
+    # 超过截止时间后不再求值，剩余的进程保留，由accept在采集后判断
+    proc_sys = _CountingProcSys(_STATS)
+    predicate = Predicate('comm=nginx')
+    assert predicate.filter_pids([1, 2, 3], proc_sys, deadline=time.monotonic() - 1) == [1, 2, 3]
+    assert proc_sys.reads == [] and predicate.get_stats()['deferred'] == 3
+
+
+def test_accept_process_stat():
+    pid = os.getpid()
+    prev = ProcessStat(pid)
+    prev.init()
+    sum(i * i for i in range(10 ** 6))
+    curr = ProcessStat(pid)
+    curr.init()
+    row = curr.get_cpu_loads(prev, itv=curr.curr_timestamp - prev.curr_timestamp)
+    assert Predicate(f'pid={pid} and %CPU>0 and fds>0').accept(curr, row)
+    assert not Predicate(f'pid={pid} and %CPU>1000').accept(curr, row)
+    assert Predicate(f'pid={pid}').filter_pids([pid, 1]) == [pid]
+    # 共享内存中的记录仅包含输出行的字段
+    assert Predicate('user=root and rss>1M').accept(row={'user': 'root', 'rss': 2048.0})
+    assert not Predicate('state=R').accept(row={'user': 'root'})
+
+
+class _CountingSys(ProcSys):
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def get_proc_pid_stat(self, pid):
+        self.reads.append('stat')
+        return super().get_proc_pid_stat(pid)
+
+    def get_proc_pid_status(self, pid):
+        self.reads.append('status')
+        return super().get_proc_pid_status(pid)
+
+
+def test_keep_sources():
+    # status先于属性读取
+    assert Predicate('user=root and swap>=0').stages == ['status', 'attrs']
+
+    pid = os.getpid()
+    proc_sys = _CountingSys()
+    predicate = Predicate(f'pid={pid} and swap>=0 and %CPU>=0')
+    assert predicate.filter_pids([pid], proc_sys, keep_sources=True) == [pid]
+    assert proc_sys.reads == ['stat', 'status']
+    sources = predicate.pop_sources(pid)
+    assert set(sources.keys()) == {'stat', 'status'} and predicate.pop_sources(pid) is None
+
+    # 采集时复用过滤进程时读取的stat和status
+    ps_stat = ProcessStat(pid, proc_sys=proc_sys)
+    ps_stat.init(sources=sources)
+    assert proc_sys.reads == ['stat', 'status']
+    assert ps_stat.stat_info is sources['stat'] and 'VmSwap' in ps_stat.status_info
+    assert predicate.match(ps_stat) is None and predicate.accept(ps_stat, {'%CPU': 0.0})
+
+
+if __name__ == "__main__":
+    test_parse_and_evaluate()
+    test_staged_filter()
+    test_accept_process_stat()
+    test_keep_sources()
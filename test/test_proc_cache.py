@@ -0,0 +1,72 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_proc_cache
+@Author: thirsd@sina.com
+@Date: 2026/10/21 10:00
+"""
+import os
+import tempfile
+
+from pypidstat.core import ProcAttrCache, ProcSys
+
+
+class _CountingProcSys(ProcSys):
+    def __init__(self, base_dir):
+        super().__init__(base_dir)
+        self.attr_reads = 0
+        self.oom_reads = 0
+
+    def get_proc_pid_attrs(self, pid):
+        self.attr_reads += 1
+        return super().get_proc_pid_attrs(pid)
+
+    def get_proc_pid_oom_score(self, pid):
+        self.oom_reads += 1
+        return super().get_proc_pid_oom_score(pid)
+
+
+def _make_pid(base_dir: str, pid: int, comm: str) -> None:
+    pid_dir = os.path.join(base_dir, str(pid))
+    os.makedirs(pid_dir, exist_ok=True)
+    for name, content in [('comm', comm), ('cmdline', f'/usr/bin/{comm}\0-d\0'), ('environ', 'HOME=/root\0'),
+                          ('sessionid', '1'), ('oom_score', '10'), ('loginuid', '4294967295')]:
+        with open(os.path.join(pid_dir, name), 'w') as f:
+            f.write(content)
+    if os.path.lexists(os.path.join(pid_dir, 'exe')):
+        os.remove(os.path.join(pid_dir, 'exe'))
+    os.symlink(f'/usr/bin/{comm}', os.path.join(pid_dir, 'exe'))
+
+
+def test_attr_cache():
+    with tempfile.TemporaryDirectory() as base_dir:
+        _make_pid(base_dir, 100, 'nginx')
+        proc_sys = _CountingProcSys(base_dir)
+        cache = ProcAttrCache(proc_sys)
+
+        attrs = cache.get_attrs(100, start_time=500)
+        assert attrs['comm'] == 'nginx' and attrs['cmdline'] == '/usr/bin/nginx -d '
+        assert attrs['exe'] == '/usr/bin/nginx' and attrs['uid'] == '0'
+        # 进程存活期间只读取一次，返回的是副本
+        attrs['comm'] = 'changed'
+        assert cache.get_attrs(100, start_time=500)['comm'] == 'nginx' and proc_sys.attr_reads == 1
+
+        # 易变属性仅在开启时重新读取
+        with open(os.path.join(base_dir, '100', 'oom_score'), 'w') as f:
+            f.write('20')
+        assert cache.get_attrs(100, start_time=500)['oom_score'] == '10'
+        assert cache.get_attrs(100, start_time=500, refresh_volatile=True)['oom_score'] == '20'
+        assert proc_sys.attr_reads == 1
+
+        # PID被复用时start_time不同，重新读取
+        _make_pid(base_dir, 100, 'redis')
+        assert cache.get_attrs(100, start_time=900)['comm'] == 'redis' and proc_sys.attr_reads == 2
+
+        cache.put(200, 300, {'comm': 'exited'})
+        assert cache.get_attrs(200, start_time=300)['comm'] == 'exited'
+        assert cache.evict([100]) == 1 and 200 not in cache and len(cache) == 1
+
+
+if __name__ == "__main__":
+    test_attr_cache()
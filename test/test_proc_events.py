@@ -0,0 +1,87 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_proc_events
+@Author: thirsd@sina.com
+@Date: 2026/10/19 22:30
+"""
+import os
+import subprocess
+import time
+
+from pypidstat.core import ProcEventMonitor, ProcessStat
+
+
+def test_proc_events():
+    try:
+        monitor = ProcEventMonitor()
+    except OSError as e:
+        print(f"proc connector is not available: {e}")
+        return
+    monitor.start()
+    try:
+        assert os.getpid() in monitor.get_pids()
+        # 子进程在两次统计之间启动并退出
+        proc = subprocess.Popen(['sh', '-c', 'exit 7'])
+        pid = proc.pid
+        deadline = time.time() + 5
+        exited = []
+        while time.time() < deadline and not any(record['pid'] == pid for record in exited):
+            time.sleep(0.05)
+            exited += monitor.pop_exited()
+        proc.wait()
+        record = [record for record in exited if record['pid'] == pid][0]
+        assert record['exit_code'] == 7 and record['term_signal'] == 0
+        assert pid not in monitor.get_pids()
+        assert monitor.get_stats()['exits'] >= 1
+    finally:
+        monitor.stop()
+        monitor.join(timeout=2)
+
+
+def test_proc_events_regex():
+    try:
+        monitor = ProcEventMonitor(cmd_regex='sleep')
+    except OSError as e:
+        print(f"proc connector is not available: {e}")
+        return
+    monitor.start()
+    try:
+        # 按缓存的命令行过滤，不匹配的进程退出时不读取计数器
+        assert os.getpid() in monitor.get_pids() and os.getpid() not in monitor.get_matched_pids()
+        matched = subprocess.Popen(['sleep', '0.3'])
+        skipped = subprocess.Popen(['sh', '-c', 'exit 0'])
+        skipped.wait()
+        deadline = time.time() + 2
+        while time.time() < deadline and matched.pid not in monitor.get_matched_pids():
+            time.sleep(0.02)
+        assert matched.pid in monitor.get_matched_pids()
+        matched.wait()
+        deadline = time.time() + 5
+        exited = []
+        while time.time() < deadline and not any(record['pid'] == matched.pid for record in exited):
+            time.sleep(0.05)
+            exited += monitor.pop_exited()
+        record = [record for record in exited if record['pid'] == matched.pid][0]
+        assert record['stat'] is None or record['stat'].attrs['cmdline'].startswith('sleep')
+        assert not any(record['pid'] == skipped.pid for record in exited)
+        assert monitor.get_stats()['skipped'] >= 1
+    finally:
+        monitor.stop()
+        monitor.join(timeout=2)
+
+
+def test_zero_baseline():
+    stat = ProcessStat(os.getpid())
+    stat.init()
+    baseline = stat.zero_baseline()
+    assert baseline.stat_info['utime'] == 0 and stat.stat_info['utime'] >= 0
+    cpu_loads = stat.get_cpu_loads(baseline, itv=1)
+    assert cpu_loads['%CPU'] >= 0
+
+
+if __name__ == "__main__":
+    test_proc_events()
+    test_proc_events_regex()
+    test_zero_baseline()
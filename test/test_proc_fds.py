@@ -0,0 +1,57 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_proc_fds
+@Author: thirsd@sina.com
+@Date: 2026/10/21 10:30
+"""
+import os
+import socket
+import tempfile
+
+from pypidstat.base.proc_sys import ProcSys, FD_MODE_CLASSIFY, FD_MODE_FULL
+
+
+def test_fd_count():
+    proc_sys = ProcSys()
+    pid = os.getpid()
+    count = proc_sys.get_proc_pid_fd_count(pid)
+    with tempfile.TemporaryFile() as f:
+        assert proc_sys.get_proc_pid_fd_count(pid) == count + 1
+        fds = proc_sys.get_proc_pid_fds(pid, mode=FD_MODE_CLASSIFY)
+        # classify不探测fdinfo
+        assert fds[str(f.fileno())]['type'] == 'regular' and 'ctime' not in fds[str(f.fileno())]
+
+
+def test_fd_diff():
+    proc_sys = ProcSys()
+    pid = os.getpid()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first_path, second_path = os.path.join(tmp_dir, 'first'), os.path.join(tmp_dir, 'second')
+        keep = open(os.path.join(tmp_dir, 'keep'), 'w')
+        fd = os.open(first_path, os.O_CREAT | os.O_WRONLY)
+        prev_fds = proc_sys.get_proc_pid_fds(pid, mode=FD_MODE_FULL)
+        assert prev_fds[str(fd)]['file'] == first_path
+
+        # fd号被关闭后分配给其他文件，不能复用上一周期的链接
+        os.close(fd)
+        assert os.open(second_path, os.O_CREAT | os.O_WRONLY) == fd
+        sock = socket.socket()
+        try:
+            curr_fds = proc_sys.get_proc_pid_fds(pid, mode=FD_MODE_FULL, prev_fds=prev_fds)
+            assert curr_fds[str(fd)]['file'] == second_path
+            # 未变化的fd直接复用
+            assert curr_fds[str(keep.fileno())] is prev_fds[str(keep.fileno())]
+            sock_info = curr_fds[str(sock.fileno())]
+            assert sock_info['type'] == 'socket' and sock_info['inode'] == os.fstat(sock.fileno()).st_ino
+            assert sock_info['inode'] in proc_sys.get_proc_pid_socket_inodes(pid)
+        finally:
+            sock.close()
+            os.close(fd)
+            keep.close()
+
+
+if __name__ == "__main__":
+    test_fd_count()
+    test_fd_diff()
@@ -0,0 +1,119 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_ring
+@Author: thirsd@sina.com
+@Date: 2026/10/21 14:10
+"""
+import socket
+import struct
+import time
+from queue import Queue, Empty
+
+from test_flow_cache import make_tcp_frame
+
+from pypidstat.net.flow_cache import FlowNegativeCache, make_flow_key
+from pypidstat.net.ring import ThreadRingCap, _walk_block, PACKET_OUTGOING, TP_STATUS_VLAN_VALID, _SLL_PKTTYPE_OFFSET
+
+# 报文在块中的对齐，及tpacket3_hdr + sockaddr_ll之后以太网头的偏移
+_PKT_ALIGN = 16
+_PKT_MAC_OFFSET = 80
+
+
+def _make_block(frames, block_size: int = 4096, first_pkt_offset: int = 48) -> bytearray:
+    """
+    构造TPACKET_V3的一个块，frames为[(以太网帧, sll_pkttype[, tp_status, 以太网头长度]), ...]
+    """
+    block = bytearray(block_size)
+    struct.pack_into('=II', block, 12, len(frames), first_pkt_offset)
+    pkt_offset = first_pkt_offset
+    for i, (frame, pkttype, *extra) in enumerate(frames):
+        tp_status, mac_len = extra if len(extra) > 0 else (1, 14)
+        pkt_len = _PKT_MAC_OFFSET + len(frame)
+        next_offset = (pkt_len + _PKT_ALIGN - 1) // _PKT_ALIGN * _PKT_ALIGN if i < len(frames) - 1 else 0
+        struct.pack_into('=IIIIIIHH', block, pkt_offset, next_offset, 100 + i, 500000000, len(frame), len(frame),
+                         tp_status, _PKT_MAC_OFFSET, _PKT_MAC_OFFSET + mac_len)
+        block[pkt_offset + _SLL_PKTTYPE_OFFSET] = pkttype
+        block[pkt_offset + _PKT_MAC_OFFSET:pkt_offset + pkt_len] = frame
+        pkt_offset += next_offset
+    return block
+
+
+def test_walk_block():
+    frames = [(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100, tcp_flags=0x02), 0),
+              (make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100), PACKET_OUTGOING),
+              (make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, proto=17), 0),
+              (make_tcp_frame('10.0.0.3', 5555, '10.0.0.2', 80, payload_len=10, ip_opt_len=4), 0),
+              (make_tcp_frame('10.0.0.4', 6666, '10.0.0.2', 80, payload_len=10), 0)]
+    # 第二个块放在缓冲区中偏移4096的位置
+    ring = memoryview(bytearray(4096) + _make_block(frames))
+    neg_cache = FlowNegativeCache()
+    neg_cache.add(make_flow_key('10.0.0.4', 6666, '10.0.0.2', 80), now=104)
+
+    queue = Queue()
+    _walk_block(ring, 4096, queue, neg_cache=neg_cache, skip_outgoing=True)
+    records = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert [record[:7] for record in records] == [(100.5, '10.0.0.1', 1234, '10.0.0.2', 80, 120, 0x02),
+                                                  (103.5, '10.0.0.3', 5555, '10.0.0.2', 80, 30, 0x18)]
+    assert records[0][7] == make_flow_key('10.0.0.1', 1234, '10.0.0.2', 80) and records[0][8:] == (1, 1)
+
+    # 不丢弃发送方向时两个方向都统计
+    _walk_block(ring, 4096, queue)
+    assert queue.qsize() == 4
+    ring.release()
+
+
+def _make_vlan_frame(src_ip: str, src_port: int, dst_ip: str, dst_port: int, payload_len: int) -> bytes:
+    # 在以太网头之后插入802.1Q标签
+    frame = make_tcp_frame(src_ip, src_port, dst_ip, dst_port, payload_len=payload_len)
+    return frame[:12] + struct.pack('!HH', 0x8100, 100) + frame[12:]
+
+
+def test_walk_block_plain_only():
+    # 依次为：VLAN子接口上的报文、父接口上带标签的同一报文、父接口上标签已被内核剥离的同一报文
+    frames = [(make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100), 0),
+              (_make_vlan_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100), 0, 1, 18),
+              (make_tcp_frame('10.0.0.1', 1234, '10.0.0.2', 80, payload_len=100), 0, 1 | TP_STATUS_VLAN_VALID, 14)]
+    ring = memoryview(_make_block(frames))
+    queue = Queue()
+    _walk_block(ring, 0, queue, plain_only=True)
+    assert [record[:6] for record in [queue.get_nowait() for _ in range(queue.qsize())]] \
+        == [(100.5, '10.0.0.1', 1234, '10.0.0.2', 80, 120)]
+
+    # 仅在一块网卡上抓包时不去重
+    _walk_block(ring, 0, queue)
+    assert queue.qsize() == 3
+    ring.release()
+
+
+def test_stop():
+    try:
+        cap = ThreadRingCap('lo', Queue(), block_size=1 << 16, block_nr=4)
+    except PermissionError as e:
+        print(f"AF_PACKET is not available: {e}")
+        return
+    cap.start()
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    client = socket.create_connection(server.getsockname())
+    try:
+        record = cap._queue.get(timeout=5)
+        assert record[1] == '127.0.0.1'
+    except Empty:
+        pass
+    finally:
+        client.close()
+        server.close()
+    # stop等待线程退出后再关闭映射区，线程退出时不访问已关闭的映射区
+    time.sleep(0.2)
+    cap.stop()
+    assert not cap.is_alive() and cap._ring.closed
+    assert cap._sock.fileno() == -1
+
+
+if __name__ == "__main__":
+    test_walk_block()
+    test_walk_block_plain_only()
+    test_stop()
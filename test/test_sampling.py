@@ -0,0 +1,92 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_sampling
+@Author: thirsd@sina.com
+@Date: 2026/10/19 15:50
+"""
+
+import math
+import random
+
+from pypidstat.core import ProcessStat
+from pypidstat.net.sampling import PacketSampler, merge_sampler_stats
+from pypidstat.net.flow_cache import make_flow_key, reverse_flow_key
+from pypidstat.utils import get_sample_error, get_flow_sample_error
+
+
+def test_count_sampler():
+    sampler = PacketSampler(rate=10, method='count')
+    hits = sum(1 for _ in range(1000) if sampler.accept(None))
+    print(sampler.get_stats())
+    assert hits == 100 and sampler.seen == 1000
+
+
+def test_flow_sampler():
+    sampler = PacketSampler(rate=4, method='flow')
+    flow_keys = [make_flow_key('10.0.0.1', port, '10.0.0.2', 80) for port in range(1000, 2000)]
+    hit_keys = [flow_key for flow_key in flow_keys if sampler.accept(flow_key)]
+    print(len(hit_keys))
+    assert 150 < len(hit_keys) < 350
+    # 同一条连接的两个方向同时被采样
+    assert all(sampler.accept(reverse_flow_key(flow_key)) for flow_key in hit_keys)
+
+
+def test_sample_error():
+    assert get_sample_error(0) is None
+    assert abs(get_sample_error(10000) - 1.96) < 1e-6
+
+
+def test_flow_sample_error():
+    assert get_flow_sample_error([]) is None
+    # 未放大的流（rate为1）没有误差
+    assert get_flow_sample_error([(10, 1000, 10)]) == 0
+    # 流大小相同时近似为z*sqrt((1-1/rate)/被采样的流数)，与报文数无关
+    flows = [(4 * 100, 4 * 100000, 100)] * 25
+    assert abs(get_flow_sample_error(flows) - 1.96 * math.sqrt(0.75 / 25) * 100) < 1e-6
+    assert get_flow_sample_error(flows) > get_sample_error(25 * 100) * 5
+
+    # 按流采样时，估计值落在误差范围内的比例接近95%
+    random.seed(1)
+    flow_bytes = [int(random.paretovariate(1.5) * 1000) for _ in range(2000)]
+    total, covered = sum(flow_bytes), 0
+    for _ in range(400):
+        sampled = [(4, 4 * b, 1) for b in flow_bytes if random.random() < 0.25]
+        estimate = sum(b for _, b, _ in sampled)
+        covered += abs(estimate - total) / estimate * 100 <= get_flow_sample_error(sampled)
+    assert 0.85 < covered / 400 <= 1
+
+
+def test_net_loads_error():
+    prev, curr = ProcessStat(1), ProcessStat(1)
+    # 连接统计为[发送包数, 发送字节数, 接收包数, 接收字节数, 采样包数, 加入序号, 误差上界, 总字节数]
+    prev.set_proc_traffic([0, 0, 0, 0, 0], {'a': [0, 0, 0, 0, 0, 1, 0, 0]}, sampled='flow')
+    curr.set_proc_traffic([400, 40000, 400, 40000, 200], {'a': [200, 20000, 200, 20000, 100, 1, 0, 40000],
+                                                          'b': [200, 20000, 200, 20000, 100, 2, 0, 40000]},
+                          sampled='flow')
+    net_loads = curr.get_net_loads(prev, itv=1)
+    assert net_loads['estimated'] and abs(net_loads['error%'] - 1.96 * math.sqrt(0.75 / 2) * 100) < 1e-6
+    curr._net_sampled = 'count'
+    assert abs(curr.get_net_loads(prev, itv=1)['error%'] - get_sample_error(200)) < 1e-6
+    curr._net_sampled = None
+    assert 'error%' not in curr.get_net_loads(prev, itv=1)
+
+
+def test_merge_sampler_stats():
+    samplers = [PacketSampler(rate=2, method='count'), PacketSampler(rate=4, method='count')]
+    for sampler in samplers:
+        for _ in range(100):
+            sampler.accept(None)
+    stats = merge_sampler_stats([sampler.get_stats() for sampler in samplers])
+    assert stats['seen'] == 200 and stats['sampled'] == 75 and stats['rate'] == 4
+    assert merge_sampler_stats([]) is None
+
+
+if __name__ == "__main__":
+    test_count_sampler()
+    test_flow_sampler()
+    test_sample_error()
+    test_flow_sample_error()
+    test_net_loads_error()
+    test_merge_sampler_stats()
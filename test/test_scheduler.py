@@ -0,0 +1,114 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_scheduler
+@Author: thirsd@sina.com
+@Date: 2026/10/19 20:30
+"""
+from types import SimpleNamespace
+
+import time
+
+from pypidstat.core import AdaptiveScheduler, BudgetScheduler
+from pypidstat.utils import get_clk_tick
+
+
+def _sample(ts: float, cpu_ticks: int = 0, maj_flt: int = 0):
+    return SimpleNamespace(curr_timestamp=ts,
+                           stat_info={'start_time': 1, 'utime': cpu_ticks, 'stime': 0, 'maj_flt': maj_flt},
+                           io_info={'read_bytes': 0, 'write_bytes': 0},
+                           status_info={'voluntary_ctxt_switches': 0, 'nonvoluntary_ctxt_switches': 0})
+
+
+def test_idle_backoff():
+    scheduler = AdaptiveScheduler(interval=1, max_period=4)
+    assert scheduler.due([10], now=0) == [10]
+    periods = []
+    for now in range(0, 5):
+        scheduler.update(10, _sample(now), now)
+        periods.append(scheduler._pids[10].period)
+    # 计数器不变，周期逐次翻倍直到max_period
+    assert periods == [1, 2, 4, 4, 4]
+    assert scheduler.due(None, now=5) == []
+    assert scheduler.due([10], now=8) == [10]
+    # 进程退出后被清理
+    assert scheduler.due([], now=100) == [] and scheduler.get_last_sample(10) is None
+
+
+def test_burst():
+    scheduler = AdaptiveScheduler(interval=1, burst_cpu=80, burst_ticks=2)
+    scheduler.update(20, _sample(0), 0)
+    # 1秒内占用90%的CPU
+    scheduler.update(20, _sample(1, cpu_ticks=int(get_clk_tick() * 0.9)), 1)
+    assert scheduler._pids[20].period == 0.25 and scheduler.get_stats()['burst'] == 1
+    scheduler.update(20, _sample(1.25, cpu_ticks=int(get_clk_tick() * 0.9)), 1.25)
+    scheduler.update(20, _sample(1.5, cpu_ticks=int(get_clk_tick() * 0.9)), 1.5)
+    assert scheduler._pids[20].period == 0.25
+    # 高频采样次数用完后恢复为空闲周期
+    scheduler.update(20, _sample(1.75, cpu_ticks=int(get_clk_tick() * 0.9)), 1.75)
+    assert scheduler._pids[20].period == 2
+    # 缺页中断超过阈值
+    scheduler.update(20, _sample(3.75, cpu_ticks=int(get_clk_tick() * 0.9), maj_flt=1000), 3.75)
+    assert scheduler._pids[20].period == 0.25
+
+
+def test_budget_priority():
+    scheduler = BudgetScheduler(interval=1, budget=10, watched=[5], hot_cpu=80, hot_ticks=1)
+    # 观测的进程优先
+    assert list(scheduler.plan([1, 2, 3, 5], now=0)) == [5, 1, 2, 3]
+    # 进程3在1秒内占用100%的CPU
+    scheduler.record(3, _sample(0), _sample(1, cpu_ticks=get_clk_tick()))
+    # 高负载的进程其次，其余进程中最久未采样的优先
+    assert list(scheduler.plan([1, 2, 3, 5], now=1.5)) == [5, 3, 1, 2]
+    scheduler.record(3, _sample(1, cpu_ticks=get_clk_tick()), _sample(1.5, cpu_ticks=get_clk_tick()))
+    assert list(scheduler.plan([2, 3, 5], now=2)) == [5, 2, 3]
+    assert abs(scheduler.get_max_age(now=5.6) - 4.1) < 1e-6
+    # 超过max_age未采样的进程与高负载进程同一优先级
+    assert list(scheduler.plan([1, 2, 3, 5], now=5.6)) == [5, 1, 2, 3]
+    # 清理的进程视为从未采样
+    scheduler.evict([1, 5])
+    assert list(scheduler.plan([1, 2, 5], now=6)) == [5, 2, 1]
+
+
+def test_budget_exhausted():
+    scheduler = BudgetScheduler(interval=1, budget=0.05)
+    sampled = []
+    for pid in scheduler.plan(range(10), now=0):
+        time.sleep(0.02)
+        sampled.append(pid)
+        scheduler.record(pid, None, _sample(time.time()))
+    # 预算用完后停止，剩余的进程下个周期优先
+    assert sampled == [0, 1, 2]
+    assert next(iter(scheduler.plan(range(10), now=time.time()))) == 3
+    stats = scheduler.get_stats()
+    assert stats['exhausted'] == 1 and stats['skipped'] == 7 and stats['sampled'] == 3 and stats['used_ms'] >= 50
+    assert scheduler.get_stats()['exhausted'] == 0
+    # 至少采集一个进程
+    scheduler = BudgetScheduler(interval=1, budget=1e-9)
+    assert len(list(scheduler.plan([1, 2], now=0))) == 1
+    assert 0 < scheduler.next_wakeup() <= 1
+
+
+def test_budget_tick():
+    scheduler = BudgetScheduler(interval=1, budget=0.05)
+    # start_tick之后的耗时（如过滤进程）同样计入预算
+    deadline = scheduler.start_tick()
+    assert scheduler.order([1, 2, 3], now=0) == [1, 2, 3] and deadline == scheduler.deadline
+    time.sleep(0.06)
+    batches = []
+    assert list(scheduler.plan(range(10), now=0, prefetch=batches.append, batch_size=4)) == [0]
+    # 只预读计划采集的批次
+    assert batches == [[0, 1, 2, 3]]
+    # 未调用start_tick时由plan开始新的周期
+    batches.clear()
+    assert list(scheduler.plan(range(1, 10), now=1, prefetch=batches.append, batch_size=4)) == list(range(1, 10))
+    assert batches == [[1, 2, 3, 4], [5, 6, 7, 8], [9]]
+
+
+if __name__ == "__main__":
+    test_idle_backoff()
+    test_burst()
+    test_budget_priority()
+    test_budget_exhausted()
+    test_budget_tick()
@@ -0,0 +1,38 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_shm
+@Author: thirsd@sina.com
+@Date: 2026/10/19 18:40
+"""
+import os
+
+from pypidstat.core import ShmPublisher, ShmReader
+
+
+def test_shm_publish():
+    name = f"pypidstat_test_{os.getpid()}"
+    publisher = ShmPublisher(name, capacity=2, interval=1)
+    reader = ShmReader(name)
+    try:
+        rows = [{'timestamp': 1.0, 'pid': pid, 'user': 'root', 'comm': 'bash', 'cmdline': '/bin/bash',
+                 '%CPU': 1.5, 'CPU_ID': 3, '%core': 80.0, '%CPU_norm': 0.375, '%cpu_delay': 2.5, '%blkio_delay': 0.0,
+                 '%swapin_delay': None} for pid in range(1, 4)]
+        assert publisher.publish(rows) == 2
+        header, read_rows = reader.read()
+        assert header['count'] == 2 and header['seq'] % 2 == 0
+        assert read_rows[1]['pid'] == 2 and read_rows[1]['comm'] == 'bash' and read_rows[1]['%CPU'] == 1.5
+        assert read_rows[1]['rss'] is None
+        # 主机CPU及taskstats延迟的字段
+        assert read_rows[1]['%core'] == 80.0 and read_rows[1]['%CPU_norm'] == 0.375
+        assert read_rows[1]['%cpu_delay'] == 2.5 and read_rows[1]['%blkio_delay'] == 0.0
+        assert read_rows[1]['%swapin_delay'] is None and read_rows[1]['%freepages_delay'] is None
+        assert reader.wait_next(header['seq'], timeout=0.1) is False
+    finally:
+        reader.close()
+        publisher.close()
+
+
+if __name__ == "__main__":
+    test_shm_publish()
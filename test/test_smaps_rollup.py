@@ -0,0 +1,81 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_smaps_rollup
+@Author: thirsd@sina.com
+@Date: 2026/10/20 09:30
+"""
+import os
+import subprocess
+import tempfile
+
+from pypidstat.core import ProcessStat, ProcSys, SmapsRollupCache
+
+
+def test_smaps_rollup():
+    rollup = ProcSys().get_proc_pid_smaps_rollup(os.getpid())
+    assert rollup['Rss'] > 0 and 0 < rollup['Pss'] <= rollup['Rss']
+    assert rollup['Private_Clean'] + rollup['Private_Dirty'] <= rollup['Rss']
+
+
+def test_smaps_fallback():
+    # 没有smaps_rollup时累加smaps中各映射的值
+    with tempfile.TemporaryDirectory() as base_dir:
+        os.mkdir(os.path.join(base_dir, '1'))
+        with open(os.path.join(base_dir, '1', 'smaps'), 'w') as f:
+            f.write("00400000-00452000 r-xp 00000000 08:02 173521      /usr/bin/dbus-daemon\n"
+                    "Rss:                 100 kB\nPss:                  50 kB\nPrivate_Dirty:         8 kB\n"
+                    "VmFlags: rd ex mr mw me dw\n"
+                    "7fff0000-7fff1000 rw-p 00000000 00:00 0\n"
+                    "Rss:                  20 kB\nPss:                  20 kB\nPrivate_Dirty:        20 kB\n")
+        rollup = ProcSys(base_dir).get_proc_pid_smaps_rollup(1)
+        assert rollup == {'Rss': 120, 'Pss': 70, 'Private_Dirty': 28}
+
+
+def test_smaps_cache():
+    pid = os.getpid()
+    cache = SmapsRollupCache(refresh=10)
+    first = cache.get(pid, 1, now=100)
+    # 刷新周期内返回缓存的结果
+    assert cache.get(pid, 1, now=105) == first and cache.reads == 1 and cache.hits == 1
+    # 超过刷新周期或PID被复用时重新读取
+    assert cache.get(pid, 1, now=110)['timestamp'] == 110
+    assert cache.get(pid, 2, now=111)['timestamp'] == 111 and cache.reads == 3
+    assert cache.evict([]) == 1 and pid not in cache
+
+
+def test_pss_loads():
+    pid = os.getpid()
+    cache = SmapsRollupCache()
+    ps_stat = ProcessStat(pid, smaps_cache=cache)
+    ps_stat.init()
+    pss_loads = ps_stat.get_pss_loads()
+    assert set(pss_loads.keys()) == {'PSS', 'USS', 'SwapPss', 'Pss_Anon', 'Pss_File', 'Pss_Shmem', '%PSS'}
+    assert 0 < pss_loads['USS'] <= pss_loads['PSS']
+    assert 0 < pss_loads['%PSS'] < 100
+    assert pid in cache
+
+
+def test_pss_loads_exited():
+    proc = subprocess.Popen(['sleep', '10'])
+    try:
+        # init时读取smaps_rollup，进程退出后仍可计算
+        ps_stat = ProcessStat(proc.pid, read_smaps=True)
+        ps_stat.init()
+        lazy_stat = ProcessStat(proc.pid)
+        lazy_stat.init()
+    finally:
+        proc.kill()
+        proc.wait()
+    assert ps_stat.get_pss_loads()['PSS'] > 0
+    # 进程退出后才读取时各项为None
+    assert all(value is None for value in lazy_stat.get_pss_loads().values())
+
+
+if __name__ == "__main__":
+    test_smaps_rollup()
+    test_smaps_fallback()
+    test_smaps_cache()
+    test_pss_loads()
+    test_pss_loads_exited()
@@ -0,0 +1,76 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_sock_diag
+@Author: thirsd@sina.com
+@Date: 2026/10/19 17:30
+"""
+import os
+import socket
+import tempfile
+
+from pypidstat.core import ProcSys
+from pypidstat.net.sock_diag import SockDiagClient, SockDiagStat
+
+
+class _FakeClient:
+    # 按inode返回预设的(conn_key, [发送报文段数, 发送字节数, 接收报文段数, 接收字节数])
+    def __init__(self):
+        self.sockets = {}
+
+    def dump_tcp(self, family):
+        return dict(self.sockets) if family == socket.AF_INET else {}
+
+
+def test_dump_tcp():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    client = socket.create_connection(server.getsockname())
+    peer, _ = server.accept()
+    client.sendall(b'x' * 1000)
+    peer.recv(1000)
+
+    sock_diag = SockDiagClient()
+    sockets = sock_diag.dump_tcp(socket.AF_INET)
+    sock_diag.close()
+    conn_key = f"127.0.0.1:{client.getsockname()[1]}-127.0.0.1:{server.getsockname()[1]}"
+    counters = [counters for key, counters in sockets.values() if key == conn_key][0]
+    print(conn_key, counters)
+    # bytes_acked包含SYN占用的一个序号
+    assert counters[1] in (1000, 1001)
+
+    for sock in (client, peer, server):
+        sock.close()
+
+
+def test_baseline_watched_later():
+    with tempfile.TemporaryDirectory() as base_dir:
+        os.makedirs(os.path.join(base_dir, '10', 'fd'))
+        stat = SockDiagStat()
+        stat._client.close()
+        stat._client = _FakeClient()
+        stat._sys_proc = ProcSys(base_dir)
+        stat.set_watched_pids([10])
+        # 首次读取时进程10没有socket，inode 1001为未观测进程的已有连接
+        stat._client.sockets = {1001: ('127.0.0.1:8080-127.0.0.1:50000', [100, 100000, 100, 100000])}
+        stat._poll()
+        assert stat._traffic_pid_map[10] == [0, 0, 0, 0, 0]
+
+        # 已有连接变为观测进程的连接（如通过fd传递），以当前值为基线；新建立的连接从0开始计算
+        os.symlink('socket:[1001]', os.path.join(base_dir, '10', 'fd', '3'))
+        os.symlink('socket:[1002]', os.path.join(base_dir, '10', 'fd', '4'))
+        stat._client.sockets = {1001: ('127.0.0.1:8080-127.0.0.1:50000', [101, 101000, 100, 100000]),
+                                1002: ('127.0.0.1:8081-127.0.0.1:50001', [2, 200, 1, 10])}
+        stat._poll()
+        assert stat._traffic_pid_map[10][:4] == [2, 200, 1, 10]
+
+        stat._client.sockets[1001] = ('127.0.0.1:8080-127.0.0.1:50000', [103, 103000, 100, 100000])
+        stat._poll()
+        assert stat._traffic_pid_map[10][:4] == [4, 2200, 1, 10]
+
+
+if __name__ == "__main__":
+    test_dump_tcp()
+    test_baseline_watched_later()
@@ -0,0 +1,91 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_system_cpu
+@Author: thirsd@sina.com
+@Date: 2026/10/19 23:00
+"""
+import os
+import tempfile
+
+import pypidstat.core.system_stat as system_stat
+from pypidstat.core import ProcessStat, ProcSys, SystemCpuStat, SystemSnapshot
+
+
+def _cpustat(rows):
+    fields = system_stat.CPU_FIELDS
+    return {name: dict(zip(fields, values), cpu_name=name) for name, values in rows.items()}
+
+
+def _check_loads():
+    prev = SystemCpuStat(_cpustat({'cpu': [100, 0, 100, 800, 0, 0, 0, 0, 0, 0],
+                                   'cpu0': [50, 0, 50, 400, 0, 0, 0, 0, 0, 0],
+                                   'cpu1': [50, 0, 50, 400, 0, 0, 0, 0, 0, 0]}))
+    curr = SystemCpuStat(_cpustat({'cpu': [250, 0, 150, 900, 100, 0, 0, 0, 20, 0],
+                                   'cpu0': [150, 0, 100, 400, 0, 0, 0, 0, 20, 0],
+                                   'cpu1': [100, 0, 50, 500, 100, 0, 0, 0, 0, 0]}))
+    loads = curr.get_loads(prev)
+    assert loads['cpu0']['%busy'] == 100.0 and loads['cpu0']['total_jiffies'] == 150
+    # guest已计入user，不参与总时间
+    assert abs(loads['cpu0']['%guest'] - 20 / 150 * 100) < 1e-9
+    assert loads['cpu1']['%busy'] == 20.0 and loads['cpu1']['%io_wait'] == 40.0
+    assert loads['cpu']['%busy'] == 50.0
+
+
+def test_cpu_loads():
+    _check_loads()
+    # 未安装numpy时的逐行计算
+    np = system_stat.np
+    system_stat.np = None
+    try:
+        _check_loads()
+    finally:
+        system_stat.np = np
+
+
+def test_snapshot_cpu_loads():
+    prev = SystemSnapshot.take()
+    curr = SystemSnapshot.take()
+    loads = curr.get_cpu_loads(prev)
+    assert 'cpu' in loads and 'cpu0' in loads
+    assert curr.get_cpu_loads(prev) is loads
+
+
+class _NoHostProcSys(ProcSys):
+    # 使用快照时进程不应再读取主机信息
+    def get_proc_meminfo(self):
+        raise AssertionError("meminfo should come from the snapshot")
+
+    def get_proc_uptime(self):
+        raise AssertionError("uptime should come from the snapshot")
+
+
+def test_snapshot_shared():
+    with tempfile.TemporaryDirectory() as base_dir:
+        with open(os.path.join(base_dir, 'meminfo'), 'w') as f:
+            f.write("MemTotal:        8000000 kB\nMemFree:         1000000 kB\n")
+        with open(os.path.join(base_dir, 'uptime'), 'w') as f:
+            f.write("1000000.50 900000.00\n")
+        with open(os.path.join(base_dir, 'stat'), 'w') as f:
+            f.write("cpu  100 0 100 800 0 0 0 0 0 0\ncpu0 100 0 100 800 0 0 0 0 0 0\nctxt 10\nbtime 1700000000\n"
+                    "processes 20\nprocs_running 1\nprocs_blocked 0\n")
+        snapshot = SystemSnapshot.take(ProcSys(base_dir))
+        assert snapshot.get_whole_memory() == 8000000.0 and snapshot.get_uptime_sec() == 1000000.5
+        assert snapshot.get_cpu_total_jiffies() == 1000 and snapshot.stat['btime'] == 1700000000
+
+        # 同一周期的进程共享快照中的主机内存和运行时间
+        proc_sys = _NoHostProcSys()
+        for _ in range(2):
+            ps_stat = ProcessStat(os.getpid(), snapshot=snapshot, proc_sys=proc_sys)
+            ps_stat.init()
+            assert ps_stat.get_whole_memory() == 8000000.0
+            assert ps_stat.get_cpu_loads()['%CPU'] >= 0
+            # 与SP_VALUE相同的计算顺序，避免浮点舍入的差异
+            assert ps_stat.get_mem_loads(ps_stat)['%MEM'] == float(ps_stat.stat_info['rss']) / 8000000.0 * 100
+
+
+if __name__ == "__main__":
+    test_cpu_loads()
+    test_snapshot_cpu_loads()
+    test_snapshot_shared()
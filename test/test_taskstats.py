@@ -0,0 +1,101 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_taskstats
+@Author: thirsd@sina.com
+@Date: 2026/10/19 21:30
+"""
+import os
+import threading
+
+from pypidstat.base.taskstats import TaskStatsClient, TaskStatsProcSys, create_proc_sys
+from pypidstat.core import ProcessStat
+from pypidstat.utils import get_clk_tick
+
+
+class _CountingTaskStatsProcSys(TaskStatsProcSys):
+    def __init__(self):
+        super().__init__()
+        self.status_reads = 0
+
+    def get_proc_pid_status(self, pid):
+        self.status_reads += 1
+        return super().get_proc_pid_status(pid)
+
+
+def test_taskstats_client():
+    try:
+        client = TaskStatsClient()
+    except OSError as e:
+        print(f"taskstats is not available: {e}")
+        return
+    try:
+        pid = os.getpid()
+        result = client.get_tgids([pid, 1, 2 ** 22 + 1])
+        # 不存在的进程不在结果中
+        assert pid in result and 2 ** 22 + 1 not in result
+        stats = result[pid]
+        # 按线程组查询时ac_pid、ac_comm等基础字段为空
+        assert stats['ac_utime'] + stats['ac_stime'] > 0
+        assert stats['nvcsw'] + stats['nivcsw'] > 0
+    finally:
+        client.close()
+
+
+def test_taskstats_proc_sys():
+    proc_sys = create_proc_sys(taskstats=True)
+    pid = os.getpid()
+    proc_sys.prefetch([pid])
+    prev = ProcessStat(pid, proc_sys=proc_sys)
+    prev.init()
+    sum(i * i for i in range(10 ** 6))
+    curr = ProcessStat(pid, proc_sys=proc_sys)
+    curr.init()
+    delay_loads = curr.get_delay_loads(prev, itv=curr.curr_timestamp - prev.curr_timestamp)
+    assert set(delay_loads.keys()) == {'%cpu_delay', '%blkio_delay', '%swapin_delay', '%freepages_delay'}
+    assert delay_loads['%cpu_delay'] >= 0
+    if isinstance(proc_sys, TaskStatsProcSys):
+        proc_sys.close()
+
+
+def test_taskstats_cpu_ctxt():
+    try:
+        proc_sys = _CountingTaskStatsProcSys()
+    except OSError as e:
+        print(f"taskstats is not available: {e}")
+        return
+    try:
+        pid = os.getpid()
+        # 已退出线程的CPU时间仍计入进程
+        thread = threading.Thread(target=lambda: sum(i * i for i in range(10 ** 6)))
+        thread.start()
+        thread.join()
+        proc_sys.prefetch([pid])
+        stats = proc_sys.get_proc_pid_taskstats(pid)
+        if stats['ac_utime'] + stats['ac_stime'] == 0:
+            print("taskstats does not report cpu times for tgid")
+            return
+
+        # 仅需要上下文切换次数时不读取/proc/pid/status
+        ps_stat = ProcessStat(pid, proc_sys=proc_sys, read_status=False)
+        ps_stat.init()
+        assert proc_sys.status_reads == 0
+        assert ps_stat.status_info == {'voluntary_ctxt_switches': stats['nvcsw'],
+                                       'nonvoluntary_ctxt_switches': stats['nivcsw']}
+        assert ps_stat.stat_info['utime'] == stats['ac_utime'] * get_clk_tick() / 1e6
+        assert abs(ps_stat.stat_info['utime'] + ps_stat.stat_info['stime'] - sum(os.times()[:2]) * get_clk_tick()) < 5
+
+        # 读取完整status时上下文切换次数同样取自taskstats
+        ps_stat = ProcessStat(pid, proc_sys=proc_sys)
+        ps_stat.init()
+        assert proc_sys.status_reads == 1 and 'VmPeak' in ps_stat.status_info
+        assert ps_stat.status_info['voluntary_ctxt_switches'] == stats['nvcsw']
+    finally:
+        proc_sys.close()
+
+
+if __name__ == "__main__":
+    test_taskstats_client()
+    test_taskstats_proc_sys()
+    test_taskstats_cpu_ctxt()
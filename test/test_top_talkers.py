@@ -0,0 +1,83 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_top_talkers
+@Author: thirsd@sina.com
+@Date: 2026/10/19 16:40
+"""
+
+from pypidstat.core import process_stat
+from pypidstat.core.process_stat import ProcessStat
+from pypidstat.net.top_talkers import TopTalkers, CONN_SEND_BYTES, CONN_ERROR
+
+
+def test_top_talkers():
+    talkers = TopTalkers(capacity=3)
+    for i in range(100):
+        talkers.add('heavy', 'send', 1, 1000)
+        talkers.add(f'light_{i}', 'recv', 1, 10)
+    print(talkers.top())
+    assert len(talkers) == 3 and talkers.evictions > 0
+    conn_key, entry = talkers.top(1)[0]
+    assert conn_key == 'heavy' and entry[CONN_SEND_BYTES] == 100000 and entry[CONN_ERROR] == 0
+
+    talkers.discard('heavy')
+    assert 'heavy' not in talkers
+    talkers.add('new', 'send', 1, 10)
+    assert len(talkers) == 3
+
+
+def test_unbounded():
+    talkers = TopTalkers()
+    for i in range(100):
+        talkers.add(f'conn_{i}', 'send', 1, i)
+    assert len(talkers) == 100 and talkers.evictions == 0
+    assert [conn_key for conn_key, _ in talkers.top(2)] == ['conn_99', 'conn_98']
+
+
+def _check_conn_loads():
+    talkers = TopTalkers()
+    for i in range(50):
+        talkers.add(f'conn_{i}', 'send', 1, 100)
+    prev, curr = ProcessStat(1), ProcessStat(1)
+    prev.set_proc_traffic([0, 0, 0, 0, 0], talkers.to_dict())
+    for i in range(50):
+        talkers.add(f'conn_{i}', 'send', 2, i * 10)
+        talkers.add(f'conn_{i}', 'recv', 1, (i % 7) * 100)
+    # 被淘汰后重新加入的连接从0开始计算
+    talkers.discard('conn_0')
+    talkers.add('conn_0', 'recv', 1, 5000)
+    curr.set_proc_traffic([0, 0, 0, 0, 0], talkers.to_dict())
+
+    conn_loads = curr.get_net_conn_loads(prev, itv=2)
+    assert len(conn_loads) == 50 and list(conn_loads.keys())[0] == 'conn_0'
+    assert conn_loads['conn_0'] == {'send_packet_cnt/s': 0.0, 'send_packet_bytes/s': 0.0, 'recv_packet_cnt/s': 0.5,
+                                    'recv_packet_bytes/s': 2500.0, 'error': 0}
+    assert conn_loads['conn_13']['send_packet_bytes/s'] == 65.0 and conn_loads['conn_13']['recv_packet_cnt/s'] == 0.5
+    weights = [load['send_packet_bytes/s'] + load['recv_packet_bytes/s'] for load in conn_loads.values()]
+    assert weights == sorted(weights, reverse=True)
+
+    top_loads = curr.get_net_conn_loads(prev, itv=2, top=5)
+    assert list(top_loads.items()) == list(conn_loads.items())[:5]
+    assert curr.get_net_conn_loads(prev, itv=2, top=0) == {}
+    curr.set_proc_traffic([0, 0, 0, 0, 0], {})
+    assert curr.get_net_conn_loads(prev, itv=2) == {}
+    return conn_loads
+
+
+def test_conn_loads():
+    conn_loads = _check_conn_loads()
+    # 未安装numpy时逐个连接计算，结果一致
+    np = process_stat.np
+    process_stat.np = None
+    try:
+        assert _check_conn_loads() == conn_loads
+    finally:
+        process_stat.np = np
+
+
+if __name__ == "__main__":
+    test_top_talkers()
+    test_unbounded()
+    test_conn_loads()
@@ -0,0 +1,54 @@
+# ！/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+@Project: pypidstat
+@File: test_wait_sampler
+@Author: thirsd@sina.com
+@Date: 2026/10/20 17:30
+"""
+import os
+import threading
+import time
+
+from pypidstat.core import WaitStateSampler
+from pypidstat.core.wait_sampler import syscall_name
+
+
+def test_syscall_name():
+    assert syscall_name('running') == 'running'
+    assert syscall_name('-1') == '-'
+
+
+def test_wait_state_sampler():
+    # 观测本进程，其中一个线程阻塞在Event.wait上
+    event = threading.Event()
+    sleeper = threading.Thread(target=event.wait, daemon=True)
+    sleeper.start()
+    sampler = WaitStateSampler(pids=[os.getpid()], hz=200)
+    sampler.start()
+    try:
+        time.sleep(0.5)
+        histogram = sampler.pop_histogram()
+    finally:
+        sampler.stop()
+        event.set()
+    sampler.join(timeout=1)
+
+    entries = histogram['entries']
+    assert histogram['dropped'] == 0 and len(entries) > 0
+    tid = sleeper.native_id
+    sleeper_entries = [entry for entry in entries if entry['tid'] == tid]
+    # 等待中的线程处于可中断睡眠
+    assert sum(entry['count'] for entry in sleeper_entries if entry['state'] == 'S') > 50
+    assert abs(sum(entry['pct'] for entry in sleeper_entries) - 100.0) < 1e-6
+    assert all(entry['pid'] == os.getpid() for entry in entries)
+
+    summary = WaitStateSampler.summarize(entries, states=('S', 'D'))
+    assert summary[os.getpid()][0]['count'] >= sleeper_entries[0]['count']
+    stats = sampler.get_stats()
+    assert stats['threads'] >= 3 and stats['samples'] > 0 and stats['keys'] == 0
+
+
+if __name__ == "__main__":
+    test_syscall_name()
+    test_wait_state_sampler()